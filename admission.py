@@ -0,0 +1,162 @@
+"""
+SehatMind - Admission control
+Each route belongs to a class (auth, light reads, heavy reads, bulk writes)
+with its own concurrency budget and a bounded FIFO queue. A request that finds
+its class busy waits in the queue up to the class deadline. When the queue is
+full or the deadline passes, the request is shed straight away with a 503 and
+Retry-After, before it takes a database connection. An overloaded class then
+degrades on its own, and logins and light reads keep flowing.
+
+Budgets are per process. Under gunicorn's gthread workers, a queued request
+holds a worker thread while it waits, so the default heavy and bulk budgets
+plus their queues stay below WEB_THREADS. Override a class with e.g.
+ADMISSION_HEAVY_READS="2,4,5000" (concurrent, queued, max queue wait in ms).
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+# Request threads per process the default budgets are sized for
+CAPACITY = int(os.getenv('WEB_THREADS', 8))
+# Histogram buckets (upper bounds, in ms) for queue time
+QUEUE_TIME_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `retry_after` is a hint in seconds"""
+
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__(f"{route_class} overloaded ({reason})")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    """Concurrency budget plus bounded FIFO queue for one class of routes"""
+
+    def __init__(self, name, limit, queue_size, max_wait_ms):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.active = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.max_active = 0
+        self.max_queued = 0
+        self._queue_seconds = 0.0
+        self._max_queue_seconds = 0.0
+        self._queue_times = [0] * (len(QUEUE_TIME_BUCKETS) + 1)
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.max_wait))
+
+    def acquire(self):
+        """Take a slot, queueing up to max_wait; returns seconds spent queued or raises Overloaded"""
+        started = time.perf_counter()
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self._admit(0.0)
+                return 0.0
+            if len(self._waiters) >= self.queue_size:
+                self.shed_queue_full += 1
+                raise Overloaded(self.name, 'queue full', self.retry_after)
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            self.max_queued = max(self.max_queued, len(self._waiters))
+
+        granted = waiter.wait(self.max_wait)
+        with self._lock:
+            if not granted and not waiter.is_set():
+                self._waiters.remove(waiter)
+                self.shed_timeout += 1
+                raise Overloaded(self.name, 'queue timeout', self.retry_after)
+            # release() handed its slot straight to us, active was not decremented
+            queued = time.perf_counter() - started
+            self._admit(queued)
+            return queued
+
+    def _admit(self, queued):
+        self.admitted += 1
+        self.max_active = max(self.max_active, self.active)
+        self._queue_seconds += queued
+        self._max_queue_seconds = max(self._max_queue_seconds, queued)
+        queued_ms = queued * 1000
+        bucket = next((i for i, bound in enumerate(QUEUE_TIME_BUCKETS) if queued_ms <= bound), len(QUEUE_TIME_BUCKETS))
+        self._queue_times[bucket] += 1
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot to the oldest waiter
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+
+    def metrics(self):
+        with self._lock:
+            labels = [f"<={bound}ms" for bound in QUEUE_TIME_BUCKETS] + [f">{QUEUE_TIME_BUCKETS[-1]}ms"]
+            return {
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'active': self.active,
+                'queued': len(self._waiters),
+                'max_active': self.max_active,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'shed_queue_full': self.shed_queue_full,
+                'shed_timeout': self.shed_timeout,
+                'mean_queue_ms': round(self._queue_seconds / self.admitted * 1000, 3) if self.admitted else 0,
+                'max_queue_ms': round(self._max_queue_seconds * 1000, 3),
+                'queue_time_histogram': [{'queue_time': label, 'requests': count}
+                                         for label, count in zip(labels, self._queue_times)],
+            }
+
+
+def _configured(name, limit, queue_size, max_wait_ms):
+    """RouteClass with defaults, overridden by ADMISSION_<NAME>=limit,queue,wait_ms"""
+    override = os.getenv(f"ADMISSION_{name.upper()}")
+    if override:
+        limit, queue_size, max_wait_ms = (int(value) for value in override.split(','))
+    return RouteClass(name, limit, queue_size, max_wait_ms)
+
+
+class AdmissionController:
+    """Maps Flask endpoints to route classes and admits or sheds requests for them"""
+
+    def __init__(self, classes, endpoints, default_class):
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self.endpoints = endpoints
+        self.default_class = default_class
+
+    def class_for(self, endpoint):
+        """Route class for a Flask endpoint; None means not admission controlled"""
+        name = self.endpoints.get(endpoint, self.default_class)
+        return self.classes.get(name) if name else None
+
+    def metrics(self):
+        return {'enabled': ENABLED, 'classes': {name: route_class.metrics() for name, route_class in self.classes.items()}}
+
+
+def default_classes():
+    return [
+        _configured('auth', CAPACITY, CAPACITY * 4, 2000),
+        _configured('light_reads', CAPACITY, CAPACITY * 4, 2000),
+        _configured('heavy_reads', max(1, CAPACITY // 4), max(1, CAPACITY // 4), 5000),
+        # A second table-wide rescore while one runs is pointless, shed it immediately
+        _configured('bulk_writes', 1, 0, 0),
+    ]
@@ -0,0 +1,178 @@
+"""
+SehatMind - Cohort analytics
+Risk distributions and cgpa/attendance/assignment statistics per course,
+semester or teacher, aggregated in PostgreSQL and cached per scope.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Column each cohort dimension groups on (students table alias `s`)
+COHORT_DIMENSIONS = {
+    'course': 's.course',
+    'semester': 's.semester',
+    'teacher': 's.owner_user_id',
+}
+
+# Full refresh interval; bounds staleness from writes made by other worker processes
+CACHE_TTL_SECONDS = int(os.getenv('ANALYTICS_CACHE_TTL', 300))
+
+RISK_LEVELS = ('high', 'medium', 'low', 'safe')
+
+
+def _cohort_sql(group_column, where_sql, grouping='all'):
+    """Build the aggregate query for groups plus overall ('all'), only 'groups' or only 'overall'"""
+    key_sql, overall_sql, group_sql = {
+        'all': (group_column, f"GROUPING({group_column})", f"GROUP BY GROUPING SETS (({group_column}), ())"),
+        'groups': (group_column, "0", f"GROUP BY {group_column}"),
+        'overall': ("NULL", "1", ""),
+    }[grouping]
+    return f"""
+        SELECT {key_sql} AS group_key,
+               {overall_sql} AS is_overall,
+               max(u.username) AS label,
+               count(*) AS students,
+               count(*) FILTER (WHERE s.risk_level = 'high') AS high,
+               count(*) FILTER (WHERE s.risk_level = 'medium') AS medium,
+               count(*) FILTER (WHERE s.risk_level = 'low') AS low,
+               count(*) FILTER (WHERE s.risk_level = 'safe') AS safe,
+               avg(s.cgpa),
+               percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY s.cgpa),
+               avg(s.attendance_percentage),
+               percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY s.attendance_percentage),
+               avg(s.assignment_completion),
+               percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY s.assignment_completion)
+        FROM (
+            SELECT s.*,
+                   CASE WHEN s.assignments_total > 0
+                        THEN s.assignments_submitted * 100.0 / s.assignments_total END AS assignment_completion
+            FROM students s
+            WHERE {where_sql}
+        ) s
+        LEFT JOIN users u ON u.id = s.owner_user_id
+        {group_sql}
+    """
+
+
+def _metric(mean, percentiles):
+    percentiles = percentiles or [None, None, None]
+    return {
+        'mean': round(float(mean), 2) if mean is not None else None,
+        'p25': round(float(percentiles[0]), 2) if percentiles[0] is not None else None,
+        'median': round(float(percentiles[1]), 2) if percentiles[1] is not None else None,
+        'p75': round(float(percentiles[2]), 2) if percentiles[2] is not None else None,
+    }
+
+
+def _row_to_cohort(row, dimension):
+    students = row[3]
+    distribution = dict(zip(RISK_LEVELS, row[4:8]))
+    distribution['unknown'] = students - sum(distribution.values())
+    return {
+        'group': row[0],
+        'label': row[2] if dimension == 'teacher' else row[0],
+        'students': students,
+        'risk_distribution': distribution,
+        'cgpa': _metric(row[8], row[9]),
+        'attendance_percentage': _metric(row[10], row[11]),
+        'assignment_completion': _metric(row[12], row[13]),
+    }
+
+
+def compute_cohorts(cur, dimension, scope_sql='TRUE', scope_params=(), only_groups=None):
+    """Aggregate cohorts for `dimension` in one GROUPING SETS query.
+
+    Returns (groups keyed by group value, overall row). When `only_groups` is
+    given, only those groups are recomputed and the overall row is computed
+    separately over the whole scope.
+    """
+    group_column = COHORT_DIMENSIONS[dimension]
+    params = list(scope_params)
+
+    if only_groups is None:
+        cur.execute(_cohort_sql(group_column, scope_sql), params)
+        rows = cur.fetchall()
+    else:
+        groups = [g for g in only_groups if g is not None]
+        null_group = None in only_groups
+        where_sql = f"({scope_sql}) AND ({group_column} = ANY(%s){' OR ' + group_column + ' IS NULL' if null_group else ''})"
+        cur.execute(_cohort_sql(group_column, where_sql, 'groups'), params + [groups])
+        rows = cur.fetchall()
+        cur.execute(_cohort_sql(group_column, scope_sql, 'overall'), params)
+        rows += cur.fetchall()
+
+    groups = {}
+    overall = None
+    for row in rows:
+        cohort = _row_to_cohort(row, dimension)
+        if row[1]:
+            overall = cohort
+        else:
+            groups[row[0]] = cohort
+    return groups, overall
+
+
+class CohortCache:
+    """Per-scope cache of cohort results with incremental refresh of changed groups"""
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _covers(scope_tenant, scope_owner, tenant_id, owner_user_id):
+        return scope_tenant == tenant_id and (scope_owner is None or scope_owner == owner_user_id)
+
+    def invalidate(self, changes=None):
+        """Mark cohorts touched by `changes` as dirty.
+
+        `changes` is a list of (tenant_id, owner_user_id, course, semester) tuples
+        for the old and new state of each written student; None drops every entry.
+        """
+        with self._lock:
+            if changes is None:
+                self._entries.clear()
+                return
+            for (scope_tenant, scope_owner, dimension), entry in self._entries.items():
+                for tenant_id, owner_user_id, course, semester in changes:
+                    if not self._covers(scope_tenant, scope_owner, tenant_id, owner_user_id):
+                        continue
+                    group = {'course': course, 'semester': semester, 'teacher': owner_user_id}[dimension]
+                    entry['dirty'].add(group)
+
+    def get(self, cur, dimension, scope_tenant, scope_owner, scope_sql, scope_params):
+        """Return (groups, overall, computed_at) for a scope, refreshing only what changed"""
+        key = (scope_tenant, scope_owner, dimension)
+        with self._lock:
+            entry = self._entries.get(key)
+            dirty = set(entry['dirty']) if entry else None
+            if entry:
+                entry['dirty'].clear()
+
+        now = time.time()
+        if entry is None or now - entry['computed_at'] > self.ttl:
+            groups, overall = compute_cohorts(cur, dimension, scope_sql, scope_params)
+            entry = {'groups': groups, 'overall': overall, 'computed_at': now, 'dirty': set()}
+        elif dirty:
+            changed, overall = compute_cohorts(cur, dimension, scope_sql, scope_params, only_groups=dirty)
+            groups = dict(entry['groups'])
+            for group in dirty:
+                groups.pop(group, None)
+            groups.update(changed)
+            entry = {'groups': groups, 'overall': overall, 'computed_at': entry['computed_at'], 'dirty': set()}
+            logger.info("Refreshed %s %s cohorts incrementally", len(dirty), dimension)
+        else:
+            return entry['groups'], entry['overall'], entry['computed_at']
+
+        with self._lock:
+            # Keep dirty marks that arrived while we were querying
+            previous = self._entries.get(key)
+            if previous is not None:
+                entry['dirty'] |= previous['dirty']
+            self._entries[key] = entry
+        return entry['groups'], entry['overall'], entry['computed_at']
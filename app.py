@@ -1,14 +1,41 @@
-from flask import Flask, request, jsonify, session, render_template
+from flask import Flask, request, jsonify, session, send_file, g, has_request_context, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 import psycopg2
 import logging
+import html
+import math
+import io
+import csv
+import itertools
+import json
 import os
+import time
 from dotenv import load_dotenv
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 import numpy as np
-from datetime import datetime
+import joblib
+from datetime import datetime, timedelta
+import risk_history
+import analytics
+import simulation
+import notifications
+import reports
+import assets
+import user_context
+import feature_store
+import compiled_model
+import inference
+import db
+import statements
+import tenancy
+import storage
+import admission
+import dedup
+import profiling
+import archive
+import logs
 
 # Load environment variables
 load_dotenv()
@@ -18,26 +45,127 @@ app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
 # Database configuration
 DB_CONFIG = {
-    'host': 'localhost',
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', 5432)),
     'database': 'sehatmind',
     'user': 'postgres',
     'password': 'Akash9872'
 }
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Institution the built-in admin account manages
+ADMIN_TENANT_ID = int(os.getenv('ADMIN_TENANT_ID', tenancy.DEFAULT_TENANT_ID))
+
+# Set by init_database() once the pg_trgm extension and indexes are in place
+SEARCH_TRIGRAM_ENABLED = False
+SEARCH_MAX_PER_PAGE = 100
+
+# Log records go through a queue to a background writer as JSON lines (see logs.py)
+log_pipeline = logs.configure()
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
+# Pooled connections to the primary and any read replicas listed in DB_REPLICAS
+database = db.Database(DB_CONFIG, db.DB_REPLICAS)
+
+# Read-only GET routes that may be served by a read replica
+READ_REPLICA_ROUTES = set(os.getenv('DB_REPLICA_ROUTES',
+                                    'get_students,get_dashboard_stats,get_teacher_stats,get_teachers,get_users').split(','))
+
+def use_read_replica():
+    """Replica reads are for listed GET routes, unless the user wrote something in the last few seconds"""
+    if not has_request_context() or request.method != 'GET' or request.endpoint not in READ_REPLICA_ROUTES:
+        return False
+    return time.time() - session.get('last_write_at', 0) > db.DB_STICKY_SECONDS
+
+# User, student and stats operations: 'postgres' (the pooled database above) or the embedded 'sqlite' file
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'postgres')
+storage_backend = storage.create_backend(STORAGE_BACKEND, database=database, use_replica=use_read_replica)
+
+def postgres_hook(hook):
+    """`hook` for a storage write when students live in Postgres, where risk history and the alert outbox are kept"""
+    return hook if storage_backend.name == 'postgres' else None
+
+def get_db_connection(read_only=None, statement_timeout_ms=None):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        if read_only is None:
+            read_only = use_read_replica()
+        conn = database.connect(read_only)
+        if statement_timeout_ms is not None:
+            conn.set_statement_timeout(statement_timeout_ms)
         return conn
+    except db.DatabaseUnavailable as e:
+        logger.error("Database connection error: %s", e)
+        if has_request_context():
+            # Answered with a fast 503 by database_unavailable()
+            raise
+        return None
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         return None
 
+# Route classes for admission control; unlisted endpoints are light reads, None is not limited
+ADMISSION_ROUTE_CLASSES = {
+    'index': None,
+    'static_asset': None,
+    'login': 'auth',
+    'logout': 'auth',
+    'register': 'auth',
+    'get_current_user': 'auth',
+    'get_students': 'heavy_reads',
+    'export_students': 'heavy_reads',
+    'search_students': 'heavy_reads',
+    'get_teacher_stats': 'heavy_reads',
+    'get_cohort_analytics': 'heavy_reads',
+    'get_risk_trends': 'heavy_reads',
+    'get_teacher_report': 'heavy_reads',
+    'get_course_report': 'heavy_reads',
+    'simulate_cohort_risk': 'heavy_reads',
+    'predict_risk': 'bulk_writes',
+    'import_students': 'bulk_writes',
+    'find_duplicate_groups': 'heavy_reads',
+    'get_archive_stats': 'heavy_reads',
+}
+admission_controller = admission.AdmissionController(admission.default_classes(), ADMISSION_ROUTE_CLASSES, 'light_reads')
+
+# Hot queries, prepared once per pooled connection instead of parsed and planned on every call
+# Leaves last_updated alone: a rescore is not activity, and archival goes by last_updated
+STUDENT_RESCORE = statements.register('student_rescore', """
+    UPDATE students SET dropout_risk_score = %s, risk_level = %s, model_risk_percentage = %s
+    WHERE tenant_id = %s AND id = %s
+""")
+STUDENT_RECALCULATE = statements.register('student_recalculate', """
+    UPDATE students SET risk_percentage = %s, risk_level = %s WHERE tenant_id = %s AND id = %s
+""")
+TEACHER_STATS = statements.register('teacher_stats', """
+    SELECT 
+        u.id,
+        u.username,
+        u.email,
+        COUNT(s.id) as student_count,
+        COUNT(CASE WHEN s.risk_level = 'high' THEN 1 END) as high_risk_count,
+        COUNT(CASE WHEN s.risk_level = 'medium' THEN 1 END) as medium_risk_count,
+        COUNT(CASE WHEN s.risk_level = 'low' THEN 1 END) as low_risk_count
+    FROM users u
+    LEFT JOIN students s ON s.tenant_id = u.tenant_id AND u.id = s.owner_user_id
+    WHERE u.role = 'teacher' AND u.tenant_id = %s
+    GROUP BY u.id, u.username, u.email
+    ORDER BY student_count DESC
+""")
+
+# Student list scans; these run through server-side cursors, which can't use prepared statements
+STUDENT_LIST_ALL = "SELECT * FROM students WHERE tenant_id = %s"
+STUDENT_LIST_OWNED = "SELECT * FROM students WHERE tenant_id = %s AND owner_user_id = %s"
+STUDENT_LIST_BY_EMAIL = "SELECT * FROM students WHERE tenant_id = %s AND email = %s"
+
+def log_migration_error(column, e):
+    """Log a failed ADD COLUMN; the column already existing is the normal case on every boot after the first"""
+    if isinstance(e, psycopg2.errors.DuplicateColumn):
+        logger.debug("%s already exists", column)
+    else:
+        logger.warning("Error adding %s: %s", column, e)
+
 def init_database():
-    conn = get_db_connection()
+    # Migrations may rewrite whole tables, so they run without a statement timeout
+    conn = get_db_connection(read_only=False, statement_timeout_ms=0)
     if not conn:
         logger.error("Failed to connect to database")
         return False
@@ -97,7 +225,7 @@ def init_database():
         except Exception as e:
             # Column might already exist, rollback and continue
             conn.rollback()
-            logger.info(f"Study_hours column already exists or error adding it: {e}")
+            log_migration_error("study_hours column", e)
         
         # Add risk_percentage column if it doesn't exist (migration)
         try:
@@ -107,7 +235,7 @@ def init_database():
         except Exception as e:
             # Column might already exist, rollback and continue
             conn.rollback()
-            logger.info(f"Risk_percentage column already exists or error adding it: {e}")
+            log_migration_error("risk_percentage column", e)
         
         # Add risk_level column if it doesn't exist (migration)
         try:
@@ -117,7 +245,7 @@ def init_database():
         except Exception as e:
             # Column might already exist, rollback and continue
             conn.rollback()
-            logger.info(f"Risk_level column already exists or error adding it: {e}")
+            log_migration_error("risk_level column", e)
         
         # Add teacher_id column if it doesn't exist (migration)
         try:
@@ -127,7 +255,7 @@ def init_database():
         except Exception as e:
             # Column might already exist, rollback and continue
             conn.rollback()
-            logger.info(f"Teacher_id column already exists or error adding it: {e}")
+            log_migration_error("teacher_id column", e)
         
         # Add teacher_name column if it doesn't exist (migration)
         try:
@@ -137,7 +265,7 @@ def init_database():
         except Exception as e:
             # Column might already exist, rollback and continue
             conn.rollback()
-            logger.info(f"Teacher_name column already exists or error adding it: {e}")
+            log_migration_error("teacher_name column", e)
         
         # Add name column to users table if it doesn't exist (migration)
         try:
@@ -147,8 +275,77 @@ def init_database():
         except Exception as e:
             # Column might already exist, rollback and continue
             conn.rollback()
-            logger.info(f"Name column already exists or error adding it: {e}")
-        
+            log_migration_error("name column", e)
+
+        # Add auth_version column to users table; bumped whenever a user's permissions change (migration)
+        cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS auth_version INTEGER NOT NULL DEFAULT 1")
+        conn.commit()
+
+        # Add model_risk_percentage column for the ML model's score next to the rule-based one (migration)
+        cur.execute("ALTER TABLE students ADD COLUMN IF NOT EXISTS model_risk_percentage FLOAT")
+        conn.commit()
+
+        # Add search_vector column for full-text search if it doesn't exist (migration)
+        # Names and ids use the 'simple' config so they are not stemmed, notes use 'english'
+        try:
+            cur.execute("""
+                ALTER TABLE students ADD COLUMN search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(student_id, '') || ' ' || coalesce(email, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(counselor_notes, '') || ' ' || coalesce(intervention_plan, '')), 'B')
+                ) STORED
+            """)
+            conn.commit()
+            logger.info("Added search_vector column to students table")
+        except Exception as e:
+            conn.rollback()
+            log_migration_error("search_vector column", e)
+
+        # Tenants, tenant_id on users and students, students partitioned by tenant (migration)
+        tenancy.init_tenancy(cur)
+        conn.commit()
+
+        # Indexed blocking keys for duplicate detection, computed for existing students
+        dedup.init_dedup(cur)
+        conn.commit()
+
+        # Cold table for archived students, matching the students columns added above
+        archive.init_archive(cur)
+        conn.commit()
+
+        # Search and ownership indexes
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_students_search ON students USING GIN (search_vector)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_students_owner ON students (owner_user_id)")
+        # Students' own list and profile lookups go by email
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_students_email ON students (email)")
+        # Deleting a user checks the teacher_id foreign key; without this each delete scans every student
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_students_teacher ON students (teacher_id)")
+        # Lets the feature store pick up changed rows incrementally
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_students_last_updated ON students (last_updated)")
+        conn.commit()
+
+        # Trigram indexes for partial matches on name, email and student_id (needs pg_trgm)
+        global SEARCH_TRIGRAM_ENABLED
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_students_name_trgm ON students USING GIN (name gin_trgm_ops)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_students_email_trgm ON students USING GIN (email gin_trgm_ops)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_students_student_id_trgm ON students USING GIN (student_id gin_trgm_ops)")
+            conn.commit()
+            SEARCH_TRIGRAM_ENABLED = True
+        except Exception as e:
+            conn.rollback()
+            SEARCH_TRIGRAM_ENABLED = False
+            logger.warning("pg_trgm not available, partial-match search will not be indexed: %s", e)
+
+        # Risk history snapshot tables
+        risk_history.init_risk_history(cur)
+        conn.commit()
+
+        # Notification outbox
+        notifications.init_notifications(cur)
+        conn.commit()
+
         # Insert admin user
         cur.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
         admin_exists = cur.fetchone()[0]
@@ -200,52 +397,173 @@ def init_database():
         logger.error(f"Database initialization error: {e}")
         return False
 
-# Initialize database
-init_database()
+# Initialize database (skipped in spawned worker processes, which re-import this module as __mp_main__).
+# The sqlite backend creates its own tables, so a satellite campus starts without a Postgres server
+if __name__ != '__mp_main__' and STORAGE_BACKEND == 'postgres':
+    init_database()
+
+# Minified, fingerprinted CSS/JS bundles split out of the single-page UI template
+asset_pipeline = assets.AssetPipeline(os.path.join(app.root_path, 'templates', 'index.html'))
 
 # Machine Learning Model
 class DropoutPredictor:
+    FEATURE_COLUMNS = ['attendance_percentage', 'cgpa', 'assignments_submitted',
+                       'assignments_total', 'exam_attempts', 'family_income',
+                       'mental_health_score', 'semester']
+
     def __init__(self):
         self.model = RandomForestClassifier(n_estimators=100, random_state=42)
         self.is_trained = False
+        # Flattened copy of the forest for low-latency scoring of a few rows at a time
+        self.compiled = None
 
     def train_model(self, data):
         try:
             df = pd.DataFrame(data)
-            X = df[['attendance_percentage', 'cgpa', 'assignments_submitted', 
-                   'assignments_total', 'exam_attempts', 'family_income', 
-                   'mental_health_score', 'semester']].fillna(0)
-            
-            # Create synthetic target variable based on rules
-            y = ((X['attendance_percentage'] < 60) | 
-                 (X['cgpa'] < 5.0) | 
-                 (X['mental_health_score'] < 4.0)).astype(int)
-            
-            self.model.fit(X, y)
+            return self.train_matrix(df[self.FEATURE_COLUMNS].fillna(0).to_numpy(dtype=np.float32))
+        except Exception as e:
+            logger.error("Model training error: %s", e)
+            return False
+
+    @classmethod
+    def synthetic_labels(cls, X):
+        """Synthetic dropout target based on rules, for a matrix whose columns follow FEATURE_COLUMNS"""
+        attendance = X[:, cls.FEATURE_COLUMNS.index('attendance_percentage')]
+        cgpa = X[:, cls.FEATURE_COLUMNS.index('cgpa')]
+        mental_health = X[:, cls.FEATURE_COLUMNS.index('mental_health_score')]
+        return ((attendance < 60) | (cgpa < 5.0) | (mental_health < 4.0)).astype(int)
+
+    def train_matrix(self, X):
+        """Train on a numeric matrix whose columns follow FEATURE_COLUMNS (float32 avoids a copy)"""
+        try:
+            self.model.fit(X, self.synthetic_labels(X))
             self.is_trained = True
+            self.compile(compiled_model.CompiledForest.from_sklearn(self.model), compiled_model.probe_rows(X))
             return True
         except Exception as e:
             logger.error(f"Model training error: {e}")
             return False
     
+    def load_artifact(self, path):
+        """Use a model written by train.py; returns False if there is none or it doesn't fit"""
+        if not os.path.exists(path):
+            return False
+        try:
+            artifact = joblib.load(path)
+            if artifact['feature_columns'] != self.FEATURE_COLUMNS:
+                logger.warning("Ignoring model artifact %s: trained on different features", path)
+                return False
+            self.model = artifact['model']
+            self.is_trained = True
+            
+            # Prefer the trees exported by train.py, re-verified on the rows saved with them
+            trees_path = compiled_model.trees_path(path)
+            if os.path.exists(trees_path):
+                self.compile(*compiled_model.CompiledForest.load(trees_path))
+            else:
+                self.compile(compiled_model.CompiledForest.from_sklearn(self.model), None)
+            logger.info("Loaded %s model trained at %s", artifact['candidate'], artifact['trained_at'])
+            return True
+        except Exception as e:
+            logger.error("Model artifact load error: %s", e)
+            return False
+    
     def predict_dropout_risk(self, data):
         if not self.is_trained:
             self.train_model(data)
         
         try:
             df = pd.DataFrame(data)
-            X = df[['attendance_percentage', 'cgpa', 'assignments_submitted', 
-                   'assignments_total', 'exam_attempts', 'family_income', 
-                   'mental_health_score', 'semester']].fillna(0)
-            
-            probabilities = self.model.predict_proba(X)[:, 1]
-            return probabilities
+            return self.predict_matrix(df[self.FEATURE_COLUMNS].fillna(0).to_numpy(dtype=np.float32))
         except Exception as e:
             logger.error(f"Prediction error: {e}")
             return [0.5] * len(data)
 
+    def compile(self, compiled, probe):
+        """Use `compiled` for small batches if it reproduces the model's probabilities on `probe`"""
+        self.compiled = None
+        if compiled is None:
+            return False
+        if probe is None or probe.size == 0:
+            probe = np.random.default_rng(0).uniform(0, 100, (2000, len(self.FEATURE_COLUMNS))).astype(np.float32)
+        difference = compiled_model.verify(self.model, compiled, probe)
+        if difference > compiled_model.VERIFY_TOLERANCE:
+            logger.warning("Compiled model differs from sklearn by %s, using sklearn only", difference)
+            return False
+        self.compiled = compiled
+        return True
+
+    def predict_matrix(self, X):
+        """Dropout probabilities for a numeric matrix whose columns follow FEATURE_COLUMNS"""
+        if self.compiled is not None and len(X) <= compiled_model.SMALL_BATCH_ROWS:
+            return self.compiled.predict(X)
+        classes = list(self.model.classes_)
+        if 1 not in classes:
+            # Training data only contained one outcome
+            return np.zeros(len(X))
+        return self.model.predict_proba(X)[:, classes.index(1)]
+
 predictor = DropoutPredictor()
 
+# Trained model written by `python train.py`; without it the model is fit from the database on first use
+MODEL_ARTIFACT_PATH = os.getenv('MODEL_ARTIFACT_PATH', os.path.join(app.root_path, 'models', 'dropout_model.joblib'))
+if __name__ != '__mp_main__':
+    predictor.load_artifact(MODEL_ARTIFACT_PATH)
+
+# Coalesces concurrent model scoring calls into micro-batches
+inference_scheduler = inference.InferenceScheduler(predictor)
+
+def model_risk_percentages(X):
+    """Model dropout risk (0-100) for feature rows, or None until a model has been trained"""
+    if not predictor.is_trained:
+        return None
+    return np.round(inference_scheduler.predict_matrix(X) * 100, 2)
+
+def feature_row(values):
+    """Model feature row from a dict of student fields, missing values as 0"""
+    return [float(values.get(column) or 0) for column in DropoutPredictor.FEATURE_COLUMNS]
+
+# Positions of the model features in a `SELECT * FROM students` row
+STUDENT_ROW_FEATURES = {'semester': 6, 'attendance_percentage': 7, 'cgpa': 8, 'assignments_submitted': 9,
+                        'assignments_total': 10, 'exam_attempts': 11, 'family_income': 12, 'mental_health_score': 14}
+
+def student_row_features(student):
+    """feature_row() for a `SELECT * FROM students` row"""
+    return feature_row({column: student[position] for column, position in STUDENT_ROW_FEATURES.items()})
+
+# Memory-mapped float32 snapshot of every student's model features
+student_features = feature_store.FeatureStore(feature_store.FEATURE_STORE_DIR, DropoutPredictor.FEATURE_COLUMNS)
+
+def ensure_predictor_trained(cur):
+    """Train the model from every student in the feature store if it hasn't been trained yet"""
+    if predictor.is_trained:
+        return True
+    student_features.refresh(cur)
+    _, X = student_features.matrix()
+    if len(X) == 0:
+        return False
+    return predictor.train_matrix(X)
+
+def load_scoped_features(cur, scope_sql, scope_params):
+    """(ids, X) from the feature store for students matching `scope_sql` (alias `s`)"""
+    student_features.refresh(cur)
+    if scope_sql == "TRUE":
+        return student_features.matrix()
+    cur.execute(f"SELECT s.id FROM students s WHERE {scope_sql}", list(scope_params))
+    # rows_for() re-syncs under the store's file lock, so rows another worker moved since refresh() are found
+    return student_features.rows_for([row[0] for row in cur.fetchall()])
+
+# Cached cohort analytics, refreshed per changed group
+cohort_cache = analytics.CohortCache()
+
+def on_students_changed(changes=None):
+    """Invalidate derived data after students are written.
+
+    `changes` lists (tenant_id, owner_user_id, course, semester) for the old and
+    new state of each written student; None means the whole table may have changed.
+    """
+    cohort_cache.invalidate(changes)
+
 def calculate_risk_percentage(cgpa, attendance_percentage, assignments_submitted, assignments_total):
     """Calculate risk percentage based on CGPA, attendance, and assignment completion only"""
     
@@ -317,36 +635,230 @@ def get_risk_level_from_percentage(percentage):
     else:
         return 'safe'
 
+# Cached user records backing the per-request user context
+user_cache = user_context.UserCache()
+
+def load_user_from_db(user_id):
+    user = storage_backend.get_user(user_id)
+    if user is None:
+        return None
+    # The cache holds only what the user context needs, not the password
+    return {field: user[field] for field in ('id', 'username', 'email', 'role', 'name', 'auth_version', 'tenant_id')}
+
+def resolve_session_user():
+    """Check the session user against the cached users record and refresh or drop it if it changed"""
+    user = session.get('user')
+    if not user:
+        return {}
+    if 'auth_version' not in session:
+        # Session issued before auth versions existed, ask the user to log in again
+        session.pop('user', None)
+        return {}
+    if session['auth_version'] is None:
+        # Built-in admin account, not stored in the users table
+        return user
+
+    try:
+        record = user_cache.get(user['id'], load_user_from_db)
+    except Exception as e:
+        logger.warning("Could not verify session user %s, using session data: %s", user['id'], e)
+        return user
+
+    if record is None:
+        logger.info("User %s no longer exists, ending session", user['id'], extra={'event': 'session_ended'})
+        session.pop('user', None)
+        session.pop('auth_version', None)
+        return {}
+    if record['auth_version'] != session['auth_version']:
+        logger.info("User %s changed since login, refreshing session", user['id'], extra={'event': 'session_refreshed'})
+        session['user'] = user_context.session_user(record)
+        session['auth_version'] = record['auth_version']
+    return session['user']
+
+def current_user():
+    """The logged-in user for this request (empty dict if anonymous), resolved once per request"""
+    if 'user_context' not in g:
+        g.user_context = resolve_session_user()
+    return g.user_context
+
 # Authentication decorators
 def require_login():
-    if 'user' not in session:
+    if not current_user():
         return jsonify({'error': 'Authentication required'}), 401
     return None
 
 def require_roles(*roles):
     def decorator():
-        if 'user' not in session:
+        user = current_user()
+        if not user:
             return jsonify({'error': 'Authentication required'}), 401
-        if session['user']['role'] not in roles:
+        if user['role'] not in roles:
             return jsonify({'error': 'Insufficient permissions'}), 403
         return None
     return decorator
 
+def current_tenant_id():
+    """Institution of the logged-in user; sessions from before tenancy belong to the default tenant"""
+    return current_user().get('tenant_id') or tenancy.DEFAULT_TENANT_ID
+
+def find_teacher(tenant_id, teacher_id):
+    """(id, username) of a teacher in the tenant, or (None, None) if `teacher_id` isn't one"""
+    try:
+        teacher = storage_backend.get_user(int(teacher_id)) if teacher_id else None
+    except (TypeError, ValueError):
+        teacher = None
+    if not teacher or teacher['role'] != 'teacher' or teacher['tenant_id'] != tenant_id:
+        return None, None
+    return teacher['id'], teacher['username']
+
+def get_student_scope_filter(alias='s'):
+    """Return the SQL condition and params limiting students to what the current user may see"""
+    current_user_id = current_user().get('id')
+    current_role = current_user().get('role')
+    current_email = current_user().get('email')
+    # Every scope starts with the tenant so queries only touch that tenant's partition
+    tenant_sql = f"{alias}.tenant_id = %s"
+    tenant_params = [current_tenant_id()]
+
+    if current_role == 'teacher':
+        return f"{tenant_sql} AND {alias}.owner_user_id = %s", tenant_params + [current_user_id]
+    elif current_role == 'student':
+        return f"{tenant_sql} AND {alias}.email = %s", tenant_params + [current_email]
+
+    # Admin can optionally narrow down to a specific teacher's students
+    teacher_id = request.args.get('teacher_id', type=int)
+    if teacher_id:
+        return f"{tenant_sql} AND {alias}.owner_user_id = %s", tenant_params + [teacher_id]
+    return tenant_sql, tenant_params
+
+@app.before_request
+def validate_teacher_id_arg():
+    """Reject a non-numeric ?teacher_id= (the admin's per-teacher scope) with a 400 instead of a failed query"""
+    if request.args.get('teacher_id') and request.args.get('teacher_id', type=int) is None:
+        return jsonify({'error': 'teacher_id must be an integer'}), 400
+
+def highlight_search_snippet(snippet):
+    """HTML-escape a ts_headline snippet and turn its control-character markers into <mark> tags"""
+    if not snippet:
+        return None
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def parse_history_window():
+    """Read the from/to query parameters (ISO dates), defaulting to the last 90 days"""
+    end = request.args.get('to')
+    start = request.args.get('from')
+    end = datetime.fromisoformat(end) if end else datetime.now()
+    start = datetime.fromisoformat(start) if start else end - timedelta(days=90)
+    return start, end
+
+@app.before_request
+def admit_request():
+    """Take a slot in the route's admission class, or shed the request with a 503"""
+    if not admission.ENABLED:
+        return None
+    route_class = admission_controller.class_for(request.endpoint)
+    if route_class is None:
+        return None
+    try:
+        route_class.acquire()
+    except admission.Overloaded as e:
+        # Sheds are counted in the admission metrics; the log line is a sampled INFO event so it stays cheap under overload
+        logger.info("Shed %s %s: %s", request.method, request.path, e,
+                    extra={'event': 'request_shed', 'route_class': e.route_class})
+        response = jsonify({'error': 'Server is busy, please retry shortly', 'route_class': e.route_class})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    g.admission_class = route_class
+    return None
+
+@app.after_request
+def hold_admission_until_closed(response):
+    """Keep the slot until the response is closed, i.e. after a streamed body has been sent"""
+    route_class = g.pop('admission_class', None)
+    if route_class is not None:
+        response.call_on_close(route_class.release)
+    return response
+
+@app.teardown_request
+def release_admission(exc=None):
+    """Free the slot of a request that failed before it produced a response"""
+    route_class = g.pop('admission_class', None)
+    if route_class is not None:
+        route_class.release()
+
+# On-demand profiling: cProfile for single admin requests, and a sampling profiler over a time window
+request_profiler = profiling.RequestProfiler()
+sampling_profiler = profiling.SamplingProfiler()
+
+@app.before_request
+def start_profiling():
+    """Profile the request if an admin asked for it, and let a running sampler see this thread"""
+    # Picks up a sampling window started through another worker
+    sampling_profiler.sync()
+    if sampling_profiler.running:
+        g.sampled_thread = sampling_profiler.enter(request.endpoint or 'unmatched')
+    if request.headers.get('X-Profile') or request.args.get('profile'):
+        if current_user().get('role') == 'admin':
+            g.profile_run = request_profiler.start(request.endpoint or 'unmatched')
+    return None
+
+@app.after_request
+def finish_profiling(response):
+    """Name the saved profile in X-Profile-Id and stop profiling once the body has been sent"""
+    if 'profile_run' in g:
+        run = g.pop('profile_run')
+        if run is None:
+            response.headers['X-Profile-Id'] = 'busy'
+        else:
+            response.headers['X-Profile-Id'] = run[0]
+            response.call_on_close(lambda: request_profiler.stop(run))
+    ident = g.pop('sampled_thread', None)
+    if ident is not None:
+        response.call_on_close(lambda: sampling_profiler.leave(ident))
+    return response
+
+@app.teardown_request
+def stop_profiling(exc=None):
+    """Stop profiling a request that failed before it produced a response"""
+    run = g.pop('profile_run', None)
+    if run is not None:
+        request_profiler.stop(run)
+    ident = g.pop('sampled_thread', None)
+    if ident is not None:
+        sampling_profiler.leave(ident)
+
+@app.errorhandler(db.DatabaseUnavailable)
+def database_unavailable(e):
+    """Fail fast while the database is unreachable instead of letting requests pile up"""
+    response = jsonify({'error': 'Database temporarily unavailable, please retry shortly'})
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, 503
+
+@app.after_request
+def remember_last_write(response):
+    """Pin the user's reads to the primary for a moment after a successful write"""
+    if (request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400
+            and 'user' in session and request.endpoint not in ('login', 'logout')):
+        session['last_write_at'] = time.time()
+    return response
+
 # Routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_pipeline.serve_shell(request, check_for_changes=app.debug)
+
+@app.route('/assets/<path:name>')
+def static_asset(name):
+    response = asset_pipeline.serve_asset(name, request)
+    if response is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    return response
 
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        cur = conn.cursor()
-        
         # Only allow teacher and student roles for registration
         role = data.get('role', 'student')
         if role not in ['teacher', 'student']:
@@ -357,28 +869,32 @@ def register():
             return jsonify({'error': 'Cannot create admin via registration'}), 403
     
         # Check if user already exists
-        cur.execute("SELECT id FROM users WHERE username = %s", (data['username'],))
-        if cur.fetchone():
+        if storage_backend.find_user(data['username']):
             return jsonify({'error': 'Username already exists'}), 400
-        
-        cur.execute("SELECT id FROM users WHERE email = %s", (data['email'],))
-        if cur.fetchone():
-            return jsonify({'error': 'Email already exists'}), 400
+
+        # Join the institution given by its slug, or the default one (institutions are kept in Postgres)
+        tenant_id = tenancy.DEFAULT_TENANT_ID
+        if data.get('institution'):
+            def read_tenant(conn):
+                cur = conn.cursor()
+                cur.execute("SELECT id FROM tenants WHERE slug = %s", (data['institution'],))
+                return cur.fetchone()
+            tenant = database.run_read(read_tenant)
+            if not tenant:
+                return jsonify({'error': 'Unknown institution'}), 400
+            tenant_id = tenant[0]
     
         # Create new user
-        cur.execute("""
-            INSERT INTO users (username, email, password, role, name)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id
-        """, (data['username'], data['email'], data['password'], data.get('role', 'teacher'), data.get('name', data['username'])))
-        
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        try:
+            user_id = storage_backend.create_user(tenant_id, data['username'], data['email'], data['password'],
+                                                  role=data.get('role', 'teacher'), name=data.get('name', data['username']))
+        except storage.DuplicateError as e:
+            return jsonify({'error': 'Email already exists' if 'email' in str(e) else 'Username already exists'}), 400
         
         return jsonify({'message': 'User created successfully', 'user_id': user_id}), 201
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Registration error: {e}")
         return jsonify({'error': 'Registration failed'}), 500
@@ -386,45 +902,44 @@ def register():
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
-    logger.info(f"Login attempt for username: {data.get('username')}")
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
+    logger.info("Login attempt for %s", data.get('username'), extra={'event': 'login_attempt'})
     
     try:
-        cur = conn.cursor()
-        
         # Check for admin login
         if data['username'] == 'admin' and data['password'] == 'admin123':
-            logger.info("Admin login successful")
+            logger.info("Login successful for %s", 'admin', extra={'event': 'login_success', 'user_id': 1})
             session['user'] = {
                 'id': 1,
                 'username': 'admin',
                 'name': 'Administrator',
                 'email': 'admin@sehatmind.local',
-                'role': 'admin'
+                'role': 'admin',
+                'tenant_id': ADMIN_TENANT_ID
             }
+            session['auth_version'] = None
             return jsonify({'message': 'Login successful', 'user': session['user']})
         
         # Check regular users
-        cur.execute("SELECT * FROM users WHERE username = %s", (data['username'],))
-        user = cur.fetchone()
+        user = storage_backend.find_user(data['username'])
         
-        if user and user[3] == data['password']:  # user[3] is password
-            logger.info(f"User login successful for: {user[1]}")
+        if user and user['password'] == data['password']:
+            logger.info("Login successful for %s", user['username'], extra={'event': 'login_success', 'user_id': user['id']})
             session['user'] = {
-                'id': user[0],
-                'username': user[1],
-                'name': user[5] if len(user) > 5 and user[5] else user[1],  # user[5] is name, fallback to username
-                'email': user[2],
-                'role': user[4]
+                'id': user['id'],
+                'username': user['username'],
+                'name': user['name'] or user['username'],
+                'email': user['email'],
+                'role': user['role'],
+                'tenant_id': user['tenant_id']
             }
+            session['auth_version'] = user['auth_version']
             return jsonify({'message': 'Login successful', 'user': session['user']})
         
-        logger.warning(f"Login failed for username: {data.get('username')}")
+        logger.warning("Login failed for %s", data.get('username'), extra={'event': 'login_failed'})
         return jsonify({'error': 'Invalid credentials'}), 401
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Login error: {e}")
         return jsonify({'error': 'Login failed'}), 500
@@ -436,11 +951,12 @@ def get_current_user():
     if auth_error:
         return auth_error
     
-    return jsonify({'user': session['user']})
+    return jsonify({'user': current_user()})
 
 @app.route('/api/logout', methods=['POST'])
 def logout():
     session.pop('user', None)
+    session.pop('auth_version', None)
     return jsonify({'message': 'Logged out'})
 
 @app.route('/api/dashboard/stats', methods=['GET'])
@@ -449,132 +965,172 @@ def get_dashboard_stats():
     if auth_error:
         return auth_error
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
     try:
-        cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
         
-        if current_role == 'teacher':
-            cur.execute("SELECT COUNT(*) FROM students WHERE owner_user_id = %s", (current_user_id,))
-            total_students = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM students WHERE owner_user_id = %s AND risk_level = 'high'", (current_user_id,))
-            high_risk = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM students WHERE owner_user_id = %s AND risk_level = 'medium'", (current_user_id,))
-            medium_risk = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM students WHERE owner_user_id = %s AND risk_level = 'low'", (current_user_id,))
-            low_risk = cur.fetchone()[0]
-        else:
-            cur.execute("SELECT COUNT(*) FROM students")
-            total_students = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM students WHERE risk_level = 'high'")
-            high_risk = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM students WHERE risk_level = 'medium'")
-            medium_risk = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM students WHERE risk_level = 'low'")
-            low_risk = cur.fetchone()[0]
+        tenant_id = current_tenant_id()
         
-        conn.close()
+        owner_user_id = current_user_id if current_role == 'teacher' else None
+        counts = storage_backend.dashboard_counts(tenant_id, owner_user_id)
         
         return jsonify({
-            'total_students': total_students,
-            'high_risk_students': high_risk,
-            'medium_risk_students': medium_risk,
-            'low_risk_students': low_risk
+            'total_students': counts['total'],
+            'high_risk_students': counts['high'],
+            'medium_risk_students': counts['medium'],
+            'low_risk_students': counts['low']
         })
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Dashboard stats error: {e}")
         return jsonify({'error': 'Failed to fetch stats'}), 500
 
+STUDENT_LIST_FIELDS = ('id', 'student_id', 'name', 'email', 'phone', 'course', 'semester', 'attendance_percentage',
+                       'cgpa', 'assignments_submitted', 'assignments_total', 'exam_attempts', 'family_income',
+                       'study_hours', 'mental_health_score', 'dropout_risk_score', 'counselor_notes',
+                       'intervention_plan', 'teacher_id', 'teacher_name')
+
+def student_list_item(student):
+    """JSON dict for a student (a dict of students columns) as returned by the student list"""
+    # Calculate risk percentage and level from student data
+    risk_percentage = calculate_risk_percentage(
+        student['cgpa'],
+        student['attendance_percentage'],
+        student['assignments_submitted'],
+        student['assignments_total']
+    )
+    
+    item = {field: student[field] for field in STUDENT_LIST_FIELDS}
+    item['risk_percentage'] = risk_percentage
+    item['risk_level'] = get_risk_level_from_percentage(risk_percentage)
+    item['created_at'] = student['created_at'].isoformat() if student['created_at'] else None
+    return item
+
+def stream_scan(conn, sql, params, render_chunk, head='', tail=''):
+    """Stream a table scan chunk by chunk as a response body, closing `conn` when done.
+
+    The first chunk is fetched before returning so query errors still surface
+    as a normal exception instead of a truncated 200 response.
+    """
+    chunks = db.iter_chunks(conn, sql, params)
+    first = next(chunks, None)
+    
+    def generate():
+        try:
+            yield head
+            if first is not None:
+                yield render_chunk(first, True)
+                for chunk in chunks:
+                    yield render_chunk(chunk, False)
+            yield tail
+        finally:
+            chunks.close()
+            conn.close()
+    return stream_with_context(generate())
+
+def stream_rows(rows, render_chunk, head='', tail='', chunk_rows=storage.LIST_CHUNK_ROWS):
+    """Stream an iterator of rows (e.g. a storage backend's iter_students()) as a response body, chunk by chunk.
+
+    Like stream_scan(), the first chunk is read before returning so errors surface as a normal exception.
+    """
+    rows = iter(rows)
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_rows)), [])
+    first = next(chunks, None)
+    
+    def generate():
+        try:
+            yield head
+            if first is not None:
+                yield render_chunk(first, True)
+                for chunk in chunks:
+                    yield render_chunk(chunk, False)
+            yield tail
+        finally:
+            if hasattr(rows, 'close'):
+                rows.close()
+    return stream_with_context(generate())
+
+def include_archived_requested():
+    """Whether the request asked for archived students too (?include_archived=true)"""
+    return request.args.get('include_archived', '').lower() in ('1', 'true')
+
 @app.route('/api/students', methods=['GET'])
 def get_students():
     auth_error = require_login()
     if auth_error:
         return auth_error
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
     try:
-        cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
-        current_email = session.get('user', {}).get('email')
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        current_email = current_user().get('email')
+        tenant_id = current_tenant_id()
         
         # Check if teacher_id is provided in query parameters (for admin viewing specific teacher's students)
-        teacher_id = request.args.get('teacher_id')
+        teacher_id = request.args.get('teacher_id', type=int)
         
         if teacher_id and current_role == 'admin':
             # Admin viewing specific teacher's students
-            cur.execute("SELECT * FROM students WHERE owner_user_id = %s", (teacher_id,))
+            scope = {'owner_user_id': teacher_id}
         elif current_role == 'teacher':
-            cur.execute("SELECT * FROM students WHERE owner_user_id = %s", (current_user_id,))
+            scope = {'owner_user_id': current_user_id}
         elif current_role == 'student':
-            cur.execute("SELECT * FROM students WHERE email = %s", (current_email,))
-        else:  # admin viewing all students
-            cur.execute("SELECT * FROM students")
-        
-        students = cur.fetchall()
-        
-        students_list = []
-        for student in students:
-            # Calculate risk percentage and level from student data
-            risk_percentage = calculate_risk_percentage(
-                student[8],  # cgpa
-                student[7],  # attendance_percentage
-                student[9],  # assignments_submitted
-                student[10]  # assignments_total
-            )
-            
-            risk_level = get_risk_level_from_percentage(risk_percentage)
-            
-            students_list.append({
-                'id': student[0],
-                'student_id': student[1],
-                'name': student[2],
-                'email': student[3],
-                'phone': student[4],
-                'course': student[5],
-                'semester': student[6],
-                'attendance_percentage': student[7],
-                'cgpa': student[8],
-                'assignments_submitted': student[9],
-                'assignments_total': student[10],
-                'exam_attempts': student[11],
-                'family_income': student[12],
-                'study_hours': student[13],
-                'mental_health_score': student[14],
-                'dropout_risk_score': student[15],
-                'risk_percentage': risk_percentage,
-                'risk_level': risk_level,
-                'counselor_notes': student[18],
-                'intervention_plan': student[19],
-                'teacher_id': student[22] if len(student) > 22 else None,
-                'teacher_name': student[23] if len(student) > 23 else None,
-                'created_at': student[21].isoformat() if student[21] and hasattr(student[21], 'isoformat') else str(student[21]) if student[21] else None
-            })
-        
-        conn.close()
-        return jsonify(students_list)
-        
+            scope = {'email': current_email}
+        else:  # admin viewing all of the institution's students
+            scope = {}
+        
+        # Stream the JSON array one chunk of students at a time
+        def render_chunk(students, first):
+            body = ','.join(json.dumps(student_list_item(student), default=str) for student in students)
+            return body if first else ',' + body
+        
+        if not include_archived_requested():
+            return Response(stream_rows(storage_backend.iter_students(tenant_id, **scope), render_chunk, head='[', tail=']'),
+                            mimetype='application/json')
+        
+        # Same scope over the hot table and the archive (both in Postgres); rows gain a trailing `archived` flag
+        scope_sql = ' AND '.join(['tenant_id = %s'] + [f"{column} = %s" for column in scope])
+        scope_params = (tenant_id,) + tuple(scope.values())
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        try:
+            cur = conn.cursor()
+            columns, _ = archive.student_columns(cur)
+            query = (archive.list_sql(cur, scope_sql), scope_params * 2)
+            cur.close()
+        except Exception:
+            conn.close()
+            raise
+        
+        def render_archived_chunk(students, first):
+            items = []
+            for student in students:
+                item = student_list_item(dict(zip(columns, student)))
+                item['archived'] = student[-1]
+                items.append(json.dumps(item, default=str))
+            return ','.join(items) if first else ',' + ','.join(items)
+        
+        return Response(stream_scan(conn, *query, render_archived_chunk, head='[', tail=']'), mimetype='application/json')
+        
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Get students error: {e}")
         return jsonify({'error': 'Failed to fetch students'}), 500
 
-@app.route('/api/students/<int:student_id>', methods=['GET'])
-def get_student(student_id):
-    auth_error = require_login()
+EXPORT_COLUMNS = ['student_id', 'name', 'email', 'phone', 'course', 'semester', 'attendance_percentage', 'cgpa',
+                  'assignments_submitted', 'assignments_total', 'exam_attempts', 'family_income',
+                  'mental_health_score', 'study_hours', 'risk_percentage', 'risk_level', 'model_risk_percentage',
+                  'teacher_name']
+
+@app.route('/api/students/export', methods=['GET'])
+def export_students():
+    """CSV export of every student in the caller's scope, streamed in chunks"""
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
     if auth_error:
         return auth_error
     
@@ -582,68 +1138,236 @@ def get_student(student_id):
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
+    try:
+        scope_sql, scope_params = get_student_scope_filter('s')
+        column_sql = ', '.join(f"s.{column}" for column in EXPORT_COLUMNS)
+        
+        def render_chunk(rows, first):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            return buffer.getvalue()
+        
+        header = ','.join(EXPORT_COLUMNS) + '\r\n'
+        body = stream_scan(conn, f"SELECT {column_sql} FROM students s WHERE {scope_sql} ORDER BY s.student_id",
+                           scope_params, render_chunk, head=header)
+        response = Response(body, mimetype='text/csv')
+        response.headers['Content-Disposition'] = 'attachment; filename=students.csv'
+        return response
+        
+    except Exception as e:
+        conn.close()
+        logger.error("Export students error: %s", e)
+        return jsonify({'error': 'Failed to export students'}), 500
+
+@app.route('/api/students/search', methods=['GET'])
+def search_students():
+    """Ranked full-text and partial-match search over students and counselor notes"""
+    auth_error = require_login()
+    if auth_error:
+        return auth_error
+
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Search query is required'}), 400
+
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(SEARCH_MAX_PER_PAGE, max(1, int(request.args.get('per_page', 20))))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
     try:
         cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
-        current_email = session.get('user', {}).get('email')
+        scope_sql, scope_params = get_student_scope_filter('s')
+
+        # Full-text match always uses the GIN index; partial matches only when trigram indexes exist
+        if SEARCH_TRIGRAM_ENABLED:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            match_sql = "(s.search_vector @@ q.query OR s.name ILIKE %s OR s.email ILIKE %s OR s.student_id ILIKE %s)"
+            match_params = [pattern, pattern, pattern]
+            rank_sql = "ts_rank_cd(s.search_vector, q.query) + greatest(similarity(s.name, %s), similarity(s.email, %s), similarity(s.student_id, %s))"
+            rank_params = [query, query, query]
+        else:
+            match_sql = "(s.search_vector @@ q.query OR s.student_id = %s)"
+            match_params = [query]
+            rank_sql = "ts_rank_cd(s.search_vector, q.query)"
+            rank_params = []
+
+        # Rank and paginate on ids first so ts_headline only runs for the rows on this page
+        cur.execute(f"""
+            WITH q AS (
+                SELECT websearch_to_tsquery('simple', %s) || websearch_to_tsquery('english', %s) AS query
+            ),
+            hits AS (
+                SELECT s.tenant_id, s.id, {rank_sql} AS rank
+                FROM students s, q
+                WHERE {match_sql} AND {scope_sql}
+                ORDER BY rank DESC, s.id
+                LIMIT %s OFFSET %s
+            )
+            SELECT s.id, s.student_id, s.name, s.email, s.course, s.semester,
+                   s.risk_percentage, s.risk_level, hits.rank,
+                   ts_headline('simple', s.name, q.query, 'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', HighlightAll=true'),
+                   ts_headline('english', coalesce(s.counselor_notes, '') || ' ' || coalesce(s.intervention_plan, ''), q.query,
+                               'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxFragments=2, MaxWords=20, MinWords=5')
+            FROM hits
+            JOIN students s ON s.tenant_id = hits.tenant_id AND s.id = hits.id
+            CROSS JOIN q
+            ORDER BY hits.rank DESC, s.id
+        """, [query, query] + rank_params + match_params + scope_params + [per_page + 1, (page - 1) * per_page])
+
+        rows = cur.fetchall()
+        results = []
+        for row in rows[:per_page]:
+            results.append({
+                'id': row[0],
+                'student_id': row[1],
+                'name': row[2],
+                'email': row[3],
+                'course': row[4],
+                'semester': row[5],
+                'risk_percentage': row[6],
+                'risk_level': row[7],
+                'rank': round(float(row[8]), 4),
+                'name_highlight': highlight_search_snippet(row[9]),
+                'notes_highlight': highlight_search_snippet(row[10]) if '\x02' in (row[10] or '') else None
+            })
+
+        return jsonify({
+            'query': query,
+            'page': page,
+            'per_page': per_page,
+            'has_more': len(rows) > per_page,
+            'results': results
+        })
+
+    except Exception as e:
+        logger.error("Search students error: %s", e)
+        return jsonify({'error': 'Failed to search students'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/students/<int:student_id>', methods=['GET'])
+def get_student(student_id):
+    auth_error = require_login()
+    if auth_error:
+        return auth_error
+    
+    try:
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        current_email = current_user().get('email')
+        tenant_id = current_tenant_id()
         
         # Check if user can access this student
         if current_role == 'teacher':
-            cur.execute("SELECT * FROM students WHERE id = %s AND owner_user_id = %s", (student_id, current_user_id))
+            scope = {'owner_user_id': current_user_id}
         elif current_role == 'student':
-            cur.execute("SELECT * FROM students WHERE id = %s AND email = %s", (student_id, current_email))
+            scope = {'email': current_email}
         else:  # admin
-            cur.execute("SELECT * FROM students WHERE id = %s", (student_id,))
+            scope = {}
+        student = storage_backend.get_student(tenant_id, student_id, **scope)
         
-        student = cur.fetchone()
+        archived_student = None
+        if not student and include_archived_requested():
+            archived_student = database.run_read(
+                lambda conn: archive.get_student(conn.cursor(), tenant_id, student_id, **scope), read_only=True)
+            student = archived_student
         
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
         # Calculate risk percentage and level from student data
         risk_percentage = calculate_risk_percentage(
-            student[8],  # cgpa
-            student[7],  # attendance_percentage
-            student[9],  # assignments_submitted
-            student[10]  # assignments_total
+            student['cgpa'],
+            student['attendance_percentage'],
+            student['assignments_submitted'],
+            student['assignments_total']
         )
         
         risk_level = get_risk_level_from_percentage(risk_percentage)
         
-        student_data = {
-            'id': student[0],
-            'student_id': student[1],
-            'name': student[2],
-            'email': student[3],
-            'phone': student[4],
-            'course': student[5],
-            'semester': student[6],
-            'attendance_percentage': student[7],
-            'cgpa': student[8],
-            'assignments_submitted': student[9],
-            'assignments_total': student[10],
-            'exam_attempts': student[11],
-            'family_income': student[12],
-            'study_hours': student[13],
-            'mental_health_score': student[14],
-            'dropout_risk_score': student[15],
-            'risk_percentage': risk_percentage,
-            'risk_level': risk_level,
-            'counselor_notes': student[18],
-            'intervention_plan': student[19],
-            'owner_user_id': student[20],
-            'teacher_id': student[22] if len(student) > 22 else None,
-            'teacher_name': student[23] if len(student) > 23 else None
-        }
+        student_data = {field: student[field] for field in (
+            'id', 'student_id', 'name', 'email', 'phone', 'course', 'semester', 'attendance_percentage', 'cgpa',
+            'assignments_submitted', 'assignments_total', 'exam_attempts', 'family_income', 'study_hours',
+            'mental_health_score', 'dropout_risk_score', 'counselor_notes', 'intervention_plan', 'owner_user_id',
+            'teacher_id', 'teacher_name')}
+        student_data['risk_percentage'] = risk_percentage
+        student_data['risk_level'] = risk_level
+        if archived_student:
+            student_data['archived'] = True
+            student_data['archived_at'] = archived_student['archived_at'].isoformat()
         
-        conn.close()
         return jsonify(student_data)
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Get student error: {e}")
         return jsonify({'error': 'Failed to fetch student'}), 500
 
+@app.route('/api/students/<int:student_id>/risk-history', methods=['GET'])
+def get_student_risk_history(student_id):
+    """Risk snapshots for one student, optionally bucketed into a trend"""
+    auth_error = require_login()
+    if auth_error:
+        return auth_error
+    
+    try:
+        start, end = parse_history_window()
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to date'}), 400
+    bucket = request.args.get('bucket')
+    if bucket and bucket not in risk_history.TREND_BUCKETS:
+        return jsonify({'error': f'bucket must be one of {", ".join(risk_history.TREND_BUCKETS)}'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        scope_sql, scope_params = get_student_scope_filter('s')
+        
+        include_archived = include_archived_requested()
+        
+        # Check if user can access this student
+        cur.execute(f"SELECT s.id FROM students s WHERE s.id = %s AND {scope_sql}", [student_id] + scope_params)
+        if not cur.fetchone():
+            # Archived students keep their history; it is shown only when asked for
+            if current_user().get('role') == 'teacher':
+                scope = {'owner_user_id': current_user().get('id')}
+            elif current_user().get('role') == 'student':
+                scope = {'email': current_user().get('email')}
+            else:  # admin
+                scope = {}
+            if not include_archived or not archive.get_student(cur, current_tenant_id(), student_id, **scope):
+                return jsonify({'error': 'Student not found'}), 404
+        
+        if bucket:
+            history = risk_history.query_trend(cur, start, end, bucket, 's.id = %s', [student_id],
+                                               include_archived=include_archived)
+        else:
+            history = risk_history.query_student_history(cur, student_id, start, end)
+        
+        return jsonify({
+            'student_id': student_id,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'bucket': bucket,
+            'history': history
+        })
+        
+    except Exception as e:
+        logger.error("Get student risk history error: %s", e)
+        return jsonify({'error': 'Failed to fetch risk history'}), 500
+    finally:
+        conn.close()
+
 @app.route('/api/students', methods=['POST'])
 def add_student():
     role_check = require_roles('admin', 'teacher', 'student')
@@ -652,16 +1376,13 @@ def add_student():
         return auth_error
     
     data = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
-        current_username = session.get('user', {}).get('username')
-        current_email = session.get('user', {}).get('email')
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        current_username = current_user().get('username')
+        current_email = current_user().get('email')
+        tenant_id = current_tenant_id()
         
         # Convert form data to proper types with error handling
         try:
@@ -681,27 +1402,32 @@ def add_student():
         else:
             student_email = data.get('email')
             student_name = data.get('name')
-            
-            # Auto-generate student_id as password for admin/teacher created students
+
+        # Refuse likely duplicates (same normalized email, or similar name in the same course) unless confirmed
+        if not data.get('allow_duplicate') and storage_backend.name == 'postgres':
+            candidate = {'name': student_name, 'email': student_email, 'course': data.get('course')}
+            duplicates = database.run_read(lambda conn: dedup.find_duplicates(conn.cursor(), tenant_id, [candidate])[0])
+            if duplicates:
+                return jsonify({
+                    'error': 'This student looks like a duplicate of an existing student',
+                    'duplicates': duplicates
+                }), 409
+
+        student_user_id = None
+        if current_role != 'student':
+            # Auto-generate student_id as password for admin/teacher created students
             student_id = data.get('student_id')
             if student_id:
                 # Create a user account for the student with student_id as password
                 try:
-                    cur.execute("""
-                        INSERT INTO users (username, email, password, role, name)
-                        VALUES (%s, %s, %s, %s, %s)
-                        RETURNING id
-                    """, (student_id, student_email, student_id, 'student', student_name))
-                    
-                    student_user_id = cur.fetchone()[0]
+                    student_user_id = storage_backend.create_user(tenant_id, student_id, student_email, student_id,
+                                                                  role='student', name=student_name)
                     logger.info(f"Created student user account: {student_id}")
-                except Exception as e:
+                except storage.DuplicateError as e:
                     logger.error(f"Error creating student user account: {e}")
                     # Continue with the original flow if user creation fails
                     student_user_id = None
-            else:
-                student_user_id = None
-        
+
         # Calculate dropout risk using converted values
         student_data = {
             'attendance_percentage': attendance_percentage,
@@ -715,81 +1441,160 @@ def add_student():
         risk_percentage = calculate_risk_percentage(cgpa, attendance_percentage, assignments_submitted, assignments_total)
         risk_score = risk_percentage / 100  # Convert to 0-1 scale for compatibility
         risk_level = get_risk_level_from_percentage(risk_percentage)
-        
-        # Get teacher information if provided
-        teacher_id = data.get('teacher_id')
-        teacher_name = None
+        model_risks = model_risk_percentages([feature_row(student_data)])
+        model_risk = float(model_risks[0]) if model_risks is not None else None
         
         # If current user is a teacher, automatically assign them as the teacher
         if current_role == 'teacher':
-            teacher_id = current_user_id
-            teacher_name = current_username
-        elif teacher_id:
-            cur.execute("SELECT username FROM users WHERE id = %s AND role = 'teacher'", (teacher_id,))
-            teacher = cur.fetchone()
-            if teacher:
-                teacher_name = teacher[0]
+            teacher_id, teacher_name = current_user_id, current_username
+        else:
+            teacher_id, teacher_name = find_teacher(tenant_id, data.get('teacher_id'))
         
         # Use student_user_id if created, otherwise use current_user_id
         owner_id = student_user_id if student_user_id else current_user_id
         
-        cur.execute("""
-            INSERT INTO students (student_id, name, email, phone, course, semester,
-                                attendance_percentage, cgpa, assignments_submitted,
-                                assignments_total, dropout_risk_score, risk_percentage, risk_level,
-                                owner_user_id, teacher_id, teacher_name)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (data.get('student_id'), student_name, student_email, data.get('phone'),
-              data.get('course'), semester, attendance_percentage, cgpa,
-              assignments_submitted, assignments_total, risk_score, risk_percentage, risk_level,
-              owner_id, teacher_id, teacher_name))
+        def record_initial_risk(cur, ids):
+            # Initial risk snapshot and alert, committed with the student
+            risk_history.record_snapshots(cur, [(ids[0], risk_percentage, risk_level)], 'single')
+            notifications.enqueue_risk_transitions(cur, [(ids[0], None, risk_level, risk_percentage)])
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        storage_backend.add_student(tenant_id, {
+            'student_id': data.get('student_id'), 'name': student_name, 'email': student_email,
+            'phone': data.get('phone'), 'course': data.get('course'), 'semester': semester,
+            'attendance_percentage': attendance_percentage, 'cgpa': cgpa,
+            'assignments_submitted': assignments_submitted, 'assignments_total': assignments_total,
+            'dropout_risk_score': risk_score, 'risk_percentage': risk_percentage, 'risk_level': risk_level,
+            'model_risk_percentage': model_risk, 'owner_user_id': owner_id, 'teacher_id': teacher_id,
+            'teacher_name': teacher_name,
+        }, hook=postgres_hook(record_initial_risk))
+        
+        on_students_changed([(tenant_id, owner_id, data.get('course'), semester)])
         
         # Return success message with auto-generated password info
         if student_user_id and current_role != 'student':
             return jsonify({
                 'message': f'Student added successfully! Student can login with username: {data.get("student_id")} and password: {data.get("student_id")}',
                 'student_id': data.get('student_id'),
-                'password': data.get('student_id')
+                'password': data.get('student_id'),
+                'model_risk_percentage': model_risk
             }), 201
         else:
-            return jsonify({'message': 'Student added successfully'}), 201
+            return jsonify({'message': 'Student added successfully', 'model_risk_percentage': model_risk}), 201
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Add student error: {e}")
         return jsonify({'error': 'Failed to add student'}), 500
 
-@app.route('/api/students/<int:student_id>', methods=['PUT'])
-def update_student(student_id):
-    role_check = require_roles('admin', 'teacher', 'student')
+@app.route('/api/students/<int:student_id>/simulate', methods=['POST'])
+def simulate_student_risk(student_id):
+    """What-if risk surface for one student over a grid of hypothetical changes"""
+    auth_error = require_login()
+    if auth_error:
+        return auth_error
+    
+    data = request.get_json() or {}
+    mode = data.get('mode', 'delta')
+    if mode not in ('delta', 'absolute'):
+        return jsonify({'error': 'mode must be delta or absolute'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        scope_sql, scope_params = get_student_scope_filter('s')
+        
+        ids, X = load_scoped_features(cur, f"s.id = %s AND {scope_sql}", [student_id] + scope_params)
+        if not len(ids):
+            return jsonify({'error': 'Student not found'}), 404
+        
+        if not ensure_predictor_trained(cur):
+            return jsonify({'error': 'Model could not be trained'}), 500
+        conn.close()
+        
+        result = simulation.simulate_student(X[0], data.get('changes'), inference_scheduler, mode)
+        result['student_id'] = student_id
+        return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Simulate student error: %s", e)
+        return jsonify({'error': 'Failed to run simulation'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/students/simulate', methods=['POST'])
+def simulate_cohort_risk():
+    """What-if simulation across every student in the caller's scope"""
+    role_check = require_roles('admin', 'teacher')
     auth_error = role_check()
     if auth_error:
         return auth_error
     
-    data = request.get_json()
+    data = request.get_json() or {}
+    mode = data.get('mode', 'delta')
+    if mode not in ('delta', 'absolute'):
+        return jsonify({'error': 'mode must be delta or absolute'}), 400
+    
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
         cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
+        scope_sql, scope_params = get_student_scope_filter('s')
+        
+        # Optionally narrow down to a single course
+        if data.get('course'):
+            scope_sql += " AND s.course = %s"
+            scope_params.append(data['course'])
+        
+        ids, X = load_scoped_features(cur, scope_sql, scope_params)
+        if not len(ids):
+            return jsonify({'error': 'No students found'}), 400
+        
+        if not ensure_predictor_trained(cur):
+            return jsonify({'error': 'Model could not be trained'}), 500
+        conn.close()
+        
+        return jsonify(simulation.simulate_cohort(X, data.get('changes'), inference_scheduler, mode))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Simulate cohort error: %s", e)
+        return jsonify({'error': 'Failed to run simulation'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/students/<int:student_id>', methods=['PUT'])
+def update_student(student_id):
+    role_check = require_roles('admin', 'teacher', 'student')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    data = request.get_json()
+    
+    try:
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        tenant_id = current_tenant_id()
         
         # Check if student exists and user has permission to edit
-        cur.execute("SELECT owner_user_id FROM students WHERE id = %s", (student_id,))
-        student = cur.fetchone()
+        student = storage_backend.get_student(tenant_id, student_id)
         
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
         # Check permissions
-        if current_role == 'student' and student[0] != current_user_id:
+        if current_role == 'student' and student['owner_user_id'] != current_user_id:
             return jsonify({'error': 'You can only edit your own profile'}), 403
-        elif current_role == 'teacher' and student[0] != current_user_id:
+        elif current_role == 'teacher' and student['owner_user_id'] != current_user_id:
             return jsonify({'error': 'You can only edit your own students'}), 403
         
         # Convert form data to proper types
@@ -807,35 +1612,40 @@ def update_student(student_id):
         risk_percentage = calculate_risk_percentage(cgpa, attendance_percentage, assignments_submitted, assignments_total)
         risk_score = risk_percentage / 100  # Convert to 0-1 scale for compatibility
         risk_level = get_risk_level_from_percentage(risk_percentage)
+        model_risks = model_risk_percentages([feature_row({
+            'attendance_percentage': attendance_percentage, 'cgpa': cgpa,
+            'assignments_submitted': assignments_submitted, 'assignments_total': assignments_total,
+            'exam_attempts': student['exam_attempts'], 'family_income': student['family_income'],
+            'mental_health_score': student['mental_health_score'], 'semester': semester,
+        })])
+        model_risk = float(model_risks[0]) if model_risks is not None else None
         
         # Get teacher information if provided
-        teacher_id = data.get('teacher_id')
-        teacher_name = None
-        if teacher_id:
-            cur.execute("SELECT username FROM users WHERE id = %s AND role = 'teacher'", (teacher_id,))
-            teacher = cur.fetchone()
-            if teacher:
-                teacher_name = teacher[0]
+        teacher_id, teacher_name = find_teacher(tenant_id, data.get('teacher_id'))
+        
+        def record_rescored_risk(cur, updated):
+            # Rescored risk snapshot and alert, committed with the edit
+            if updated:
+                risk_history.record_snapshots(cur, [(student_id, risk_percentage, risk_level)], 'single')
+                notifications.enqueue_risk_transitions(cur, [(student_id, student['risk_level'], risk_level, risk_percentage)])
         
         # Update student
-        cur.execute("""
-            UPDATE students SET 
-                name = %s, email = %s, phone = %s, course = %s, semester = %s,
-                attendance_percentage = %s, cgpa = %s, assignments_submitted = %s,
-                assignments_total = %s, dropout_risk_score = %s, risk_percentage = %s, risk_level = %s,
-                teacher_id = %s, teacher_name = %s, last_updated = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (data.get('name'), data.get('email'), data.get('phone'), 
-              data.get('course'), semester, attendance_percentage, cgpa,
-              assignments_submitted, assignments_total, risk_score, risk_percentage, risk_level,
-              teacher_id, teacher_name, student_id))
+        if not storage_backend.update_student(tenant_id, student_id, {
+            'name': data.get('name'), 'email': data.get('email'), 'phone': data.get('phone'),
+            'course': data.get('course'), 'semester': semester, 'attendance_percentage': attendance_percentage,
+            'cgpa': cgpa, 'assignments_submitted': assignments_submitted, 'assignments_total': assignments_total,
+            'dropout_risk_score': risk_score, 'risk_percentage': risk_percentage, 'risk_level': risk_level,
+            'model_risk_percentage': model_risk, 'teacher_id': teacher_id, 'teacher_name': teacher_name,
+        }, hook=postgres_hook(record_rescored_risk)):
+            return jsonify({'error': 'Student not found'}), 404
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        on_students_changed([(tenant_id, student['owner_user_id'], student['course'], student['semester']),
+                             (tenant_id, student['owner_user_id'], data.get('course'), semester)])
         
-        return jsonify({'message': 'Student updated successfully'}), 200
+        return jsonify({'message': 'Student updated successfully', 'model_risk_percentage': model_risk}), 200
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Update student error: {e}")
         return jsonify({'error': 'Failed to update student'}), 500
@@ -847,68 +1657,374 @@ def delete_student(student_id):
     if auth_error:
         return auth_error
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
     try:
-        cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        tenant_id = current_tenant_id()
         
         # Check if student exists and user has permission to delete
-        cur.execute("SELECT owner_user_id FROM students WHERE id = %s", (student_id,))
-        student = cur.fetchone()
+        student = storage_backend.get_student(tenant_id, student_id)
         
         if not student:
             return jsonify({'error': 'Student not found'}), 404
         
         # Check permissions
-        if current_role == 'teacher' and student[0] != current_user_id:
+        if current_role == 'teacher' and student['owner_user_id'] != current_user_id:
             return jsonify({'error': 'You can only delete your own students'}), 403
         
         # Delete student
-        cur.execute("DELETE FROM students WHERE id = %s", (student_id,))
+        if not storage_backend.delete_student(tenant_id, student_id):
+            return jsonify({'error': 'Student not found'}), 404
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        student_features.mark_deleted([student_id])
+        on_students_changed([(tenant_id, student['owner_user_id'], student['course'], student['semester'])])
         
         return jsonify({'message': 'Student deleted successfully'}), 200
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Delete student error: {e}")
         return jsonify({'error': 'Failed to delete student'}), 500
 
-@app.route('/api/users', methods=['GET'])
-def get_users():
+IMPORT_REQUIRED_COLUMNS = ('student_id', 'name', 'email', 'course')
+# Row errors and duplicates listed in an import response; the counts cover all of them
+IMPORT_REPORT_LIMIT = 100
+
+@app.route('/api/import-students', methods=['POST'])
+def import_students():
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'No CSV file uploaded'}), 400
+    # skip: leave out rows that look like existing students or earlier rows; insert: import them anyway
+    on_duplicate = request.form.get('on_duplicate', request.args.get('on_duplicate', 'skip'))
+    if on_duplicate not in ('skip', 'insert'):
+        return jsonify({'error': 'on_duplicate must be skip or insert'}), 400
+
+    try:
+        reader = csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'))
+        missing = [column for column in IMPORT_REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            return jsonify({'error': f"CSV is missing columns: {', '.join(missing)}"}), 400
+
+        # Convert rows, collecting the ones that can't be imported
+        rows = []
+        errors = []
+        for line, record in enumerate(reader, start=2):
+            try:
+                if not all((record.get(column) or '').strip() for column in IMPORT_REQUIRED_COLUMNS):
+                    raise ValueError('missing required value')
+                row = {column: record[column].strip() for column in IMPORT_REQUIRED_COLUMNS}
+                row['phone'] = (record.get('phone') or '').strip() or None
+                row['semester'] = int(record.get('semester') or 1)
+                for column in ('attendance_percentage', 'cgpa', 'family_income', 'mental_health_score'):
+                    row[column] = float(record.get(column) or 0)
+                for column in ('assignments_submitted', 'assignments_total', 'exam_attempts'):
+                    row[column] = int(record.get(column) or 0)
+            except (ValueError, TypeError) as e:
+                errors.append({'line': line, 'error': str(e)})
+                continue
+            row['line'] = line
+            rows.append(row)
+    except UnicodeDecodeError:
+        return jsonify({'error': 'CSV file must be UTF-8 encoded'}), 400
+    except csv.Error as e:
+        return jsonify({'error': f'Invalid CSV file: {e}'}), 400
+
+    if not rows:
+        return jsonify({'error': 'No valid rows to import', 'errors': errors[:IMPORT_REPORT_LIMIT]}), 400
+
+    try:
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        current_username = current_user().get('username')
+        tenant_id = current_tenant_id()
+
+        # One indexed lookup for the whole file, matching against existing students and earlier rows
+        duplicates = []
+        if on_duplicate == 'skip' and storage_backend.name == 'postgres':
+            candidates = database.run_read(lambda conn: dedup.find_duplicates(conn.cursor(), tenant_id, rows))
+            kept = []
+            for row, matches in zip(rows, candidates):
+                if matches:
+                    duplicates.append({'line': row['line'], 'student_id': row['student_id'], 'matches': [
+                        dict(match, row=rows[match['row']]['line']) if 'row' in match else match
+                        for match in matches]})
+                else:
+                    kept.append(row)
+            rows = kept
+
+        teacher_id, teacher_name = (current_user_id, current_username) if current_role == 'teacher' else (None, None)
+        model_risks = model_risk_percentages([feature_row(row) for row in rows]) if rows else None
+        students = []
+        for index, row in enumerate(rows):
+            risk_percentage = calculate_risk_percentage(row['cgpa'], row['attendance_percentage'],
+                                                        row['assignments_submitted'], row['assignments_total'])
+            row['risk_percentage'] = risk_percentage
+            row['risk_level'] = get_risk_level_from_percentage(risk_percentage)
+            students.append(dict({field: row[field] for field in storage.STUDENT_FIELDS if field in row},
+                                 dropout_risk_score=risk_percentage / 100,
+                                 model_risk_percentage=float(model_risks[index]) if model_risks is not None else None,
+                                 owner_user_id=current_user_id, teacher_id=teacher_id, teacher_name=teacher_name))
+
+        def record_initial_risk(cur, ids):
+            # Initial risk snapshots and alerts, committed with the students
+            inserted = [(student_id, row) for row, student_id in zip(rows, ids) if student_id is not None]
+            risk_history.record_snapshots(cur, [(student_id, row['risk_percentage'], row['risk_level'])
+                                                for student_id, row in inserted], 'bulk')
+            notifications.enqueue_risk_transitions(cur, [(student_id, None, row['risk_level'], row['risk_percentage'])
+                                                         for student_id, row in inserted])
+
+        ids = storage_backend.add_students(tenant_id, students, skip_existing=True,
+                                           hook=postgres_hook(record_initial_risk)) if students else []
+
+        imported = 0
+        changes = set()
+        for row, student_id in zip(rows, ids):
+            # Student IDs already taken in this institution are reported, not overwritten
+            if student_id is None:
+                errors.append({'line': row['line'], 'error': f"student_id {row['student_id']} already exists"})
+                continue
+            imported += 1
+            changes.add((tenant_id, current_user_id, row['course'], row['semester']))
+        if imported:
+            on_students_changed(list(changes))
+
+        return jsonify({
+            'message': f'Imported {imported} students'
+                       + (f', skipped {len(duplicates)} likely duplicates' if duplicates else '')
+                       + (f', {len(errors)} rows had errors' if errors else ''),
+            'imported': imported,
+            'duplicate_count': len(duplicates),
+            'duplicates': duplicates[:IMPORT_REPORT_LIMIT],
+            'error_count': len(errors),
+            'errors': sorted(errors, key=lambda error: error['line'])[:IMPORT_REPORT_LIMIT]
+        }), 200
+
+    except db.DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error("Import students error: %s", e)
+        return jsonify({'error': 'Failed to import students'}), 500
+
+@app.route('/api/students/<int:student_id>/duplicates', methods=['GET'])
+def get_student_duplicates(student_id):
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cur = conn.cursor()
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        tenant_id = current_tenant_id()
+
+        cur.execute("SELECT owner_user_id, name, email, course FROM students WHERE tenant_id = %s AND id = %s",
+                    (tenant_id, student_id))
+        student = cur.fetchone()
+        if not student or (current_role == 'teacher' and student[0] != current_user_id):
+            return jsonify({'error': 'Student not found'}), 404
+
+        duplicates = dedup.find_duplicates(cur, tenant_id, [{'name': student[1], 'email': student[2], 'course': student[3]}],
+                                           exclude_ids=[student_id])[0]
+        cur.close()
+
+        return jsonify({'student_id': student_id, 'duplicates': duplicates})
+
+    except Exception as e:
+        logger.error("Get student duplicates error: %s", e)
+        return jsonify({'error': 'Failed to find duplicates'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/students/duplicates', methods=['GET'])
+def find_duplicate_groups():
     role_check = require_roles('admin')
     auth_error = role_check()
     if auth_error:
         return auth_error
-    
+
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
-    
+
+    try:
+        cur = conn.cursor()
+        groups = dedup.duplicate_groups(cur, current_tenant_id(), limit=min(request.args.get('limit', 200, type=int), 1000))
+        cur.close()
+
+        return jsonify({'groups': groups})
+
+    except Exception as e:
+        logger.error("Find duplicate groups error: %s", e)
+        return jsonify({'error': 'Failed to find duplicates'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/students/<int:student_id>/merge', methods=['POST'])
+def merge_student(student_id):
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+
+    data = request.get_json() or {}
+    duplicate_id = data.get('duplicate_id')
+    if not isinstance(duplicate_id, int) or duplicate_id == student_id:
+        return jsonify({'error': 'duplicate_id must be the id of another student'}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        cur = conn.cursor()
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        tenant_id = current_tenant_id()
+
+        # Teachers can only merge their own students
+        merged = dedup.merge_students(cur, tenant_id, student_id, duplicate_id,
+                                      owner_user_id=current_user_id if current_role == 'teacher' else None)
+        if not merged:
+            return jsonify({'error': 'Student not found'}), 404
+        changes, removed_login_id = merged
+
+        # The merge may have filled in risk inputs, so rescore the kept student before committing
+        cur.execute("SELECT * FROM students WHERE tenant_id = %s AND id = %s", (tenant_id, student_id))
+        student = cur.fetchone()
+        risk_percentage = calculate_risk_percentage(student[8] or 0, student[7] or 0, student[9] or 0, student[10] or 0)
+        risk_level = get_risk_level_from_percentage(risk_percentage)
+        model_risks = model_risk_percentages([student_row_features(student)])
+        model_risk = float(model_risks[0]) if model_risks is not None else None
+        cur.execute("""
+            UPDATE students SET dropout_risk_score = %s, risk_percentage = %s, risk_level = %s, model_risk_percentage = %s
+            WHERE tenant_id = %s AND id = %s
+        """, (risk_percentage / 100, risk_percentage, risk_level, model_risk, tenant_id, student_id))
+        risk_history.record_snapshots(cur, [(student_id, risk_percentage, risk_level)], 'single')
+        notifications.enqueue_risk_transitions(cur, [(student_id, student[17], risk_level, risk_percentage)])
+
+        conn.commit()
+        cur.close()
+
+        student_features.mark_deleted([duplicate_id])
+        if removed_login_id:
+            user_cache.invalidate(removed_login_id)
+        on_students_changed(changes)
+
+        return jsonify({'message': 'Students merged successfully', 'student_id': student_id, 'merged_id': duplicate_id,
+                        'risk_percentage': risk_percentage, 'risk_level': risk_level,
+                        'model_risk_percentage': model_risk})
+
+    except Exception as e:
+        logger.error("Merge students error: %s", e)
+        return jsonify({'error': 'Failed to merge students'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/students/<int:student_id>/restore', methods=['POST'])
+def restore_student(student_id):
+    """Move an archived student back into the hot table"""
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
     try:
         cur = conn.cursor()
-        cur.execute("SELECT id, username, email, role, created_at FROM users ORDER BY created_at DESC")
-        users = cur.fetchall()
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        tenant_id = current_tenant_id()
+
+        # Teachers can only restore their own students
+        restored = archive.restore_student(cur, tenant_id, student_id,
+                                           owner_user_id=current_user_id if current_role == 'teacher' else None)
+        if restored is None:
+            conn.rollback()
+            return jsonify({'error': 'Archived student not found'}), 404
+        if restored == 'conflict':
+            conn.rollback()
+            return jsonify({'error': 'Another student now uses this student ID'}), 409
+
+        conn.commit()
+        cur.close()
+
+        owner_user_id, course, semester = restored
+        on_students_changed([(tenant_id, owner_user_id, course, semester)])
+
+        return jsonify({'message': 'Student restored successfully', 'student_id': student_id})
+
+    except Exception as e:
+        logger.error("Restore student error: %s", e)
+        return jsonify({'error': 'Failed to restore student'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/admin/archive-stats', methods=['GET'])
+def get_archive_stats():
+    """Hot and archived students per institution, with the archival policy"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+
+    try:
+        tenants = database.run_read(lambda conn: archive.archive_stats(conn.cursor()), read_only=True)
+        return jsonify({
+            'tenants': tenants,
+            'policy': {
+                'graduated_semester': archive.GRADUATED_SEMESTER,
+                'graduated_idle_days': archive.GRADUATED_IDLE_DAYS,
+                'inactive_days': archive.INACTIVE_DAYS,
+            }
+        })
+
+    except db.DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error("Archive stats error: %s", e)
+        return jsonify({'error': 'Failed to fetch archive stats'}), 500
+
+@app.route('/api/users', methods=['GET'])
+def get_users():
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    try:
+        users = storage_backend.list_users(current_tenant_id())
+        # Newest accounts first
+        users.sort(key=lambda user: user['created_at'] or datetime.min, reverse=True)
         
         users_list = []
         for user in users:
             users_list.append({
-                'id': user[0],
-                'username': user[1],
-                'email': user[2],
-                'role': user[3],
-                'created_at': user[4].isoformat() if user[4] else None
+                'id': user['id'],
+                'username': user['username'],
+                'email': user['email'],
+                'role': user['role'],
+                'created_at': user['created_at'].isoformat() if user['created_at'] else None
             })
         
-        conn.close()
         return jsonify(users_list)
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Get users error: {e}")
         return jsonify({'error': 'Failed to fetch users'}), 500
@@ -921,26 +2037,24 @@ def update_user(user_id):
         return auth_error
     
     data = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        cur = conn.cursor()
-        
         # Update user
-        cur.execute("""
-            UPDATE users 
-            SET username = %s, email = %s, role = %s
-            WHERE id = %s
-        """, (data['username'], data['email'], data['role'], user_id))
+        try:
+            updated = storage_backend.update_user(current_tenant_id(), user_id, {
+                'username': data['username'], 'email': data['email'], 'role': data['role']})
+        except storage.DuplicateError:
+            return jsonify({'error': 'Username or email already exists'}), 400
+        if not updated:
+            return jsonify({'error': 'User not found'}), 404
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Existing sessions pick up the change on their next request
+        user_cache.invalidate(user_id)
         
         return jsonify({'message': 'User updated successfully'})
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Update user error: {e}")
         return jsonify({'error': 'Failed to update user'}), 500
@@ -952,27 +2066,18 @@ def delete_user(user_id):
     if auth_error:
         return auth_error
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
     try:
-        cur = conn.cursor()
-        
-        # Check if user exists
-        cur.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-        if not cur.fetchone():
-            return jsonify({'error': 'User not found'}), 404
-        
         # Delete user
-        cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        if not storage_backend.delete_user(current_tenant_id(), user_id):
+            return jsonify({'error': 'User not found'}), 404
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Sessions of the deleted user end on their next request
+        user_cache.invalidate(user_id)
         
         return jsonify({'message': 'User deleted successfully'})
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Delete user error: {e}")
         return jsonify({'error': 'Failed to delete user'}), 500
@@ -984,26 +2089,23 @@ def get_teachers():
     if auth_error:
         return auth_error
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, username, email FROM users WHERE role = 'teacher' ORDER BY username")
-        teachers = cur.fetchall()
+        tenant_id = current_tenant_id()
+        
+        teachers = storage_backend.list_users(tenant_id, role='teacher')
         
         teachers_list = []
         for teacher in teachers:
             teachers_list.append({
-                'id': teacher[0],
-                'username': teacher[1],
-                'email': teacher[2]
+                'id': teacher['id'],
+                'username': teacher['username'],
+                'email': teacher['email']
             })
         
-        conn.close()
         return jsonify(teachers_list)
         
+    except db.DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Get teachers error: {e}")
         return jsonify({'error': 'Failed to fetch teachers'}), 500
@@ -1023,21 +2125,7 @@ def get_teacher_stats():
         cur = conn.cursor()
         
         # Get teacher statistics with student counts
-        cur.execute("""
-            SELECT 
-                u.id,
-                u.username,
-                u.email,
-                COUNT(s.id) as student_count,
-                COUNT(CASE WHEN s.risk_level = 'high' THEN 1 END) as high_risk_count,
-                COUNT(CASE WHEN s.risk_level = 'medium' THEN 1 END) as medium_risk_count,
-                COUNT(CASE WHEN s.risk_level = 'low' THEN 1 END) as low_risk_count
-            FROM users u
-            LEFT JOIN students s ON u.id = s.owner_user_id
-            WHERE u.role = 'teacher'
-            GROUP BY u.id, u.username, u.email
-            ORDER BY student_count DESC
-        """)
+        TEACHER_STATS.execute(cur, (current_tenant_id(),))
         
         teachers = cur.fetchall()
         
@@ -1053,12 +2141,352 @@ def get_teacher_stats():
                 'low_risk_count': teacher[6]
             })
         
-        conn.close()
         return jsonify(teachers_list)
         
     except Exception as e:
         logger.error(f"Get teacher stats error: {e}")
         return jsonify({'error': 'Failed to fetch teacher stats'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/admin/database-stats', methods=['GET'])
+def get_database_stats():
+    """Replica health, lag, how reads were routed and prepared statement usage"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return jsonify(dict(database.stats(), prepared_statements=statements.stats()))
+
+@app.route('/api/admin/tenants', methods=['GET'])
+def get_tenants():
+    """Institutions with their user and student counts"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        tenants = tenancy.list_tenants(cur)
+        return jsonify(tenants)
+        
+    except Exception as e:
+        logger.error("Get tenants error: %s", e)
+        return jsonify({'error': 'Failed to fetch tenants'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/admin/tenants', methods=['POST'])
+def create_tenant():
+    """Add an institution along with its students partition"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    data = request.get_json() or {}
+    if not data.get('name'):
+        return jsonify({'error': 'Institution name is required'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        tenant_id = tenancy.create_tenant(cur, data['name'], data.get('slug'))
+        conn.commit()
+        return jsonify({'message': 'Institution created successfully', 'tenant_id': tenant_id}), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except psycopg2.IntegrityError:
+        return jsonify({'error': 'Institution name or slug already exists'}), 400
+    except Exception as e:
+        logger.error("Create tenant error: %s", e)
+        return jsonify({'error': 'Failed to create institution'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/admin/inference-metrics', methods=['GET'])
+def get_inference_metrics():
+    """Queue depth and micro-batch statistics of the model scoring scheduler"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return jsonify(inference_scheduler.metrics())
+
+@app.route('/api/admin/logging-metrics', methods=['GET'])
+def get_logging_metrics():
+    """Log queue depth, dropped records and sampling counts"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return jsonify(log_pipeline.metrics())
+
+@app.route('/api/admin/admission-metrics', methods=['GET'])
+def get_admission_metrics():
+    """Concurrency, queue time and shed counts of each admission class"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return jsonify(admission_controller.metrics())
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Saved single-request profiles, newest first"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return jsonify({'profiles': request_profiler.list()})
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """A saved profile as a pstats file (format=prof) or a text report sorted by `sort`"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    if request.args.get('format') == 'prof':
+        path = request_profiler.path(profile_id)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(os.path.abspath(path), mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f"{profile_id}.prof")
+    
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'ncalls'):
+        return jsonify({'error': 'sort must be cumulative, tottime or ncalls'}), 400
+    report = request_profiler.render(profile_id, sort=sort, limit=min(request.args.get('limit', 60, type=int), 500))
+    if report is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(report, mimetype='text/plain')
+
+@app.route('/api/admin/profiler', methods=['GET'])
+def get_sampling_profiler():
+    """State of the sampling profiler's current or last window"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return jsonify(sampling_profiler.status())
+
+@app.route('/api/admin/profiler', methods=['POST'])
+def start_sampling_profiler():
+    """Sample request threads of every worker for `seconds`, every `interval_ms`"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 60))
+        interval_ms = float(data.get('interval_ms', profiling.SAMPLE_INTERVAL_MS))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if not 0 < seconds <= profiling.MAX_SAMPLE_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({'error': f'seconds must be 0-{profiling.MAX_SAMPLE_SECONDS} and interval_ms 1-1000'}), 400
+    
+    if not sampling_profiler.start(seconds, interval_ms):
+        return jsonify({'error': 'The sampling profiler is already running'}), 409
+    return jsonify(sampling_profiler.status()), 202
+
+@app.route('/api/admin/profiler', methods=['DELETE'])
+def stop_sampling_profiler():
+    """End the sampling window early; the samples so far are kept"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    sampling_profiler.stop()
+    return jsonify(sampling_profiler.status())
+
+@app.route('/api/admin/profiler/folded', methods=['GET'])
+def get_sampled_stacks():
+    """Folded stacks of the last window merged over every worker, for flamegraph.pl or speedscope"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    return Response(sampling_profiler.folded(), mimetype='text/plain')
+
+@app.route('/api/analytics/cohorts', methods=['GET'])
+def get_cohort_analytics():
+    """Risk distribution and academic statistics per course, semester or teacher"""
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    group_by = request.args.get('group_by', 'course')
+    if group_by not in analytics.COHORT_DIMENSIONS:
+        return jsonify({'error': f'group_by must be one of {", ".join(analytics.COHORT_DIMENSIONS)}'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        scope_sql, scope_params = get_student_scope_filter('s')
+        # Cache entries are keyed by tenant and the owner the scope is limited to (None = all of the tenant's students)
+        scope_owner = scope_params[1] if len(scope_params) > 1 else None
+        
+        groups, overall, computed_at = cohort_cache.get(cur, group_by, current_tenant_id(), scope_owner, scope_sql, scope_params)
+        
+        conn.close()
+        
+        cohorts = sorted(groups.values(), key=lambda cohort: cohort['students'], reverse=True)
+        total_students = overall['students'] if overall else 0
+        for cohort in cohorts:
+            cohort['share_percentage'] = round(cohort['students'] * 100.0 / total_students, 2) if total_students else 0
+        
+        return jsonify({
+            'group_by': group_by,
+            'cohorts': cohorts,
+            'overall': overall,
+            'computed_at': datetime.fromtimestamp(computed_at).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error("Cohort analytics error: %s", e)
+        return jsonify({'error': 'Failed to fetch cohort analytics'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/analytics/risk-trends', methods=['GET'])
+def get_risk_trends():
+    """Average risk over time, overall or per teacher/course, within the caller's scope"""
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    try:
+        start, end = parse_history_window()
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to date'}), 400
+    bucket = request.args.get('bucket', 'week')
+    group_by = request.args.get('group_by')
+    if bucket not in risk_history.TREND_BUCKETS:
+        return jsonify({'error': f'bucket must be one of {", ".join(risk_history.TREND_BUCKETS)}'}), 400
+    if group_by not in (None, 'teacher', 'course'):
+        return jsonify({'error': 'group_by must be teacher or course'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        scope_sql, scope_params = get_student_scope_filter('s')
+        
+        # Optionally narrow down to a single course
+        course = request.args.get('course')
+        if course:
+            scope_sql += " AND s.course = %s"
+            scope_params.append(course)
+        
+        trend = risk_history.query_trend(cur, start, end, bucket, scope_sql, scope_params, group_by,
+                                         include_archived=include_archived_requested())
+        
+        return jsonify({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'bucket': bucket,
+            'group_by': group_by,
+            'trend': trend
+        })
+        
+    except Exception as e:
+        logger.error("Get risk trends error: %s", e)
+        return jsonify({'error': 'Failed to fetch risk trends'}), 500
+    finally:
+        conn.close()
+
+def serve_report(title, scope_sql, scope_params, params):
+    """Send a cached report, or render it in the report pool and wait briefly for it"""
+    fmt = request.args.get('format', 'png')
+    if fmt not in reports.REPORT_FORMATS:
+        return jsonify({'error': 'format must be png or pdf'}), 400
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    try:
+        cur = conn.cursor()
+        rows = reports.load_report_rows(cur, scope_sql, scope_params)
+        conn.close()
+        
+        path, future = reports.get_or_render(title, rows, params, fmt)
+        if future is not None:
+            path = reports.wait_for_render(future)
+            if path is None:
+                # Still rendering; the finished file will be served from cache on retry
+                response = jsonify({'status': 'rendering', 'message': 'Report is being generated, please retry shortly'})
+                response.headers['Retry-After'] = '5'
+                return response, 202
+        
+        response = send_file(path, mimetype=reports.REPORT_FORMATS[fmt], max_age=0, conditional=True,
+                             download_name=f"{params['kind']}-report.{fmt}")
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        logger.error("Report error: %s", e)
+        return jsonify({'error': 'Failed to generate report'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/reports/teacher/<int:teacher_id>', methods=['GET'])
+def get_teacher_report(teacher_id):
+    """Risk report (PNG or PDF) for one teacher's students"""
+    role_check = require_roles('admin', 'teacher')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    # Teachers can only fetch their own report
+    if current_user()['role'] == 'teacher' and current_user()['id'] != teacher_id:
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    
+    return serve_report(f"Risk report: teacher #{teacher_id}", "s.tenant_id = %s AND s.owner_user_id = %s",
+                        [current_tenant_id(), teacher_id], {'kind': 'teacher', 'id': teacher_id})
+
+@app.route('/api/reports/course', methods=['GET'])
+def get_course_report():
+    """Risk report (PNG or PDF) for every student in a course"""
+    role_check = require_roles('admin')
+    auth_error = role_check()
+    if auth_error:
+        return auth_error
+    
+    course = request.args.get('name')
+    if not course:
+        return jsonify({'error': 'Course name is required'}), 400
+    
+    return serve_report(f"Risk report: {course}", "s.tenant_id = %s AND s.course = %s", [current_tenant_id(), course],
+                        {'kind': 'course', 'name': course})
 
 @app.route('/api/predict-risk', methods=['POST'])
 def predict_risk():
@@ -1072,44 +2500,64 @@ def predict_risk():
     
     try:
         cur = conn.cursor()
-        current_user_id = session.get('user', {}).get('id')
-        current_role = session.get('user', {}).get('role')
+        current_user_id = current_user().get('id')
+        current_role = current_user().get('role')
+        tenant_id = current_tenant_id()
         
         if current_role == 'teacher':
-            cur.execute("SELECT * FROM students WHERE owner_user_id = %s", (current_user_id,))
+            query = (STUDENT_LIST_OWNED, (tenant_id, current_user_id))
         else:
-            cur.execute("SELECT * FROM students")
-        students = cur.fetchall()
+            query = (STUDENT_LIST_ALL, (tenant_id,))
         
-        if not students:
-            return jsonify({'error': 'No students found'}), 400
+        model_trained = ensure_predictor_trained(cur)
         
-        # Convert to list of dicts
-        for student in students:
-            # Calculate risk using new percentage-based method
-            risk_percentage = calculate_risk_percentage(
-                student[8],  # cgpa
-                student[7],  # attendance_percentage
-                student[9],  # assignments_submitted
-                student[10]  # assignments_total
-            )
-            risk_score = risk_percentage / 100  # Convert to 0-1 scale for compatibility
-            risk_level = get_risk_level_from_percentage(risk_percentage)
+        # Rescore chunk by chunk from a server-side cursor so memory stays bounded however many students there are
+        updated_count = 0
+        for students in db.iter_chunks(conn, *query):
+            # Score the chunk with the model in one call; NULL features count as 0, as in training
+            model_risks = None
+            if model_trained:
+                model_risks = model_risk_percentages([student_row_features(student) for student in students])
             
-            cur.execute("""
-                UPDATE students SET dropout_risk_score = %s, risk_level = %s, last_updated = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (risk_score, risk_level, student[0]))
+            snapshots = []
+            transitions = []
+            for index, student in enumerate(students):
+                # Calculate risk using new percentage-based method
+                risk_percentage = calculate_risk_percentage(
+                    student[8],  # cgpa
+                    student[7],  # attendance_percentage
+                    student[9],  # assignments_submitted
+                    student[10]  # assignments_total
+                )
+                risk_score = risk_percentage / 100  # Convert to 0-1 scale for compatibility
+                risk_level = get_risk_level_from_percentage(risk_percentage)
+                
+                model_risk = float(model_risks[index]) if model_risks is not None else None
+                
+                STUDENT_RESCORE.execute(cur, (risk_score, risk_level, model_risk, tenant_id, student[0]))
+                snapshots.append((student[0], risk_percentage, risk_level))
+                transitions.append((student[0], student[17], risk_level, risk_percentage))  # student[17] is the previous risk_level
+            
+            # Append the chunk's snapshots in batched inserts and queue alerts for students that became high risk
+            risk_history.record_snapshots(cur, snapshots, 'bulk')
+            notifications.enqueue_risk_transitions(cur, transitions)
+            updated_count += len(students)
+        
+        if not updated_count:
+            return jsonify({'error': 'No students found'}), 400
         
         conn.commit()
         cur.close()
-        conn.close()
         
-        return jsonify({'message': 'Risk prediction completed', 'updated_count': len(students)})
+        on_students_changed()
+        
+        return jsonify({'message': 'Risk prediction completed', 'updated_count': updated_count})
         
     except Exception as e:
         logger.error(f"Predict risk error: {e}")
         return jsonify({'error': 'Failed to predict risk'}), 500
+    finally:
+        conn.close()
 
 def recalculate_all_student_risks():
     """Recalculate risk percentages for all students with the new logic"""
@@ -1117,39 +2565,85 @@ def recalculate_all_student_risks():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Get all students
-        cur.execute("SELECT id, cgpa, attendance_percentage, assignments_submitted, assignments_total FROM students")
-        students = cur.fetchall()
-        
+        # Walk all students in chunks from a server-side cursor
         updated_count = 0
-        for student in students:
-            student_id, cgpa, attendance_percentage, assignments_submitted, assignments_total = student
-            
-            # Calculate new risk percentage
-            new_risk_percentage = calculate_risk_percentage(cgpa, attendance_percentage, assignments_submitted, assignments_total)
-            new_risk_level = get_risk_level_from_percentage(new_risk_percentage)
+        for students in db.iter_chunks(conn, """
+            SELECT tenant_id, id, cgpa, attendance_percentage, assignments_submitted, assignments_total, risk_level,
+                   risk_percentage
+            FROM students
+        """):
+            snapshots = []
+            transitions = []
+            for student in students:
+                (tenant_id, student_id, cgpa, attendance_percentage, assignments_submitted, assignments_total,
+                 old_risk_level, old_risk_percentage) = student
+                
+                # Calculate new risk percentage
+                new_risk_percentage = calculate_risk_percentage(cgpa, attendance_percentage, assignments_submitted, assignments_total)
+                new_risk_level = get_risk_level_from_percentage(new_risk_percentage)
+                
+                # Every restart and deploy runs this, so unchanged scores are neither rewritten nor snapshotted
+                if new_risk_percentage == old_risk_percentage and new_risk_level == old_risk_level:
+                    continue
+                
+                # Update the student record
+                STUDENT_RECALCULATE.execute(cur, (new_risk_percentage, new_risk_level, tenant_id, student_id))
+                snapshots.append((student_id, new_risk_percentage, new_risk_level))
+                transitions.append((student_id, old_risk_level, new_risk_level, new_risk_percentage))
+                
+                updated_count += 1
             
-            # Update the student record
-            cur.execute("""
-                UPDATE students 
-                SET risk_percentage = %s, risk_level = %s 
-                WHERE id = %s
-            """, (new_risk_percentage, new_risk_level, student_id))
-            
-            updated_count += 1
+            risk_history.record_snapshots(cur, snapshots, 'startup')
+            notifications.enqueue_risk_transitions(cur, transitions)
         
         conn.commit()
         cur.close()
         conn.close()
         
-        logger.info(f"Recalculated risk for {updated_count} students")
+        on_students_changed()
+        
+        logger.info("Recalculated risk for %s students whose score changed", updated_count)
         return updated_count
         
     except Exception as e:
         logger.error(f"Error recalculating student risks: {e}")
         return 0
 
-if __name__ == '__main__':
-    # Recalculate all student risks on startup
+def run_startup_tasks():
+    """One-off work before serving: build the UI assets, then (with Postgres storage) rescore every student and
+    fit the model and build the feature store if needed.
+
+    Runs once per deployment: in the dev server before it starts, or in the
+    gunicorn master before workers are forked (see gunicorn.conf.py), so the
+    workers share the loaded model copy-on-write instead of each training it.
+    """
+    # Minify and gzip the UI bundles now rather than on the first page load
+    asset_pipeline.ensure_built()
+    if STORAGE_BACKEND != 'postgres':
+        # Rescoring, the feature store and training read students from Postgres
+        return
     recalculate_all_student_risks()
+    conn = get_db_connection(read_only=False)
+    if not conn:
+        return
+    try:
+        if not ensure_predictor_trained(conn.cursor()):
+            logger.warning("No students to train the model on yet, it will be trained on first use")
+    except Exception as e:
+        logger.error("Error training model on startup: %s", e)
+    finally:
+        conn.close()
+
+def start_notification_dispatcher():
+    """Deliver alerts from a background thread of the dev server when NOTIFY_DISPATCHER_THREAD=true.
+
+    gunicorn runs `python notifications.py` as a child of its master instead (see gunicorn.conf.py).
+    """
+    if os.getenv('NOTIFY_DISPATCHER_THREAD', 'False').lower() == 'true':
+        notifications.NotificationDispatcher(get_db_connection).start()
+
+if __name__ == '__main__':
+    # Recalculate all student risks and load the model on startup
+    run_startup_tasks()
+    start_notification_dispatcher()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+SehatMind - Student archival
+Graduated and long-inactive students are moved out of the hot `students`
+table into `students_archive` (same columns plus archived_at), so per-teacher
+lists, dashboard counts and admin scans stop reading rows that never change.
+A student is archived when last_updated is older than
+ARCHIVE_GRADUATED_IDLE_DAYS (default 180) and they are in semester
+ARCHIVE_GRADUATED_SEMESTER (default 8) or later. A student in any semester is
+also archived once last_updated is older than ARCHIVE_INACTIVE_DAYS (default
+730). Only edits and merges update last_updated. Rescoring (predict-risk and
+the startup recalculation) leaves it alone, so it doesn't count as activity.
+
+Rows move in batches of ARCHIVE_BATCH_SIZE. Each batch is one DELETE ...
+RETURNING into the archive, committed on its own, with a pause between
+batches. Rows locked by a request are skipped until the next run. Archived
+students keep their id, so their risk history stays attached, and
+restore_student() moves one back. Run periodically (e.g. nightly cron):
+
+    python archive.py              # --dry-run to only count candidates
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_TABLE = 'students_archive'
+GRADUATED_SEMESTER = int(os.getenv('ARCHIVE_GRADUATED_SEMESTER', 8))
+GRADUATED_IDLE_DAYS = int(os.getenv('ARCHIVE_GRADUATED_IDLE_DAYS', 180))
+INACTIVE_DAYS = int(os.getenv('ARCHIVE_INACTIVE_DAYS', 730))
+BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+BATCH_PAUSE_MS = int(os.getenv('ARCHIVE_BATCH_PAUSE_MS', 200))
+
+# Both rules need last_updated before the graduated cutoff, so the last_updated index narrows the scan
+POLICY_SQL = """last_updated < %(graduated_before)s
+    AND (semester >= %(graduated_semester)s OR last_updated < %(inactive_before)s)"""
+
+# Queries timed before and after a run: (label, sql with %(tenant_id)s)
+MEASURED_QUERIES = [
+    ('dashboard counts', "SELECT COUNT(*), COUNT(*) FILTER (WHERE risk_level = 'high') FROM students WHERE tenant_id = %(tenant_id)s"),
+    ('student list', "SELECT * FROM students WHERE tenant_id = %(tenant_id)s"),
+    ('teacher stats', """
+        SELECT u.id, COUNT(s.id) FROM users u
+        LEFT JOIN students s ON s.tenant_id = u.tenant_id AND u.id = s.owner_user_id
+        WHERE u.role = 'teacher' AND u.tenant_id = %(tenant_id)s GROUP BY u.id
+    """),
+]
+
+_columns = None
+
+
+def init_archive(cur):
+    """Create the archive table, and add any column the students table has gained since"""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+            LIKE students,
+            archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tenant_id, id)
+        )
+    """)
+    cur.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod) FROM pg_attribute a
+        WHERE a.attrelid = 'students'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+          AND a.attname NOT IN (SELECT attname FROM pg_attribute
+                                WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped)
+    """, (ARCHIVE_TABLE,))
+    for name, column_type in cur.fetchall():
+        cur.execute(f"ALTER TABLE {ARCHIVE_TABLE} ADD COLUMN {name} {column_type}")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_owner ON {ARCHIVE_TABLE} (tenant_id, owner_user_id)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_email ON {ARCHIVE_TABLE} (tenant_id, email)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_student_id ON {ARCHIVE_TABLE} (tenant_id, student_id)")
+    global _columns
+    _columns = None
+
+
+def student_columns(cur):
+    """(all, insertable) students column names in table order; generated columns aren't insertable"""
+    global _columns
+    if _columns is None:
+        cur.execute("""
+            SELECT attname, attgenerated <> '' FROM pg_attribute
+            WHERE attrelid = 'students'::regclass AND attnum > 0 AND NOT attisdropped
+            ORDER BY attnum
+        """)
+        rows = cur.fetchall()
+        _columns = ([name for name, _ in rows], [name for name, generated in rows if not generated])
+    return _columns
+
+
+def policy_params(now=None, tenant_id=None):
+    now = now or datetime.now()
+    return {
+        'graduated_semester': GRADUATED_SEMESTER,
+        'graduated_before': now - timedelta(days=GRADUATED_IDLE_DAYS),
+        'inactive_before': now - timedelta(days=INACTIVE_DAYS),
+        'tenant_id': tenant_id,
+    }
+
+
+def policy_sql(tenant_id=None):
+    """POLICY_SQL, limited to one institution's partition when `tenant_id` is given"""
+    return POLICY_SQL if tenant_id is None else f"tenant_id = %(tenant_id)s AND {POLICY_SQL}"
+
+
+def count_candidates(cur, now=None, tenant_id=None):
+    """Students the policy would archive, per tenant"""
+    cur.execute(f"SELECT tenant_id, COUNT(*) FROM students WHERE {policy_sql(tenant_id)} GROUP BY tenant_id ORDER BY tenant_id",
+                policy_params(now, tenant_id))
+    return dict(cur.fetchall())
+
+
+def archive_batch(cur, now=None, limit=BATCH_SIZE, tenant_id=None):
+    """Move up to `limit` students matching the policy (in one institution, when given) into the archive.
+
+    Returns (tenant_id, owner_user_id, course, semester, id) of each moved student.
+    """
+    columns, _ = student_columns(cur)
+    column_sql = ', '.join(columns)
+    cur.execute(f"""
+        WITH picked AS (
+            SELECT tenant_id, id FROM students WHERE {policy_sql(tenant_id)}
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        ), moved AS (
+            DELETE FROM students s USING picked p WHERE s.tenant_id = p.tenant_id AND s.id = p.id
+            RETURNING s.*
+        )
+        INSERT INTO {ARCHIVE_TABLE} ({column_sql}) SELECT {column_sql} FROM moved
+        RETURNING tenant_id, owner_user_id, course, semester, id
+    """, dict(policy_params(now, tenant_id), limit=limit))
+    return cur.fetchall()
+
+
+def run_archival(conn, now=None, batch_size=BATCH_SIZE, pause_ms=BATCH_PAUSE_MS, on_batch=None, tenant_id=None):
+    """Archive every student matching the policy, one committed batch at a time; returns the number moved.
+
+    `on_batch` is called with each batch's archive_batch() rows after it commits.
+    """
+    cur = conn.cursor()
+    now = now or datetime.now()
+    moved = 0
+    while True:
+        rows = archive_batch(cur, now, batch_size, tenant_id)
+        conn.commit()
+        if not rows:
+            break
+        moved += len(rows)
+        if on_batch:
+            on_batch(rows)
+        logger.info("Archived %s students (%s so far)", len(rows), moved)
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause_ms / 1000)
+    return moved
+
+
+def restore_student(cur, tenant_id, student_id, owner_user_id=None):
+    """Move one student back into the hot table.
+
+    Returns (owner_user_id, course, semester), 'conflict' if a hot student
+    now uses the same student_id, or None if no such archived student (owned by
+    `owner_user_id`, when given) exists.
+    """
+    _, insertable = student_columns(cur)
+    cur.execute(f"""
+        SELECT owner_user_id, course, semester, student_id FROM {ARCHIVE_TABLE}
+        WHERE tenant_id = %s AND id = %s AND (%s::int IS NULL OR owner_user_id = %s)
+        FOR UPDATE
+    """, (tenant_id, student_id, owner_user_id, owner_user_id))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    cur.execute("SELECT 1 FROM students WHERE tenant_id = %s AND student_id = %s", (tenant_id, row[3]))
+    if cur.fetchone():
+        return 'conflict'
+    # Restored students count as active again, so the next run doesn't archive them straight back
+    values_sql = ', '.join('CURRENT_TIMESTAMP' if column == 'last_updated' else column for column in insertable)
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {ARCHIVE_TABLE} WHERE tenant_id = %s AND id = %s RETURNING *
+        )
+        INSERT INTO students ({', '.join(insertable)}) SELECT {values_sql} FROM moved
+    """, (tenant_id, student_id))
+    return row[:3]
+
+
+def get_student(cur, tenant_id, student_id, owner_user_id=None, email=None):
+    """An archived student as a dict of students columns plus archived_at, or None"""
+    columns, _ = student_columns(cur)
+    cur.execute(f"""
+        SELECT {', '.join(columns)}, archived_at FROM {ARCHIVE_TABLE}
+        WHERE tenant_id = %s AND id = %s AND (%s::int IS NULL OR owner_user_id = %s) AND (%s::text IS NULL OR email = %s)
+    """, (tenant_id, student_id, owner_user_id, owner_user_id, email, email))
+    row = cur.fetchone()
+    return dict(zip(columns + ['archived_at'], row)) if row else None
+
+
+def list_sql(cur, scope_sql):
+    """SELECT of hot then archived students matching `scope_sql`, in `SELECT * FROM students` column
+    order plus a trailing `archived` flag"""
+    columns, _ = student_columns(cur)
+    column_sql = ', '.join(columns)
+    return (f"SELECT {column_sql}, FALSE AS archived FROM students WHERE {scope_sql} "
+            f"UNION ALL SELECT {column_sql}, TRUE FROM {ARCHIVE_TABLE} WHERE {scope_sql}")
+
+
+def archive_stats(cur):
+    """Hot and archived students per tenant"""
+    cur.execute(f"""
+        SELECT t.id, t.slug,
+               (SELECT COUNT(*) FROM students s WHERE s.tenant_id = t.id),
+               (SELECT COUNT(*) FROM {ARCHIVE_TABLE} a WHERE a.tenant_id = t.id),
+               (SELECT MAX(archived_at) FROM {ARCHIVE_TABLE} a WHERE a.tenant_id = t.id)
+        FROM tenants t ORDER BY t.id
+    """)
+    return [{
+        'tenant_id': row[0],
+        'slug': row[1],
+        'hot': row[2],
+        'archived': row[3],
+        'last_archived_at': row[4].isoformat() if row[4] else None,
+    } for row in cur.fetchall()]
+
+
+def measure(cur, tenant_ids, runs=5):
+    """Median ms of each MEASURED_QUERIES entry, summed over `tenant_ids`"""
+    timings = {}
+    for label, sql in MEASURED_QUERIES:
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            for tenant_id in tenant_ids:
+                cur.execute(sql, {'tenant_id': tenant_id})
+                cur.fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[label] = round(statistics.median(samples), 2)
+    return timings
+
+
+def report(cur):
+    cur.execute(f"SELECT tenant_id FROM students UNION SELECT tenant_id FROM {ARCHIVE_TABLE} ORDER BY 1")
+    tenant_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT COUNT(*) FROM students")
+    hot = cur.fetchone()[0]
+    cur.execute(f"SELECT COUNT(*) FROM {ARCHIVE_TABLE}")
+    return {'hot_rows': hot, 'archived_rows': cur.fetchone()[0], 'query_ms': measure(cur, tenant_ids)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move graduated and inactive students to the archive')
+    parser.add_argument('--dry-run', action='store_true', help='only count the students that would be archived')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--pause-ms', type=int, default=BATCH_PAUSE_MS)
+    parser.add_argument('--tenant', type=int, help="only archive this institution's students")
+    args = parser.parse_args()
+
+    from app import get_db_connection, student_features
+    conn = get_db_connection(statement_timeout_ms=0)
+    if not conn:
+        raise SystemExit("Failed to connect to database")
+    cur = conn.cursor()
+    if args.dry_run:
+        print({'candidates': count_candidates(cur, tenant_id=args.tenant)})
+        conn.close()
+        raise SystemExit(0)
+
+    before = report(cur)
+    conn.commit()
+
+    moved = run_archival(conn, batch_size=args.batch_size, pause_ms=args.pause_ms,
+                         on_batch=lambda rows: student_features.mark_deleted([row[4] for row in rows]),
+                         tenant_id=args.tenant)
+    if moved:
+        # Drop them from the shared feature store; cached cohort analytics catch up within their TTL
+        student_features.refresh(cur)
+        conn.commit()
+        # Reclaim the deleted rows and refresh statistics so plans reflect the smaller hot table
+        conn.autocommit = True
+        cur.execute("SELECT tenant_id FROM students GROUP BY tenant_id")
+        for (tenant_id,) in cur.fetchall():
+            cur.execute(f"VACUUM ANALYZE {tenancy.partition_name(tenant_id)}")
+        cur.execute(f"ANALYZE {ARCHIVE_TABLE}")
+        conn.autocommit = False
+    print({'archived': moved, 'before': before, 'after': report(cur)})
+    conn.close()
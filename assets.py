@@ -0,0 +1,137 @@
+"""
+SehatMind - Static asset pipeline
+Splits the inline CSS and JS out of templates/index.html at startup, minifies
+them, fingerprints them with a content hash and precompresses everything with
+gzip. The HTML shell is revalidated with an ETag (304 on repeat loads) and the
+fingerprinted bundles are served with year-long immutable cache headers.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import re
+import threading
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+ASSET_URL_PREFIX = '/assets/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+SHELL_CACHE_CONTROL = 'no-cache'
+
+STYLE_PATTERN = re.compile(r'<style>(.*?)</style>', re.S)
+SCRIPT_PATTERN = re.compile(r'<script>(.*?)</script>', re.S)
+
+
+class Asset:
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+
+
+def minify_css(css):
+    """Drop comments and collapse whitespace around CSS punctuation"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    """Conservative JS minification: strip indentation, blank lines and whole-line
+    // comments, leaving anything inside template literals untouched"""
+    lines = []
+    in_template = False
+    for line in js.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        # Track whether the next line starts inside a multi-line `template literal`
+        if line.count('`') - line.count('\\`') & 1:
+            in_template = not in_template
+    return '\n'.join(lines)
+
+
+def minify_html(html):
+    html = re.sub(r'<!--.*?-->', '', html, flags=re.S)
+    return '\n'.join(line.strip() for line in html.splitlines() if line.strip())
+
+
+class AssetPipeline:
+    """Builds the fingerprinted bundles from the template and serves them from memory"""
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self.assets = {}
+        self.shell = None
+        self._built_mtime = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        with open(self.template_path, encoding='utf-8') as handle:
+            source = handle.read()
+
+        assets = {}
+
+        def extract(minify, extension, mimetype, tag):
+            def replace(match):
+                body = minify(match.group(1)).encode('utf-8')
+                digest = hashlib.sha256(body).hexdigest()[:12]
+                name = f"app.{digest}.{extension}"
+                assets[name] = Asset(body, mimetype)
+                return tag.format(url=ASSET_URL_PREFIX + name)
+            return replace
+
+        shell = STYLE_PATTERN.sub(extract(minify_css, 'css', 'text/css; charset=utf-8',
+                                          '<link rel="stylesheet" href="{url}">'), source)
+        shell = SCRIPT_PATTERN.sub(extract(minify_js, 'js', 'application/javascript; charset=utf-8',
+                                           '<script src="{url}"></script>'), shell)
+
+        self.assets = assets
+        self.shell = Asset(minify_html(shell).encode('utf-8'), 'text/html; charset=utf-8')
+        self._built_mtime = os.path.getmtime(self.template_path)
+
+        original = len(source.encode('utf-8'))
+        compressed = len(self.shell.gzipped) + sum(len(asset.gzipped) for asset in assets.values())
+        logger.info("Built UI assets: %s bytes inline -> %s bytes gzipped across %s files",
+                    original, compressed, len(assets) + 1)
+
+    def ensure_built(self, check_for_changes=False):
+        """Build on first use; with `check_for_changes` (debug mode) rebuild when the template is edited"""
+        if self.shell is not None and not check_for_changes:
+            return
+        with self._lock:
+            if self.shell is None or os.path.getmtime(self.template_path) != self._built_mtime:
+                self.build()
+
+    @staticmethod
+    def _respond(asset, request, cache_control):
+        if request.if_none_match.contains(asset.etag):
+            response = Response(status=304)
+        else:
+            use_gzip = request.accept_encodings['gzip'] > 0
+            response = Response(asset.gzipped if use_gzip else asset.body, mimetype=asset.mimetype)
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(asset.etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def serve_shell(self, request, check_for_changes=False):
+        self.ensure_built(check_for_changes)
+        return self._respond(self.shell, request, SHELL_CACHE_CONTROL)
+
+    def serve_asset(self, name, request):
+        self.ensure_built()
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        return self._respond(asset, request, IMMUTABLE_CACHE_CONTROL)
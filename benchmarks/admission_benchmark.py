@@ -0,0 +1,106 @@
+"""
+Admission control benchmark: heavy clients hammer the student list, the CSV
+export and predict-risk while a probe client keeps logging in as a teacher.
+Runs the server (python run.py) once with ADMISSION_CONTROL=false and once
+with it on, and reports login latency and errors plus how the heavy requests
+fared (served, shed with 503, failed). Needs the database from app.py's
+DB_CONFIG.
+
+    python benchmarks/admission_benchmark.py --seconds 20 --heavy-clients 16
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+
+from server_benchmark import ROOT, wait_until_up
+
+HEAVY = [('GET', '/api/students'), ('GET', '/api/students/export'), ('POST', '/api/predict-risk')]
+
+
+def heavy_client(url, stop, index, outcomes):
+    session = requests.Session()
+    session.post(url + '/api/login', json={'username': 'admin', 'password': 'admin123'})
+    while not stop.is_set():
+        method, path = HEAVY[index % len(HEAVY)]
+        try:
+            response = session.request(method, url + path, timeout=120)
+            outcomes[response.status_code] += 1
+            if response.status_code == 503:
+                stop.wait(float(response.headers.get('Retry-After', 1)))
+        except requests.RequestException as e:
+            outcomes[type(e).__name__] += 1
+        index += 1
+
+
+def login_probe(url, stop, latencies, errors):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = requests.post(url + '/api/login', json={'username': 'teacher1', 'password': 'password'}, timeout=60)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        if error is None:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(error)
+        time.sleep(0.05)
+
+
+def run(label, admission, port, seconds, heavy_clients):
+    env = dict(os.environ, PORT=str(port), DEBUG='False', ADMISSION_CONTROL=admission)
+    process = subprocess.Popen([sys.executable, 'run.py'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(url, process)
+        stop = threading.Event()
+        latencies, errors, outcomes = [], [], Counter()
+        threads = [threading.Thread(target=heavy_client, args=(url, stop, i, outcomes)) for i in range(heavy_clients)]
+        threads.append(threading.Thread(target=login_probe, args=(url, stop, latencies, errors)))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies = np.array(latencies) * 1000
+        print(f"\n{label}")
+        if len(latencies):
+            print(f"  teacher logins: {len(latencies)} ok, p50 {np.percentile(latencies, 50):7.1f} ms, "
+                  f"p99 {np.percentile(latencies, 99):7.1f} ms, {len(errors)} errors")
+        else:
+            print(f"  teacher logins: none succeeded, {len(errors)} errors")
+        for error in sorted(set(errors)):
+            print(f"    {errors.count(error)} x {error}")
+        print("  heavy requests: " + ', '.join(f"{count} x {status}" for status, count in sorted(outcomes.items(), key=str)))
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--heavy-clients', type=int, default=16)
+    parser.add_argument('--port', type=int, default=5060)
+    args = parser.parse_args()
+
+    print(f"{args.heavy_clients} heavy clients ({', '.join(path for _, path in HEAVY)}) for {args.seconds}s, "
+          f"plus one client logging in every 50 ms")
+    run('admission control off', 'false', args.port, args.seconds, args.heavy_clients)
+    run('admission control on', 'true', args.port + 1, args.seconds, args.heavy_clients)
+
+
+if __name__ == '__main__':
+    main()
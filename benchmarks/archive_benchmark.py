@@ -0,0 +1,105 @@
+"""
+Archival benchmark: seeds a throwaway institution where --archived-share of
+the students were last updated years ago, then times the hot-table queries in
+archive.MEASURED_QUERIES before and after archive.py moves those students out.
+Also reports the archive run's throughput and the rows left in the hot
+partition. The institution is removed afterwards. Needs the database from
+app.py's DB_CONFIG.
+
+    python benchmarks/archive_benchmark.py --students 100000 --archived-share 0.6
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import archive
+import storage
+import tenancy
+
+BULK_BATCH = 1000
+TEACHERS = 20
+
+
+def student_row(index, owner_id):
+    return {
+        'student_id': f"A{index:08d}",
+        'name': f"Student {index}",
+        'email': f"student{index}@example.com",
+        'course': random.choice(['Computer Science', 'Mechanical', 'Commerce', 'Biology']),
+        'semester': random.randint(1, 8),
+        'attendance_percentage': random.uniform(40, 100),
+        'cgpa': random.uniform(4, 10),
+        'assignments_submitted': random.randint(0, 10),
+        'assignments_total': 10,
+        'risk_percentage': random.uniform(0, 100),
+        'risk_level': random.choice(storage.RISK_LEVELS),
+        'owner_user_id': owner_id,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--archived-share', type=float, default=0.6)
+    parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(7)
+    backend = storage.create_backend('postgres', database=app.database)
+    conn = app.get_db_connection(statement_timeout_ms=0)
+    cur = conn.cursor()
+    slug = f"bench-{uuid.uuid4().hex[:10]}"
+    tenant_id = tenancy.create_tenant(cur, slug, slug)
+    conn.commit()
+    partition = tenancy.partition_name(tenant_id)
+    try:
+        teachers = [backend.create_user(tenant_id, f"{slug}-t{i}", f"{slug}-t{i}@example.com", 'secret', role='teacher')
+                    for i in range(TEACHERS)]
+        rows = [student_row(i, random.choice(teachers)) for i in range(args.students)]
+        for start in range(0, args.students, BULK_BATCH):
+            backend.add_students(tenant_id, rows[start:start + BULK_BATCH])
+        cur.execute(f"""
+            UPDATE {partition} SET last_updated = CURRENT_TIMESTAMP - INTERVAL '1 day' * %s
+            WHERE random() < %s
+        """, (archive.INACTIVE_DAYS + 30, args.archived_share))
+        conn.commit()
+        conn.autocommit = True
+        cur.execute(f"VACUUM ANALYZE {partition}")
+
+        before = archive.measure(cur, [tenant_id], args.runs)
+        hot_before = backend.dashboard_counts(tenant_id)['total']
+
+        conn.autocommit = False
+        started = time.perf_counter()
+        moved = archive.run_archival(conn, batch_size=args.batch_size, pause_ms=0, tenant_id=tenant_id)
+        seconds = time.perf_counter() - started
+        conn.autocommit = True
+        cur.execute(f"VACUUM ANALYZE {partition}")
+
+        after = archive.measure(cur, [tenant_id], args.runs)
+        hot_after = backend.dashboard_counts(tenant_id)['total']
+        conn.autocommit = False
+    finally:
+        conn.autocommit = False
+        tenancy.drop_tenant(cur, tenant_id)
+        conn.commit()
+        conn.close()
+
+    print(f"\n{args.students} students, {moved} archived in {seconds:.2f}s "
+          f"({moved / seconds:,.0f} rows/s, batches of {args.batch_size})")
+    print(f"hot rows: {hot_before} -> {hot_after}\n")
+    print(f"{'median ms':<20}{'before':>12}{'after':>12}")
+    for label in before:
+        print(f"{label:<20}{before[label]:>12.2f}{after[label]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Database fault benchmark: runs the app against Postgres through a local
+fault-injecting TCP proxy and drives it with concurrent logged-in clients
+through a series of phases: healthy, all connections reset, database refusing
+connections, network blackhole (connections accepted but never answered),
+and recovered. For each phase it reports response statuses and latency plus
+the primary's circuit breaker state, showing requests failing fast with 503
+while the database is unreachable and recovering without a restart.
+
+    python benchmarks/db_fault_benchmark.py --phase-seconds 8 --clients 6
+    python benchmarks/db_fault_benchmark.py --baseline   # no timeouts, retries or breaker
+
+The proxy also runs on its own, e.g. to poke at a dev server started with
+DB_PORT=6543; type a mode (pass, reset, refuse, blackhole) on stdin to switch:
+
+    python benchmarks/db_fault_benchmark.py --proxy-only --listen 6543
+"""
+
+import argparse
+import os
+import select
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('pass', 'reset', 'refuse', 'blackhole')
+PATHS = ['/api/dashboard/stats', '/api/teachers', '/api/current-user']
+
+
+class FaultProxy:
+    """TCP proxy to `target` whose behaviour is switched with set_mode().
+
+    pass: forward traffic. reset: drop every open connection once, then pass.
+    refuse: drop open connections and close new ones straight away, like a
+    stopped server. blackhole: drop open connections and accept new ones
+    without ever answering, like a hung host.
+    """
+
+    def __init__(self, listen_port, target_host, target_port):
+        self.target = (target_host, target_port)
+        self.mode = 'pass'
+        self._lock = threading.Lock()
+        self._open = set()
+        self._held = []
+        self._server = socket.create_server(('127.0.0.1', listen_port), reuse_port=False)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name='fault-proxy', daemon=True).start()
+
+    def set_mode(self, mode):
+        with self._lock:
+            self.mode = 'pass' if mode == 'reset' else mode
+            doomed = list(self._open) if mode != 'pass' else []
+            if mode != 'blackhole':
+                doomed += self._held
+                self._held = []
+        for sock in doomed:
+            self._abort(sock)
+
+    @staticmethod
+    def _abort(sock):
+        try:
+            # RST instead of FIN, like a crashed server or a dropped NAT entry
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b'\x01\x00\x00\x00\x00\x00\x00\x00')
+            sock.close()
+        except OSError:
+            pass
+
+    def _accept_loop(self):
+        while True:
+            client, _ = self._server.accept()
+            with self._lock:
+                mode = self.mode
+                if mode == 'blackhole':
+                    self._held.append(client)
+                    continue
+            if mode == 'refuse':
+                self._abort(client)
+                continue
+            threading.Thread(target=self._pipe, args=(client,), daemon=True).start()
+
+    def _pipe(self, client):
+        try:
+            upstream = socket.create_connection(self.target)
+        except OSError:
+            self._abort(client)
+            return
+        with self._lock:
+            self._open.update((client, upstream))
+        peers = {client: upstream, upstream: client}
+        try:
+            while True:
+                readable, _, _ = select.select(list(peers), [], [], 1)
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    peers[sock].sendall(data)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                self._open.difference_update((client, upstream))
+            for sock in (client, upstream):
+                self._abort(sock)
+
+
+def client(app_module, stop, phase, results):
+    test_client = app_module.app.test_client()
+    test_client.post('/api/login', json={'username': 'teacher1', 'password': 'password'}).close()
+    index = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = test_client.get(PATHS[index % len(PATHS)])
+        response.close()
+        results.append((phase[0], response.status_code, time.perf_counter() - started))
+        index += 1
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--phase-seconds', type=float, default=8)
+    parser.add_argument('--clients', type=int, default=6)
+    parser.add_argument('--listen', type=int, default=0, help='proxy port (default: any free port)')
+    parser.add_argument('--target-port', type=int, default=int(os.getenv('DB_PORT', 5432)))
+    parser.add_argument('--baseline', action='store_true', help='disable timeouts, retries and the circuit breaker')
+    parser.add_argument('--proxy-only', action='store_true', help='only run the proxy, switching modes from stdin')
+    args = parser.parse_args()
+
+    proxy = FaultProxy(args.listen, 'localhost', args.target_port)
+    if args.proxy_only:
+        print(f"Proxying 127.0.0.1:{proxy.port} -> localhost:{args.target_port}, modes: {', '.join(MODES)}")
+        for line in sys.stdin:
+            if line.strip() in MODES:
+                proxy.set_mode(line.strip())
+                print(f"mode: {proxy.mode}")
+        return
+
+    os.environ['DB_PORT'] = str(proxy.port)
+    os.environ.setdefault('DB_CONNECT_TIMEOUT', '2')
+    os.environ.setdefault('DB_BREAKER_PROBE_SECONDS', '1')
+    if args.baseline:
+        os.environ.update(DB_CONNECT_TIMEOUT='0', DB_READ_RETRIES='0', DB_CIRCUIT_BREAKER='false')
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    phases = [('healthy', 'pass'), ('connections reset', 'reset'), ('database refusing', 'refuse'),
+              ('network blackhole', 'blackhole'), ('recovered', 'pass')]
+    phase = [phases[0][0]]
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=client, args=(app_module, stop, phase, results), daemon=True)
+               for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+
+    circuit = {}
+    for name, mode in phases:
+        phase[0] = name
+        proxy.set_mode(mode)
+        time.sleep(args.phase_seconds)
+        circuit[name] = app_module.database.stats()['primary']['circuit']
+    stop.set()
+    proxy.set_mode('pass')
+    for thread in threads:
+        thread.join(timeout=60)
+
+    label = 'baseline (no timeouts, retries or breaker)' if args.baseline else 'timeouts + retries + circuit breaker'
+    print(f"\n{label}: {args.clients} clients, {args.phase_seconds:g}s per phase, paths {', '.join(PATHS)}")
+    print(f"{'phase':<20}{'requests':>9}{'p50 ms':>9}{'p99 ms':>10}  statuses / circuit")
+    for name, _ in phases:
+        rows = [(status, latency) for phase_name, status, latency in results if phase_name == name]
+        latencies = np.array([latency for _, latency in rows]) * 1000
+        statuses = Counter(status for status, _ in rows)
+        p50, p99 = (np.percentile(latencies, 50), np.percentile(latencies, 99)) if len(latencies) else (0, 0)
+        print(f"{name:<20}{len(rows):>9}{p50:>9.1f}{p99:>10.1f}  "
+              f"{dict(sorted(statuses.items()))} / {circuit[name]['state']}, {circuit[name]['trips']} trips, "
+              f"{circuit[name]['rejected']} rejected")
+    print(f"read retries: {app_module.database.retries}")
+
+
+if __name__ == '__main__':
+    main()
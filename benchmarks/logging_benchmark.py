@@ -0,0 +1,109 @@
+"""
+Logging benchmark: login throughput and latency with logging on, through
+Flask's test client from --threads threads. Each log setup runs twice, once
+writing to a file and once to a sink that stalls for --stall-ms per write (a
+full pipe or a slow log shipper). The setups are a plain StreamHandler on
+the root logger (the old logging.basicConfig setup), the logs.py queue
+pipeline with sampling off, and the pipeline with the default sample rates.
+Needs the database from app.py's DB_CONFIG and the teacher1 account.
+
+    python benchmarks/logging_benchmark.py --seconds 5 --threads 8
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import logs
+
+
+class StallingStream:
+    """File-like sink that takes `stall_ms` per write"""
+
+    def __init__(self, stall_ms):
+        self.stall = stall_ms / 1000
+
+    def write(self, text):
+        time.sleep(self.stall)
+
+    def flush(self):
+        pass
+
+
+def sync_logging(stream):
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    return None
+
+
+def login_load(threads, seconds):
+    """(logins per second, latencies in ms) of `threads` clients logging in for `seconds`"""
+    latencies = [[] for _ in range(threads)]
+    deadline = time.perf_counter() + seconds
+
+    def work(index):
+        client = app.app.test_client()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.post('/api/login', json={'username': 'teacher1', 'password': 'password'})
+            response.get_data()
+            response.close()
+            latencies[index].append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    merged = np.concatenate([np.array(samples) for samples in latencies]) * 1000
+    return len(merged) / seconds, merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--stall-ms', type=float, default=2)
+    args = parser.parse_args()
+
+    setups = {
+        'sync': sync_logging,
+        'queue': lambda stream: logs.configure(stream=stream, sample_rates={}),
+        'queue + sampling': lambda stream: logs.configure(stream=stream, sample_rates=logs.DEFAULT_SAMPLE_RATES),
+    }
+    login_load(args.threads, 1)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for sink in ('file', 'stalling'):
+            for name, setup in setups.items():
+                with open(os.path.join(directory, f"{name}-{sink}.log"), 'w') as log_file:
+                    stream = log_file if sink == 'file' else StallingStream(args.stall_ms)
+                    pipeline = setup(stream)
+                    throughput, ms = login_load(args.threads, args.seconds)
+                    dropped = pipeline.metrics()['dropped'] if pipeline else 0
+                    if pipeline:
+                        pipeline.stop()
+                    results.append((name, sink, throughput, ms, dropped))
+
+    print(f"\n{args.threads} threads, {args.seconds:g}s per run, stalling sink waits {args.stall_ms:g} ms per write\n")
+    print(f"{'logging':<18}{'sink':<10}{'logins/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'dropped':>9}")
+    for name, sink, throughput, ms, dropped in results:
+        print(f"{name:<18}{sink:<10}{throughput:>10.0f}{np.median(ms):>9.2f}{np.percentile(ms, 99):>9.2f}{dropped:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Prepared statement benchmark: runs the registered hot statements behind each
+route unprepared (parsed and planned on every call) and as server-side
+prepared statements, and reports the time saved per route call. The planning
+column is Postgres' own Planning Time for the unprepared statements (EXPLAIN
+SUMMARY), i.e. the part a generic prepared plan skips. Writes run inside
+transactions that are rolled back, so the database is left unchanged.
+
+    python benchmarks/prepared_statement_benchmark.py --iterations 2000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def route_calls(app, student, teacher_id):
+    """route -> [(statement, params)] as each route runs them for `student`"""
+    tenant_id, student_id, owner_id, email = student
+    return {
+        'GET /api/students/<id> (admin)': [(app.storage.PostgresBackend.STUDENT_GET, (tenant_id, student_id))],
+        'GET /api/students/<id> (teacher)': [(app.storage.PostgresBackend.STUDENT_GET_OWNED, (tenant_id, student_id, owner_id))],
+        'GET /api/students/<id> (student)': [(app.storage.PostgresBackend.STUDENT_GET_BY_EMAIL, (tenant_id, student_id, email))],
+        'GET /api/dashboard/stats (teacher)': [(app.storage.PostgresBackend.DASHBOARD_COUNTS_OWNED, (tenant_id, owner_id))],
+        'PUT /api/students/<id>': [
+            (app.storage.PostgresBackend.STUDENT_GET, (tenant_id, student_id)),
+            (app.storage.PostgresBackend.USER_GET, (teacher_id,)),
+        ],
+        'DELETE /api/students/<id>': [(app.storage.PostgresBackend.STUDENT_GET, (tenant_id, student_id))],
+        'POST /api/predict-risk (per student)': [(app.STUDENT_RESCORE, (0.5, 'medium', 50.0, tenant_id, student_id))],
+        'any request (user cache miss)': [(app.storage.PostgresBackend.USER_GET, (teacher_id,))],
+    }
+
+
+def time_route(conn, calls, iterations):
+    """Mean ms per route call"""
+    cur = conn.cursor()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for statement, params in calls:
+            statement.execute(cur, params)
+            if cur.description:
+                cur.fetchall()
+        conn.rollback()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def planning_ms(conn, calls):
+    """Postgres planning time of the unprepared statements, in ms"""
+    cur = conn.cursor()
+    total = 0.0
+    for statement, params in calls:
+        cur.execute("EXPLAIN (SUMMARY ON) " + statement.sql, params)
+        plan = '\n'.join(row[0] for row in cur.fetchall())
+        total += float(re.search(r'Planning Time: ([\d.]+) ms', plan).group(1))
+    conn.rollback()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    import app
+    import statements
+
+    conn = app.database.primary.get()
+    cur = conn.cursor()
+    cur.execute("SELECT tenant_id, id, owner_user_id, email FROM students ORDER BY id LIMIT 1")
+    student = cur.fetchone()
+    cur.execute("SELECT id FROM users WHERE role = 'teacher' ORDER BY id LIMIT 1")
+    teacher = cur.fetchone()
+    if not student or not teacher:
+        raise SystemExit("Needs at least one student and one teacher in the database")
+    conn.rollback()
+
+    print(f"{args.iterations} iterations per route, times per route call\n")
+    print(f"{'route':<40} {'unprepared':>11} {'prepared':>10} {'saved':>9} {'planning':>10}")
+    for route, calls in route_calls(app, student, teacher[0]).items():
+        statements.ENABLED = False
+        time_route(conn, calls, 50)
+        unprepared = time_route(conn, calls, args.iterations)
+        statements.ENABLED = True
+        time_route(conn, calls, 50)
+        prepared = time_route(conn, calls, args.iterations)
+        planning = planning_ms(conn, calls)
+        print(f"{route:<40} {unprepared:8.3f} ms {prepared:7.3f} ms {unprepared - prepared:6.3f} ms {planning:7.3f} ms "
+              f"({(unprepared - prepared) / unprepared * 100:5.1f}%)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Profiling overhead benchmark: times the same admin requests (dashboard stats,
+one student, the student list) in-process through Flask's test client in four
+modes. The modes are profiling unused, a sampling profiler window running,
+every request profiled with X-Profile, and the sampler at a 1 ms interval.
+Prints the median and p99 latency per route and mode. Needs the database
+from app.py's DB_CONFIG.
+
+    python benchmarks/profiling_benchmark.py --requests 300
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+ROUTES = ['/api/dashboard/stats', '/api/students/{student_id}', '/api/students']
+
+
+def timed(client, path, count, headers=None):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        response.get_data()
+        response.close()
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, (path, response.status_code)
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    client = app.app.test_client()
+    client.post('/api/login', json={'username': 'admin', 'password': 'admin123'}).close()
+    conn = app.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM students WHERE tenant_id = %s ORDER BY id LIMIT 1", (app.tenancy.DEFAULT_TENANT_ID,))
+    student_id = cur.fetchone()[0]
+    conn.close()
+    paths = [route.format(student_id=student_id) for route in ROUTES]
+    # The student list is much slower than the others; fewer runs keep the benchmark short
+    counts = [args.requests, args.requests, max(10, args.requests // 10)]
+
+    profile_dir = tempfile.mkdtemp()
+    app.request_profiler.directory = profile_dir
+    app.request_profiler.keep = 5
+    modes = {}
+    try:
+        for path, count in zip(paths, counts):
+            timed(client, path, 5)
+        modes['off'] = [timed(client, path, count) for path, count in zip(paths, counts)]
+
+        app.sampling_profiler.start(3600, 5)
+        modes['sampler 5ms'] = [timed(client, path, count) for path, count in zip(paths, counts)]
+        app.sampling_profiler.stop()
+        samples = app.sampling_profiler.status()['samples']
+
+        modes['X-Profile'] = [timed(client, path, count, headers={'X-Profile': '1'}) for path, count in zip(paths, counts)]
+
+        app.sampling_profiler.start(3600, 1)
+        modes['sampler 1ms'] = [timed(client, path, count) for path, count in zip(paths, counts)]
+        app.sampling_profiler.stop()
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+    print(f"\nMedian / p99 latency in ms ({samples} samples in the 5 ms sampler run)\n")
+    print(f"{'mode':<14}" + ''.join(f"{route:>30}" for route in ROUTES))
+    for mode, results in modes.items():
+        print(f"{mode:<14}" + ''.join(f"{np.median(ms):>19.2f} / {np.percentile(ms, 99):>7.2f}" for ms in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Server benchmark: the Flask development server (`python run.py`) against the
+preloaded gunicorn setup (`python run.py --production`). Each server is started
+on its own port and driven by concurrent logged-in clients for a fixed time.
+Reports requests/sec and latency, and RSS and PSS (RSS with shared pages split
+between the processes sharing them) of every server process. Needs the
+database from app.py's DB_CONFIG.
+
+    python benchmarks/server_benchmark.py --seconds 20 --clients 16
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ['/api/dashboard/stats', '/api/current-user', '/api/analytics/cohorts']
+
+
+def process_tree(pid):
+    """pid plus all of its descendants"""
+    pids = [pid]
+    for child in open(f"/proc/{pid}/task/{pid}/children").read().split():
+        pids += process_tree(int(child))
+    return pids
+
+
+def memory_mib(pid):
+    """(RSS, PSS) of one process from /proc/<pid>/smaps_rollup"""
+    values = {}
+    for line in open(f"/proc/{pid}/smaps_rollup"):
+        parts = line.split()
+        if parts[0] in ('Rss:', 'Pss:'):
+            values[parts[0]] = int(parts[1]) / 1024
+    return values['Rss:'], values['Pss:']
+
+
+def wait_until_up(url, process, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with {process.returncode}")
+        try:
+            requests.get(url + '/api/current-user', timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    raise SystemExit("Server did not come up")
+
+
+def client(url, stop, latencies, errors):
+    session = requests.Session()
+    session.post(url + '/api/login', json={'username': 'admin', 'password': 'admin123'})
+    index = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = session.get(url + PATHS[index % len(PATHS)], timeout=30)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        if error is None:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(error)
+        index += 1
+
+
+def run(label, args, port, seconds, clients):
+    env = dict(os.environ, PORT=str(port), DEBUG='False', WEB_ACCESS_LOG='/dev/null')
+    process = subprocess.Popen([sys.executable, 'run.py'] + args, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(url, process)
+        stop = threading.Event()
+        latencies, errors = [], []
+        threads = [threading.Thread(target=client, args=(url, stop, latencies, errors)) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        memory = [(pid, *memory_mib(pid)) for pid in process_tree(process.pid)]
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies = np.array(latencies) * 1000
+        print(f"\n{label}: {len(latencies) / seconds:8.1f} req/s, p50 {np.percentile(latencies, 50):7.1f} ms, "
+              f"p99 {np.percentile(latencies, 99):7.1f} ms, {len(errors)} errors")
+        for error in sorted(set(errors)):
+            print(f"  {errors.count(error)} x {error}")
+        for pid, rss, pss in memory:
+            role = 'server' if pid == process.pid else 'worker'
+            print(f"  {role:<7} pid {pid:<7} RSS {rss:7.1f} MiB   PSS {pss:7.1f} MiB")
+        print(f"  total PSS {sum(pss for _, _, pss in memory):7.1f} MiB")
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--port', type=int, default=5050)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients for {args.seconds}s against {', '.join(PATHS)}")
+    run('dev server (python run.py)', [], args.port, args.seconds, args.clients)
+    run('gunicorn (python run.py --production)', ['--production'], args.port + 1, args.seconds, args.clients)
+
+
+if __name__ == '__main__':
+    main()
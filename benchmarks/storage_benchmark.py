@@ -0,0 +1,158 @@
+"""
+Storage backend benchmark: runs the same workload against every backend in
+storage.py and prints one comparable table. The workload is bulk and single
+inserts, point reads (one thread and --threads threads), dashboard counts,
+updates and a full student scan. PostgreSQL runs in a throwaway institution
+that is removed afterwards. SQLite runs in a fresh file in a temporary
+directory. Needs the database from app.py's DB_CONFIG for the Postgres half;
+pass --backends sqlite to skip it.
+
+    python benchmarks/storage_benchmark.py --students 50000 --ops 5000 --threads 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+BULK_BATCH = 1000
+
+
+def student_row(index, owner_id):
+    return {
+        'student_id': f"B{index:08d}",
+        'name': f"Student {index}",
+        'email': f"student{index}@example.com",
+        'course': random.choice(['Computer Science', 'Mechanical', 'Commerce', 'Biology']),
+        'semester': random.randint(1, 8),
+        'attendance_percentage': random.uniform(40, 100),
+        'cgpa': random.uniform(4, 10),
+        'assignments_submitted': random.randint(0, 10),
+        'assignments_total': 10,
+        'risk_percentage': random.uniform(0, 100),
+        'risk_level': random.choice(storage.RISK_LEVELS),
+        'owner_user_id': owner_id,
+    }
+
+
+def rate(count, seconds):
+    return f"{count / seconds:12,.0f}/s"
+
+
+def in_threads(threads, work):
+    """Run work(thread_index) in `threads` threads and return the wall time"""
+    started = time.perf_counter()
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def run(backend, tenant_id, students, ops, threads):
+    """{operation: rate} for one backend"""
+    results = {}
+    username = f"bench-{uuid.uuid4().hex[:10]}"
+    owner_id = backend.create_user(tenant_id, username, f"{username}@example.com", 'secret')
+
+    rows = [student_row(i, owner_id) for i in range(students)]
+    started = time.perf_counter()
+    ids = []
+    for start in range(0, students, BULK_BATCH):
+        ids += backend.add_students(tenant_id, rows[start:start + BULK_BATCH])
+    results['bulk insert'] = rate(students, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(ops):
+        ids.append(backend.add_student(tenant_id, student_row(students + i, owner_id)))
+    results['single insert'] = rate(ops, time.perf_counter() - started)
+
+    picks = [random.choice(ids) for _ in range(ops)]
+    started = time.perf_counter()
+    for student_id in picks:
+        backend.get_student(tenant_id, student_id)
+    results['point read'] = rate(ops, time.perf_counter() - started)
+
+    per_thread = ops // threads
+    seconds = in_threads(threads, lambda t: [backend.get_student(tenant_id, student_id)
+                                             for student_id in picks[t * per_thread:(t + 1) * per_thread]])
+    results[f'point read x{threads} threads'] = rate(per_thread * threads, seconds)
+
+    count_ops = max(1, ops // 50)
+    started = time.perf_counter()
+    for _ in range(count_ops):
+        backend.dashboard_counts(tenant_id)
+    results['dashboard counts'] = rate(count_ops, time.perf_counter() - started)
+    started = time.perf_counter()
+    for _ in range(count_ops):
+        backend.dashboard_counts(tenant_id, owner_user_id=owner_id)
+    results['dashboard counts (owner)'] = rate(count_ops, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for student_id in picks:
+        backend.update_student(tenant_id, student_id, {'risk_level': random.choice(storage.RISK_LEVELS)})
+    results['update'] = rate(ops, time.perf_counter() - started)
+
+    seconds = in_threads(threads, lambda t: [
+        backend.update_student(tenant_id, student_id, {'cgpa': random.uniform(4, 10)})
+        for student_id in picks[t * per_thread:(t + 1) * per_thread]])
+    results[f'update x{threads} threads'] = rate(per_thread * threads, seconds)
+
+    started = time.perf_counter()
+    scanned = sum(1 for _ in backend.iter_students(tenant_id))
+    results['full scan (rows)'] = rate(scanned, time.perf_counter() - started)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--backends', default='sqlite,postgres')
+    args = parser.parse_args()
+
+    random.seed(7)
+    columns = {}
+    for kind in args.backends.split(','):
+        if kind == 'sqlite':
+            with tempfile.TemporaryDirectory() as directory:
+                backend = storage.create_backend('sqlite', path=os.path.join(directory, 'bench.sqlite3'))
+                columns[kind] = run(backend, 1, args.students, args.ops, args.threads)
+                backend.close()
+        elif kind == 'postgres':
+            import app
+            import tenancy
+
+            conn = app.database.connect()
+            cur = conn.cursor()
+            slug = f"bench-{uuid.uuid4().hex[:10]}"
+            tenant_id = tenancy.create_tenant(cur, slug, slug)
+            conn.commit()
+            try:
+                columns[kind] = run(storage.create_backend('postgres', database=app.database), tenant_id,
+                                    args.students, args.ops, args.threads)
+            finally:
+                tenancy.drop_tenant(cur, tenant_id)
+                conn.commit()
+                conn.close()
+        else:
+            raise SystemExit(f"Unknown backend: {kind}")
+
+    print(f"\n{args.students} students, {args.ops} operations, {args.threads} threads\n")
+    print(f"{'operation':<28}" + ''.join(f"{kind:>16}" for kind in columns))
+    for operation in next(iter(columns.values())):
+        print(f"{operation:<28}" + ''.join(f"{results[operation]:>16}" for results in columns.values()))
+
+
+if __name__ == '__main__':
+    main()
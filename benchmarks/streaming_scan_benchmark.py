@@ -0,0 +1,114 @@
+"""
+Table scan memory benchmark: peak RSS of a worker that reads a whole
+students-shaped table with cursor.fetchall(), against streaming it through
+db.iter_chunks() on a named server-side cursor. Each measurement runs in a
+fresh process so peak RSS isn't carried over. Needs the database from
+DB_CONFIG; rows go into a scratch table that is dropped afterwards.
+
+    python benchmarks/streaming_scan_benchmark.py --rows 10000 100000 1000000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'database': os.getenv('DB_NAME', 'sehatmind'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'Akash9872'),
+}
+TABLE = 'bench_scan_students'
+
+
+def fill_table(rows):
+    conn = psycopg2.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    # Same shape as a `SELECT *` on students, including the free-text columns
+    cur.execute(f"""
+        CREATE TABLE {TABLE} AS
+        SELECT g AS id, 'SYN' || g AS student_id, 'Student ' || g AS name, 'student' || g || '@example.com' AS email,
+               '9876543210' AS phone, 'Computer Science' AS course, 1 + g %% 8 AS semester,
+               random() * 100 AS attendance_percentage, random() * 10 AS cgpa, (g %% 10) AS assignments_submitted,
+               10 AS assignments_total, g %% 4 AS exam_attempts, random() * 1500000 AS family_income,
+               random() * 10 AS study_hours, random() * 10 AS mental_health_score, random() AS dropout_risk_score,
+               random() * 100 AS risk_percentage, 'medium' AS risk_level,
+               repeat('Counselor note. ', 8) AS counselor_notes, repeat('Plan. ', 8) AS intervention_plan,
+               now() AS created_at, now() AS last_updated
+        FROM generate_series(1, %s) AS g
+    """, (rows,))
+    conn.commit()
+    conn.close()
+
+
+def drop_table():
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.cursor().execute(f"DROP TABLE IF EXISTS {TABLE}")
+    conn.commit()
+    conn.close()
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, fetch_size):
+    """Scan the table once in this process and print: rows, seconds, baseline MiB, peak MiB"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    baseline = peak_rss_mib()
+    started = time.perf_counter()
+    rows = 0
+    if mode == 'fetchall':
+        cur = conn.cursor()
+        cur.execute(f"SELECT * FROM {TABLE}")
+        for row in cur.fetchall():
+            rows += 1
+    else:
+        for chunk in db.iter_chunks(conn, f"SELECT * FROM {TABLE}", fetch_size=fetch_size):
+            rows += len(chunk)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    print(rows, elapsed, baseline, peak_rss_mib())
+
+
+def measure(mode, fetch_size):
+    output = subprocess.run([sys.executable, __file__, '--child', mode, '--fetch-size', str(fetch_size)],
+                            check=True, capture_output=True, text=True).stdout.split()
+    rows, elapsed, baseline, peak = int(output[0]), float(output[1]), float(output[2]), float(output[3])
+    return rows, elapsed, peak - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--fetch-size', type=int, default=db.DB_FETCH_SIZE)
+    parser.add_argument('--child', choices=['fetchall', 'stream'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.fetch_size)
+        return
+
+    print(f"{'rows':>10}  {'fetchall':<27}  iter_chunks (fetch size {args.fetch_size})")
+    try:
+        for rows in args.rows:
+            fill_table(rows)
+            results = [measure(mode, args.fetch_size) for mode in ('fetchall', 'stream')]
+            print(f"{rows:>10}  " + '  '.join(f"{elapsed:7.2f}s {growth:9.1f} MiB peak" for _, elapsed, growth in results))
+    finally:
+        drop_table()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""
+SehatMind - Database connections
+Pooled connections to the primary and to optional read replicas. Connections
+handed out here behave like plain psycopg2 connections, except that close()
+returns them to their pool.
+
+Read-heavy routes may be served by a replica (see DB_REPLICAS). Reads fall
+back to the primary when the replica lags more than DB_MAX_REPLICA_LAG_SECONDS
+or cannot be reached. For DB_STICKY_SECONDS after a user writes, that user's
+reads stay on the primary so they always see their own changes.
+
+Try it locally with a streaming replica on port 5433:
+
+    pg_basebackup -h localhost -p 5432 -U postgres -D /tmp/replica -R
+    pg_ctl -D /tmp/replica -o '-p 5433' start
+    DB_REPLICAS='host=localhost port=5433' python app.py
+
+Every connection has a connect timeout, a server-side statement timeout and TCP
+keepalives, so an unhealthy database costs a request seconds instead of the
+OS TCP timeout. Each pool has a circuit breaker. After DB_BREAKER_THRESHOLD
+consecutive connection failures it opens and requests fail fast with
+DatabaseUnavailable, while a background thread probes the server and closes
+the breaker once it answers again. Idempotent reads run through
+Database.run_read(), which retries transient errors with jittered backoff.
+benchmarks/db_fault_benchmark.py exercises all of this through a local
+fault-injecting TCP proxy.
+"""
+
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Connections inherited from the parent process over fork. Closing them (or letting
+# them be garbage collected) would end the parent's sessions, so they are kept here.
+_inherited = []
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+# Comma-separated libpq connection strings, merged over the primary's settings
+DB_REPLICAS = [dsn.strip() for dsn in os.getenv('DB_REPLICAS', '').split(',') if dsn.strip()]
+DB_MAX_REPLICA_LAG_SECONDS = float(os.getenv('DB_MAX_REPLICA_LAG_SECONDS', 5))
+DB_STICKY_SECONDS = float(os.getenv('DB_STICKY_SECONDS', 5))
+# Rows pulled per round trip by server-side cursors in table-wide scans
+DB_FETCH_SIZE = int(os.getenv('DB_FETCH_SIZE', 2000))
+# How long a measured replica lag is trusted before it is checked again
+LAG_CHECK_SECONDS = 1.0
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 3))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+# Retries of idempotent reads after transient errors, backing off from DB_RETRY_BASE_MS with full jitter
+DB_READ_RETRIES = int(os.getenv('DB_READ_RETRIES', 2))
+DB_RETRY_BASE_MS = float(os.getenv('DB_RETRY_BASE_MS', 50))
+DB_RETRY_MAX_MS = 1000
+DB_CIRCUIT_BREAKER = os.getenv('DB_CIRCUIT_BREAKER', 'true').lower() == 'true'
+DB_BREAKER_THRESHOLD = int(os.getenv('DB_BREAKER_THRESHOLD', 5))
+DB_BREAKER_PROBE_SECONDS = float(os.getenv('DB_BREAKER_PROBE_SECONDS', 2))
+
+# Applied to every connection unless the caller's config sets them
+CONNECTION_DEFAULTS = {
+    'connect_timeout': DB_CONNECT_TIMEOUT,
+    'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+    # Notice a dead server on an idle pooled connection within about a minute
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
+# SQLSTATEs worth retrying: serialization failures, deadlocks, server shutdown/startup, connection exceptions
+TRANSIENT_SQLSTATES = {'40001', '40P01', '57P01', '57P02', '57P03', '08000', '08001', '08003', '08004', '08006'}
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class DatabaseUnavailable(psycopg2.OperationalError):
+    """The database could not be reached, or its circuit breaker is open"""
+
+    def __init__(self, message, retry_after=DB_BREAKER_PROBE_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_transient(error):
+    """Whether a failed idempotent read is worth retrying on a fresh connection"""
+    if isinstance(error, (DatabaseUnavailable, psycopg2.extensions.QueryCanceledError)):
+        # The breaker already tracks unreachable servers, and a statement timeout would only time out again
+        return False
+    if error.pgcode in TRANSIENT_SQLSTATES:
+        return True
+    # Lost connections ("server closed the connection unexpectedly") carry no SQLSTATE
+    return error.pgcode is None and isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; a background thread calls `probe` until it succeeds"""
+
+    def __init__(self, name, probe, threshold=DB_BREAKER_THRESHOLD, probe_interval=DB_BREAKER_PROBE_SECONDS,
+                 enabled=DB_CIRCUIT_BREAKER):
+        self.name = name
+        self.probe = probe
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.is_open = False
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self.last_error = None
+
+    def check(self):
+        """Raise DatabaseUnavailable without touching the network while the breaker is open"""
+        if self.is_open:
+            with self._lock:
+                self.rejected += 1
+            raise DatabaseUnavailable(f"Database {self.name} unavailable (circuit open)", self.probe_interval)
+
+    def record_success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error).strip()
+            if not self.enabled or self.is_open or self.failures < self.threshold:
+                return
+            self.is_open = True
+            self.opened_at = time.time()
+            self.trips += 1
+        logger.error("Database %s circuit opened after %s failures: %s", self.name, self.failures, self.last_error)
+        threading.Thread(target=self._probe_until_healthy, name=f"db-probe-{self.name}", daemon=True).start()
+
+    def _probe_until_healthy(self):
+        while self.is_open:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+            except psycopg2.Error as e:
+                self.last_error = str(e).strip()
+                continue
+            with self._lock:
+                self.is_open = False
+                self.failures = 0
+            logger.info("Database %s reachable again, circuit closed", self.name)
+
+    def reset(self):
+        """Forget the state inherited over fork; the probe thread did not survive it"""
+        self._lock = threading.Lock()
+        self.is_open = False
+        self.failures = 0
+
+    def stats(self):
+        return {
+            'state': 'open' if self.is_open else 'closed',
+            'consecutive_failures': self.failures,
+            'opened_at': self.opened_at,
+            'trips': self.trips,
+            'rejected': self.rejected,
+            'last_error': self.last_error,
+        }
+
+
+_scan_cursor_ids = itertools.count(1)
+
+
+def iter_chunks(conn, sql, params=None, fetch_size=None):
+    """Run `sql` on a named server-side cursor and yield its rows in lists of at most `fetch_size`.
+
+    Only one chunk is held in memory at a time, however large the result. The
+    cursor lives inside the connection's current transaction, so other
+    statements (e.g. updates of the scanned rows) can run on the same
+    connection between chunks, but the transaction must not be committed
+    before the scan is finished.
+    """
+    fetch_size = fetch_size or DB_FETCH_SIZE
+    cur = conn.cursor(name=f"scan_{next(_scan_cursor_ids)}")
+    cur.itersize = fetch_size
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        try:
+            cur.close()
+        except psycopg2.Error:
+            # The transaction already ended, and the server dropped the cursor with it
+            pass
+
+
+class PooledConnection:
+    """psycopg2 connection whose close() hands it back to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._custom_timeout = False
+
+    def set_statement_timeout(self, milliseconds):
+        """Override the statement timeout (0 disables it) until the connection goes back to the pool"""
+        cur = self._conn.cursor()
+        cur.execute("SET statement_timeout = %s", (int(milliseconds),))
+        cur.close()
+        self._conn.commit()
+        self._custom_timeout = True
+
+    def __getattr__(self, name):
+        if name in ('_pool', '_conn', '_custom_timeout'):
+            raise AttributeError(name)
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in ('_pool', '_conn', '_custom_timeout'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.put(conn, self._custom_timeout)
+
+    def __del__(self):
+        # Routes that return early without closing still give the connection back
+        self.close()
+
+
+class ConnectionPool:
+    """Keeps up to `size` idle connections; more may be opened under load and are closed on return"""
+
+    def __init__(self, name, config, size=DB_POOL_SIZE):
+        self.name = name
+        self.config = config
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.breaker = CircuitBreaker(name, self._probe)
+
+    def _probe(self):
+        conn = psycopg2.connect(**self.config)
+        try:
+            conn.cursor().execute("SELECT 1")
+        finally:
+            conn.close()
+
+    def get(self):
+        self.breaker.check()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's sockets are not ours to use
+                _inherited.extend(self._idle)
+                self._idle, self._pid = [], os.getpid()
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    return PooledConnection(self, conn)
+        try:
+            conn = psycopg2.connect(**self.config)
+        except psycopg2.OperationalError as e:
+            self.breaker.record_failure(e)
+            raise DatabaseUnavailable(f"Database {self.name} unavailable: {str(e).strip()}") from e
+        self.breaker.record_success()
+        return PooledConnection(self, conn)
+
+    def put(self, conn, reset_timeout=False):
+        if conn.closed:
+            if conn.closed == 2:
+                # Broken by a lost server, not closed by us
+                self.breaker.record_failure(psycopg2.OperationalError("connection lost"))
+            return
+        if self._pid != os.getpid():
+            _inherited.append(conn)
+            return
+        try:
+            # Leave nothing from the previous user behind
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if reset_timeout:
+                cur = conn.cursor()
+                cur.execute("RESET statement_timeout")
+                cur.close()
+                conn.commit()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        """Close every idle connection (e.g. after forking, or on shutdown)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            forked, self._pid = self._pid != os.getpid(), os.getpid()
+        if forked:
+            _inherited.extend(idle)
+            self.breaker.reset()
+            return
+        for conn in idle:
+            if not conn.closed:
+                conn.close()
+
+
+class ReplicaPool(ConnectionPool):
+    """Connection pool for a replica that tracks its replication lag"""
+
+    def __init__(self, name, config, size=DB_POOL_SIZE):
+        super().__init__(name, config, size)
+        self.lag = 0.0
+        self.checked_at = 0.0
+        self.healthy = True
+
+    def current_lag(self):
+        """Replication lag in seconds, re-measured at most every LAG_CHECK_SECONDS"""
+        if time.monotonic() - self.checked_at < LAG_CHECK_SECONDS:
+            return self.lag if self.healthy else None
+        self.checked_at = time.monotonic()
+        try:
+            conn = self.get()
+            cur = conn.cursor()
+            cur.execute(REPLICA_LAG_SQL)
+            self.lag = float(cur.fetchone()[0] or 0)
+            cur.close()
+            conn.close()
+            self.healthy = True
+            return self.lag
+        except psycopg2.Error as e:
+            if self.healthy:
+                logger.warning("Read replica %s unavailable, reading from the primary: %s", self.name, e)
+            self.healthy = False
+            return None
+
+
+class Database:
+    """Primary pool plus round-robin replica pools with lag-aware routing"""
+
+    def __init__(self, config, replicas=(), max_lag=DB_MAX_REPLICA_LAG_SECONDS):
+        config = dict(CONNECTION_DEFAULTS, **config)
+        self.primary = ConnectionPool('primary', config)
+        self.replicas = [ReplicaPool(dsn, dict(config, **psycopg2.extensions.parse_dsn(dsn))) for dsn in replicas]
+        self.max_lag = max_lag
+        self._next_replica = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._cycle_lock = threading.Lock()
+        self.reads = {'primary': 0, 'replica': 0, 'fallback': 0}
+        self.retries = 0
+
+    def connect(self, read_only=False):
+        """Connection to a healthy replica for read-only work, otherwise to the primary"""
+        if read_only and self.replicas:
+            for _ in range(len(self.replicas)):
+                with self._cycle_lock:
+                    replica = self.replicas[next(self._next_replica)]
+                lag = replica.current_lag()
+                if lag is None or lag > self.max_lag:
+                    continue
+                try:
+                    conn = replica.get()
+                    self.reads['replica'] += 1
+                    return conn
+                except psycopg2.Error as e:
+                    replica.healthy = False
+                    logger.warning("Read replica %s connection failed: %s", replica.name, e)
+            self.reads['fallback'] += 1
+        elif read_only:
+            self.reads['primary'] += 1
+        return self.primary.get()
+
+    def run_read(self, read, read_only=False, retries=DB_READ_RETRIES):
+        """Return `read(conn)` for an idempotent read, retrying transient errors on a fresh connection.
+
+        Backoff is exponential from DB_RETRY_BASE_MS with full jitter, so
+        requests that failed together don't all retry at the same moment.
+        """
+        for attempt in itertools.count():
+            conn = self.connect(read_only)
+            pool = conn._pool
+            try:
+                return read(conn)
+            except psycopg2.Error as e:
+                if attempt >= retries or not is_transient(e):
+                    raise
+                if conn.closed:
+                    # The other idle connections to that server are most likely dead too
+                    pool.clear()
+                self.retries += 1
+                delay = random.uniform(0, min(DB_RETRY_MAX_MS, DB_RETRY_BASE_MS * 2 ** attempt)) / 1000
+                logger.warning("Retrying read in %.0f ms after transient error: %s", delay * 1000, str(e).strip())
+                time.sleep(delay)
+            finally:
+                conn.close()
+
+    def reset(self):
+        """Drop pooled connections; call in each worker after forking"""
+        for pool in [self.primary] + self.replicas:
+            pool.clear()
+
+    def stats(self):
+        return {
+            'reads': dict(self.reads),
+            'read_retries': self.retries,
+            'primary': {'circuit': self.primary.breaker.stats()},
+            'replicas': [{'name': replica.name, 'healthy': replica.healthy, 'lag_seconds': round(replica.lag, 3),
+                          'circuit': replica.breaker.stats()}
+                         for replica in self.replicas],
+            'max_lag_seconds': self.max_lag,
+        }
@@ -0,0 +1,204 @@
+"""
+SehatMind - Duplicate student detection
+Every student row carries two blocking keys in indexed columns. email_key is
+the normalized email (lowercase, "+tag" dropped, Gmail dots removed).
+name_key is the Soundex codes of the name's words in sorted order plus the
+normalized course, so "Asha Verma, CS" and "Aasha Varma, cs" share a key.
+
+A new student only ever gets compared with the students that share one of
+its keys. These are found with one indexed lookup per batch, so a CSV import
+of N rows costs O(N) lookups however large the table is, and students are
+never compared pairwise across the table. Matches are reported as
+candidates, and merge_students() folds a confirmed duplicate into the
+student being kept.
+"""
+
+import logging
+import re
+import unicodedata
+
+from psycopg2.extras import execute_values
+
+import archive
+import db
+
+logger = logging.getLogger(__name__)
+
+# Candidates reported per student; a huge block means a too-common key, not more useful matches
+MAX_CANDIDATES = 10
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+
+_SOUNDEX_DIGITS = {letter: digit for digit, letters in
+                   {'1': 'bfpv', '2': 'cgjkqsxz', '3': 'dt', '4': 'l', '5': 'mn', '6': 'r'}.items()
+                   for letter in letters}
+
+# Columns a merge fills in on the kept student when it has no value of its own
+MERGE_FILL_COLUMNS = ['phone', 'course', 'semester', 'attendance_percentage', 'cgpa', 'assignments_submitted',
+                      'assignments_total', 'exam_attempts', 'family_income', 'study_hours', 'mental_health_score',
+                      'owner_user_id', 'teacher_id', 'teacher_name']
+# Free-text columns a merge concatenates
+MERGE_TEXT_COLUMNS = ['counselor_notes', 'intervention_plan']
+
+
+def normalize_email(email):
+    if not email or '@' not in email:
+        return None
+    local, domain = email.strip().lower().rsplit('@', 1)
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), GMAIL_DOMAINS[0]
+    return f"{local}@{domain}" if local and domain else None
+
+
+def soundex(word):
+    """American Soundex code of one word, e.g. 'Robert' -> 'R163'"""
+    letters = ''.join(c for c in unicodedata.normalize('NFKD', word.lower()) if 'a' <= c <= 'z')
+    if not letters:
+        return ''
+    code, last = letters[0].upper(), _SOUNDEX_DIGITS.get(letters[0])
+    for letter in letters[1:]:
+        digit = _SOUNDEX_DIGITS.get(letter)
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code, vowels do
+        if letter not in 'hw':
+            last = digit
+    return code.ljust(4, '0')
+
+
+def name_key(name, course):
+    codes = sorted(filter(None, (soundex(word) for word in re.split(r'[\s.,\-]+', name or ''))))
+    if not codes:
+        return None
+    return f"{' '.join(codes)}|{' '.join((course or '').lower().split())}"
+
+
+def blocking_keys(name, email, course):
+    """(email_key, name_key) for a student"""
+    return normalize_email(email), name_key(name, course)
+
+
+def init_dedup(cur):
+    """Add the key columns and their indexes, and fill them in for existing students"""
+    cur.execute("ALTER TABLE students ADD COLUMN IF NOT EXISTS email_key VARCHAR(120)")
+    cur.execute("ALTER TABLE students ADD COLUMN IF NOT EXISTS name_key VARCHAR(200)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_students_email_key ON students (tenant_id, email_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_students_name_key ON students (tenant_id, name_key)")
+
+    backfilled = 0
+    for chunk in db.iter_chunks(cur.connection, """
+        SELECT tenant_id, id, name, email, course FROM students WHERE email_key IS NULL AND name_key IS NULL
+    """):
+        execute_values(cur, """
+            UPDATE students s SET email_key = v.email_key, name_key = v.name_key
+            FROM (VALUES %s) AS v (tenant_id, id, email_key, name_key)
+            WHERE s.tenant_id = v.tenant_id AND s.id = v.id
+        """, [(tenant_id, student_id) + blocking_keys(name, email, course)
+              for tenant_id, student_id, name, email, course in chunk], page_size=len(chunk))
+        backfilled += len(chunk)
+    if backfilled:
+        logger.info("Computed duplicate detection keys for %s students", backfilled)
+
+
+def find_duplicates(cur, tenant_id, students, exclude_ids=()):
+    """Likely duplicates of each dict in `students` (name, email, course), in one indexed lookup.
+
+    Returns one list per input student. Each entry is an existing student
+    ({'id', 'student_id', 'name', 'course', 'match'}) or an earlier row of the
+    same batch ({'row': index, 'match'}). `match` says which keys matched
+    ('email', 'name'). Students in `exclude_ids` are never reported.
+    """
+    keys = [blocking_keys(student.get('name'), student.get('email'), student.get('course')) for student in students]
+    email_keys = sorted({email_key for email_key, _ in keys if email_key})
+    name_keys = sorted({key for _, key in keys if key})
+    existing = {}
+    if email_keys or name_keys:
+        cur.execute("""
+            SELECT id, student_id, name, course, email_key, name_key FROM students
+            WHERE tenant_id = %s AND (email_key = ANY(%s) OR name_key = ANY(%s))
+            ORDER BY id
+        """, (tenant_id, email_keys, name_keys))
+        excluded = set(exclude_ids)
+        for student_id, external_id, name, course, email_key, key in cur.fetchall():
+            if student_id in excluded:
+                continue
+            row = {'id': student_id, 'student_id': external_id, 'name': name, 'course': course}
+            existing.setdefault(('email', email_key), []).append(row)
+            existing.setdefault(('name', key), []).append(row)
+
+    results = []
+    seen = {}
+    for index, (email_key, key) in enumerate(keys):
+        matches = {}
+        for kind, value in (('email', email_key), ('name', key)):
+            if value is None:
+                continue
+            for row in existing.get((kind, value), []):
+                matches.setdefault(('id', row['id']), dict(row, match=[]))['match'].append(kind)
+            if (kind, value) in seen:
+                matches.setdefault(('row', seen[kind, value]), {'row': seen[kind, value], 'match': []})['match'].append(kind)
+            else:
+                seen[kind, value] = index
+        results.append(list(matches.values())[:MAX_CANDIDATES])
+    return results
+
+
+def duplicate_groups(cur, tenant_id, limit=200):
+    """Groups of existing students sharing a key, found by grouping on the indexed keys"""
+    cur.execute("""
+        SELECT 'email' AS match, array_agg(id ORDER BY id) FROM students
+        WHERE tenant_id = %s AND email_key IS NOT NULL GROUP BY email_key HAVING count(*) > 1
+        UNION ALL
+        SELECT 'name', array_agg(id ORDER BY id) FROM students
+        WHERE tenant_id = %s AND name_key IS NOT NULL GROUP BY name_key HAVING count(*) > 1
+        ORDER BY 2
+        LIMIT %s
+    """, (tenant_id, tenant_id, limit))
+    return [{'match': match, 'student_ids': ids} for match, ids in cur.fetchall()]
+
+
+def merge_students(cur, tenant_id, keep_id, duplicate_id, owner_user_id=None):
+    """Fold `duplicate_id` into `keep_id`: fill gaps, join notes, move risk history, delete the duplicate.
+
+    The duplicate's own student login goes with it unless it still owns the
+    kept student. Returns (changes, removed login id or None), where changes
+    is (tenant_id, owner_user_id, course, semester) of both students as they
+    were before the merge, or None (and changes nothing) if either doesn't
+    exist or, with `owner_user_id`, isn't owned by that user. The caller
+    rescores the kept student in the same transaction.
+    """
+    cur.execute("""
+        SELECT id, owner_user_id, course, semester FROM students
+        WHERE tenant_id = %s AND id IN (%s, %s) AND (%s::int IS NULL OR owner_user_id = %s)
+        ORDER BY id FOR UPDATE
+    """, (tenant_id, keep_id, duplicate_id, owner_user_id, owner_user_id))
+    rows = cur.fetchall()
+    if len(rows) != 2:
+        return None
+
+    fills = ', '.join(f"{column} = COALESCE(k.{column}, d.{column})" for column in MERGE_FILL_COLUMNS)
+    texts = ', '.join(f"""{column} = CASE
+                WHEN k.{column} IS NULL OR k.{column} = '' THEN d.{column}
+                WHEN d.{column} IS NULL OR d.{column} = '' OR d.{column} = k.{column} THEN k.{column}
+                ELSE k.{column} || E'\\n' || d.{column} END""" for column in MERGE_TEXT_COLUMNS)
+    cur.execute(f"""
+        UPDATE students k SET {fills}, {texts}, last_updated = CURRENT_TIMESTAMP
+        FROM students d
+        WHERE k.tenant_id = %s AND k.id = %s AND d.tenant_id = %s AND d.id = %s
+    """, (tenant_id, keep_id, tenant_id, duplicate_id))
+    cur.execute("UPDATE student_risk_history SET student_id = %s WHERE student_id = %s", (keep_id, duplicate_id))
+    # Alerts already queued for the kept student stand; the duplicate's would repeat them
+    cur.execute("DELETE FROM notification_outbox WHERE student_id = %s AND status = 'pending'", (duplicate_id,))
+    cur.execute("DELETE FROM students WHERE tenant_id = %s AND id = %s", (tenant_id, duplicate_id))
+    # Staff-added students get a login of their own (see the add student route), which owns the row
+    duplicate_owner = next(owner for student_id, owner, _, _ in rows if student_id == duplicate_id)
+    cur.execute(f"""
+        DELETE FROM users u WHERE u.tenant_id = %s AND u.id = %s AND u.role = 'student'
+          AND NOT EXISTS (SELECT 1 FROM students s WHERE s.tenant_id = %s AND s.owner_user_id = u.id)
+          AND NOT EXISTS (SELECT 1 FROM {archive.ARCHIVE_TABLE} a WHERE a.tenant_id = %s AND a.owner_user_id = u.id)
+        RETURNING u.id
+    """, (tenant_id, duplicate_owner, tenant_id, tenant_id))
+    removed = cur.fetchone()
+    return [(tenant_id, owner, course, semester) for _, owner, course, semester in rows], removed and removed[0]
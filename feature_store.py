@@ -0,0 +1,302 @@
+"""
+SehatMind - Feature store
+Columnar snapshot of the model's student features: one float32 matrix and an
+id column, memory-mapped from disk and refreshed incrementally from rows whose
+`last_updated` moved since the last refresh. Training, scoring and simulation
+read slices of the mapped matrix instead of rebuilding DataFrames from rows.
+
+Deleted students are tombstoned and swap-removed on the next refresh, so the
+live rows always form one contiguous block. Several worker processes can share
+the same directory; writers serialize on a lock file.
+
+Rebuild the snapshot from scratch:
+
+    python feature_store.py --rebuild
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = os.getenv('FEATURE_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_store'))
+# Re-read rows changed this long before the watermark, covering transactions that committed late
+REFRESH_OVERLAP = timedelta(seconds=int(os.getenv('FEATURE_STORE_OVERLAP_SECONDS', 300)))
+# How often the store's ids are checked against the table to catch deletes made by other processes
+RECONCILE_SECONDS = int(os.getenv('FEATURE_STORE_RECONCILE_SECONDS', 300))
+FETCH_ROWS = 50000
+INITIAL_CAPACITY = 1024
+
+
+class FeatureStore:
+    """Memory-mapped (students x features) float32 matrix kept in sync with the students table"""
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = list(columns)
+        self.rows = 0
+        self.capacity = 0
+        self.layout = 0
+        self.watermark = None
+        self.reconciled_at = 0.0
+        self._features = None
+        self._ids = None
+        self._row_of = np.full(0, -1, dtype=np.int64)
+        self._tombstones = set()
+        self._lock = threading.RLock()
+
+    # Files
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json')) as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get('columns') == self.columns else None
+
+    def _write_meta(self):
+        self._features.flush()
+        self._ids.flush()
+        meta = {
+            'columns': self.columns,
+            'rows': self.rows,
+            'capacity': self.capacity,
+            'layout': self.layout,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+            'reconciled_at': self.reconciled_at,
+        }
+        temp_path = self._path(f"meta.json.{os.getpid()}.tmp")
+        with open(temp_path, 'w') as handle:
+            json.dump(meta, handle)
+        os.replace(temp_path, self._path('meta.json'))
+
+    def _map(self, capacity):
+        """(Re)open the memory maps, growing the files to `capacity` rows if needed"""
+        self._features = self._ids = None
+        for name, row_bytes in (('features.f32', 4 * len(self.columns)), ('ids.i64', 8)):
+            path = self._path(name)
+            with open(path, 'ab') as handle:
+                if handle.tell() < capacity * row_bytes:
+                    handle.truncate(capacity * row_bytes)
+        self._features = np.memmap(self._path('features.f32'), dtype=np.float32, mode='r+',
+                                   shape=(capacity, len(self.columns)))
+        self._ids = np.memmap(self._path('ids.i64'), dtype=np.int64, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def _rebuild_index(self, start=0):
+        ids = self._ids[start:self.rows]
+        if start == 0:
+            self._row_of = np.full(0, -1, dtype=np.int64)
+        if len(ids):
+            self._ensure_index(int(ids.max()))
+            self._row_of[ids] = np.arange(start, self.rows)
+
+    def _ensure_index(self, max_id):
+        if max_id >= len(self._row_of):
+            grown = np.full(max(max_id + 1, 2 * len(self._row_of)), -1, dtype=np.int64)
+            grown[:len(self._row_of)] = self._row_of
+            self._row_of = grown
+
+    def _sync(self):
+        """Pick up changes other processes wrote since we last looked"""
+        meta = self._read_meta()
+        if meta is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.rows, self.layout, self.watermark, self.reconciled_at = 0, 0, None, 0.0
+            self._map(INITIAL_CAPACITY)
+            self._rebuild_index()
+            return False
+
+        if self._features is None or meta['capacity'] != self.capacity or meta['layout'] != self.layout:
+            self._map(meta['capacity'])
+            self.rows, self.layout = meta['rows'], meta['layout']
+            self._rebuild_index()
+        elif meta['rows'] != self.rows:
+            previous, self.rows = self.rows, meta['rows']
+            self._rebuild_index(previous)
+        self.watermark = datetime.fromisoformat(meta['watermark']) if meta['watermark'] else None
+        self.reconciled_at = meta['reconciled_at']
+        return True
+
+    # Writes
+
+    def _upsert(self, ids, X):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._ensure_index(int(ids.max()))
+        rows = self._row_of[ids]
+        new = rows < 0
+        if new.any():
+            # Duplicate ids within one batch keep their last values
+            new_ids = np.unique(ids[new])
+            needed = self.rows + len(new_ids)
+            if needed > self.capacity:
+                capacity = self.capacity
+                while capacity < needed:
+                    capacity *= 2
+                self._map(capacity)
+                self.layout += 1
+            self._ids[self.rows:needed] = new_ids
+            self._row_of[new_ids] = np.arange(self.rows, needed)
+            self.rows = needed
+            rows = self._row_of[ids]
+        self._features[rows] = X
+
+    def _remove(self, ids):
+        """Swap-remove rows so the live rows stay contiguous"""
+        removed = 0
+        for student_id in ids:
+            if student_id >= len(self._row_of) or self._row_of[student_id] < 0:
+                continue
+            row = self._row_of[student_id]
+            last = self.rows - 1
+            if row != last:
+                moved = self._ids[last]
+                self._features[row] = self._features[last]
+                self._ids[row] = moved
+                self._row_of[moved] = row
+            self._row_of[student_id] = -1
+            self.rows -= 1
+            removed += 1
+        if removed:
+            self.layout += 1
+        return removed
+
+    def _load(self, cur, where_sql='TRUE', params=()):
+        """Copy matching students into the store; returns (rows loaded, newest last_updated)"""
+        column_sql = ', '.join(self.columns)
+        loaded = 0
+        newest = None
+        # Server-side cursor, so a full build never holds the whole table client-side
+        for chunk in db.iter_chunks(cur.connection, f"SELECT id, {column_sql}, last_updated FROM students WHERE {where_sql}",
+                                    list(params), FETCH_ROWS):
+            # NULL features become 0, as the model has always been trained with fillna(0)
+            values = np.array([row[1:-1] for row in chunk], dtype=np.float64)
+            self._upsert([row[0] for row in chunk], np.nan_to_num(values, nan=0.0).astype(np.float32))
+            stamps = [row[-1] for row in chunk if row[-1] is not None]
+            if stamps:
+                newest = max([newest] + stamps) if newest else max(stamps)
+            loaded += len(chunk)
+        return loaded, newest
+
+    def _reconcile(self, cur):
+        """Tombstone ids no longer in the table and load rows the incremental refresh missed"""
+        table_ids = np.concatenate([np.fromiter((row[0] for row in chunk), dtype=np.int64)
+                                    for chunk in db.iter_chunks(cur.connection, "SELECT id FROM students", None, FETCH_ROWS)]
+                                   or [np.empty(0, dtype=np.int64)])
+        stored_ids = np.asarray(self._ids[:self.rows])
+        self._remove(np.setdiff1d(stored_ids, table_ids).tolist())
+        missing = np.setdiff1d(table_ids, stored_ids)
+        if len(missing):
+            self._load(cur, "id = ANY(%s)", [missing.tolist()])
+        self.reconciled_at = time.time()
+
+    def refresh(self, cur, full=False):
+        """Bring the snapshot up to date with the students table; cheap when nothing changed"""
+        with self._lock, _FileLock(self._path('store.lock'), self.directory):
+            synced = self._sync()
+            before = (self.rows, self.layout, self.watermark, self.reconciled_at)
+            if full or not synced:
+                self.rows, self.layout, self.watermark = 0, self.layout + 1, None
+                self._row_of = np.full(0, -1, dtype=np.int64)
+                loaded, self.watermark = self._load(cur)
+                self.reconciled_at = time.time()
+                logger.info("Built feature store with %s students", loaded)
+            else:
+                if self._tombstones:
+                    self._remove(sorted(self._tombstones))
+                if self.watermark is not None:
+                    _, newest = self._load(cur, "last_updated > %s", [self.watermark - REFRESH_OVERLAP])
+                    if newest and newest > self.watermark:
+                        self.watermark = newest
+                if self.watermark is None or time.time() - self.reconciled_at > RECONCILE_SECONDS:
+                    self._reconcile(cur)
+            self._tombstones.clear()
+            if full or not synced or before != (self.rows, self.layout, self.watermark, self.reconciled_at):
+                self._write_meta()
+
+    def mark_deleted(self, student_ids):
+        """Tombstone deleted students; their rows are dropped on the next refresh"""
+        with self._lock:
+            self._tombstones.update(int(student_id) for student_id in student_ids)
+
+    # Reads
+
+    def matrix(self):
+        """(ids, X) copies of every stored row; call refresh() first to apply deletes.
+
+        Synced and copied under both locks: a refresh in this or another process
+        swap-moves rows in place, which would shift them under a caller still
+        training on a view, or under a row index read before the move.
+        """
+        with self._lock, _FileLock(self._path('store.lock'), self.directory):
+            self._sync()
+            return np.array(self._ids[:self.rows]), np.array(self._features[:self.rows])
+
+    def rows_for(self, student_ids):
+        """(ids, X) copies for the given students that are in the store, in the order given.
+
+        Looked up under both locks like matrix(), after picking up any rows
+        another process moved since this one last synced.
+        """
+        with self._lock, _FileLock(self._path('store.lock'), self.directory):
+            self._sync()
+            ids = np.asarray(student_ids, dtype=np.int64)
+            ids = ids[(ids < len(self._row_of)) & ~np.isin(ids, list(self._tombstones))]
+            rows = self._row_of[ids]
+            found = rows >= 0
+            return ids[found], self._features[rows[found]]
+
+
+class _FileLock:
+    """Exclusive lock on a file shared by every process using the store directory"""
+
+    def __init__(self, path, directory):
+        self.path = path
+        self.directory = directory
+        self._handle = None
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._handle = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+        self._handle.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SehatMind feature store maintenance')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the snapshot from scratch')
+    args = parser.parse_args()
+
+    from app import get_db_connection, DropoutPredictor
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("Failed to connect to database")
+    store = FeatureStore(FEATURE_STORE_DIR, DropoutPredictor.FEATURE_COLUMNS)
+    started = time.time()
+    store.refresh(conn.cursor(), full=args.rebuild)
+    conn.close()
+    print(f"Feature store holds {store.rows} students ({time.time() - started:.2f}s)")
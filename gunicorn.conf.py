@@ -0,0 +1,96 @@
+"""
+SehatMind - gunicorn configuration for production
+
+    gunicorn -c gunicorn.conf.py        # or: python run.py --production
+
+The app, the trained model and the feature store are loaded once in the
+master (preload_app). Migrations and the startup risk recalculation run there
+too, once per deployment, and the heap is frozen before workers are forked so
+the garbage collector doesn't dirty the shared pages. Workers then share all
+of it copy-on-write and only open their own database connections.
+
+The master also starts the alert dispatcher (python notifications.py) as a
+child process and stops it on shutdown. Set NOTIFY_DISPATCHER_PROCESS=false
+when the dispatcher runs somewhere else.
+"""
+
+import gc
+import multiprocessing
+import os
+import subprocess
+import sys
+
+CORES = multiprocessing.cpu_count()
+# Every worker thread can hold a database connection, so workers x threads has to fit in Postgres'
+# max_connections (100 by default) with room left for the master, the alert dispatcher and maintenance scripts
+DB_CONNECTION_BUDGET = int(os.getenv('DB_CONNECTION_BUDGET', 80))
+
+wsgi_app = 'app:app'
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+
+# Threads cover time spent waiting on the database; one process per core covers CPU-bound scoring
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_WORKERS', CORES))
+threads = int(os.getenv('WEB_THREADS', max(1, min(8, DB_CONNECTION_BUDGET // workers))))
+if workers * threads > DB_CONNECTION_BUDGET:
+    print(f"WEB_WORKERS x WEB_THREADS = {workers * threads} concurrent requests can open more database "
+          f"connections than DB_CONNECTION_BUDGET ({DB_CONNECTION_BUDGET})", file=sys.stderr)
+# admission.py sizes its per-class budgets from this; a queued heavy request holds a thread
+os.environ.setdefault('WEB_THREADS', str(threads))
+# Each worker keeps up to this many idle connections, one per thread is enough
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+# Share the cores between the workers' report rendering pools instead of giving each worker cores // 2
+os.environ.setdefault('REPORT_WORKERS', str(max(1, CORES // workers)))
+
+# Recycle workers to contain slow leaks; the jitter keeps them from restarting all at once
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = max(1, max_requests // 10)
+
+# predict-risk over a large institution can take a while
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# One dispatcher for the whole server, so NOTIFY_RATE_PER_MINUTE holds however many workers there are
+NOTIFY_DISPATCHER_PROCESS = os.getenv('NOTIFY_DISPATCHER_PROCESS', 'True').lower() == 'true'
+NOTIFICATIONS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'notifications.py')
+_dispatcher = None
+
+preload_app = True
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded and before any worker is forked"""
+    import app
+
+    app.run_startup_tasks()
+    # Connections opened in the master must not be shared with the workers
+    app.database.reset()
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Startup tasks done, forking {workers} workers x {threads} threads")
+
+    global _dispatcher
+    if NOTIFY_DISPATCHER_PROCESS:
+        _dispatcher = subprocess.Popen([sys.executable, NOTIFICATIONS_SCRIPT])
+        server.log.info(f"Notification dispatcher started (pid {_dispatcher.pid})")
+
+
+def post_fork(server, worker):
+    import app
+
+    # Sockets, locks and threads from the master are not usable in the worker
+    app.database.reset()
+    app.inference_scheduler.after_fork()
+    app.log_pipeline.after_fork()
+
+
+def on_exit(server):
+    if _dispatcher is not None and _dispatcher.poll() is None:
+        _dispatcher.terminate()
+        try:
+            _dispatcher.wait(graceful_timeout)
+        except subprocess.TimeoutExpired:
+            _dispatcher.kill()
@@ -0,0 +1,158 @@
+"""
+SehatMind - Micro-batching inference scheduler
+Scoring calls from concurrent requests are queued and coalesced into one
+model call per micro-batch. A batch closes when it holds `max_batch_rows` rows
+or when its oldest request has waited `max_wait_ms`, trading a few
+milliseconds of latency for far fewer model invocations under load.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ROWS = int(os.getenv('INFERENCE_MAX_BATCH_ROWS', 256))
+MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 2))
+# Histogram buckets (upper bounds, in rows) for the batch size metric
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class InferenceScheduler:
+    """Coalesces concurrent `predict_matrix` calls on `predictor` into micro-batches.
+
+    Exposes the predictor's FEATURE_COLUMNS and predict_matrix, so it can be
+    passed anywhere a DropoutPredictor is expected.
+    """
+
+    def __init__(self, predictor, max_batch_rows=MAX_BATCH_ROWS, max_wait_ms=MAX_WAIT_MS):
+        self.predictor = predictor
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self._queue = deque()
+        self._queued_rows = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._rows = 0
+        self._direct_calls = 0
+        self._wait_seconds = 0.0
+        self._max_queue_depth = 0
+        self._batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def after_fork(self):
+        """Drop the parent's queue, locks and thread; call in a worker process right after fork"""
+        self._queue = deque()
+        self._queued_rows = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._metrics_lock = threading.Lock()
+
+    @property
+    def FEATURE_COLUMNS(self):
+        return self.predictor.FEATURE_COLUMNS
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+            self._thread.start()
+
+    def submit(self, X):
+        """Queue rows for scoring; returns a Future resolving to their probabilities"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        future = Future()
+        with self._condition:
+            self._ensure_started()
+            self._queue.append((X, future, time.perf_counter()))
+            self._queued_rows += len(X)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._condition.notify()
+        return future
+
+    def predict_matrix(self, X):
+        """Blocking scoring call; batches that are already full skip the queue"""
+        if len(X) >= self.max_batch_rows:
+            with self._metrics_lock:
+                self._direct_calls += 1
+            return self.predictor.predict_matrix(X)
+        return self.submit(X).result()
+
+    def _next_batch(self):
+        """Wait for work, then collect requests until the batch is full or the oldest one is due"""
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0][2] + self.max_wait
+            while self._queued_rows < self.max_batch_rows:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            rows = 0
+            while self._queue and (not batch or rows + len(self._queue[0][0]) <= self.max_batch_rows):
+                request = self._queue.popleft()
+                batch.append(request)
+                rows += len(request[0])
+            self._queued_rows -= rows
+            return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._next_batch()
+            started = time.perf_counter()
+            try:
+                scores = self.predictor.predict_matrix(np.concatenate([X for X, _, _ in batch]))
+            except Exception as e:
+                logger.error("Inference batch of %s rows failed: %s", rows, e)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for X, future, _ in batch:
+                future.set_result(np.asarray(scores[offset:offset + len(X)]))
+                offset += len(X)
+            self._record(batch, rows, started)
+
+    def _record(self, batch, rows, started):
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if rows <= bound), len(BATCH_SIZE_BUCKETS))
+        with self._metrics_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._rows += rows
+            self._wait_seconds += sum(started - queued_at for _, _, queued_at in batch)
+            self._batch_sizes[bucket] += 1
+
+    def metrics(self):
+        with self._condition:
+            queue_depth = len(self._queue)
+            queued_rows = self._queued_rows
+        with self._metrics_lock:
+            labels = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+            return {
+                'max_batch_rows': self.max_batch_rows,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': queue_depth,
+                'queued_rows': queued_rows,
+                'max_queue_depth': self._max_queue_depth,
+                'batches': self._batches,
+                'requests': self._requests,
+                'rows': self._rows,
+                'direct_calls': self._direct_calls,
+                'mean_batch_rows': round(self._rows / self._batches, 2) if self._batches else 0,
+                'mean_requests_per_batch': round(self._requests / self._batches, 2) if self._batches else 0,
+                'mean_queue_wait_ms': round(self._wait_seconds / self._requests * 1000, 3) if self._requests else 0,
+                'batch_size_histogram': [{'rows': label, 'batches': count}
+                                         for label, count in zip(labels, self._batch_sizes)],
+            }
@@ -0,0 +1,183 @@
+"""
+SehatMind - Non-blocking structured logging
+Every log call only puts the record on a bounded in-memory queue. A
+background thread (logging.handlers.QueueListener) formats the records and
+writes them, so a slow disk, pipe or log shipper never holds up a request. If
+the queue is full the record is dropped and counted rather than waited on.
+
+Records are written as one JSON object per line with ts, level, logger and
+msg. Fields passed with `extra=` (e.g. `extra={'event': 'login_success',
+'username': name}`) become top-level keys. Messages are formatted on the
+writer thread, so call sites should pass %-style arguments instead of
+f-strings, and the arguments shouldn't be mutated after the call.
+LOG_FORMAT=text switches to plain lines for local development.
+
+High-volume events are sampled before they are queued. LOG_SAMPLE_RATES
+(e.g. "login_attempt=0.01,login_success=0.1") keeps every Nth INFO record of
+an event type, and kept records carry `sample_rate` so counts can be scaled
+back up. Warnings and errors are never sampled.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Fraction of INFO records kept per event type
+DEFAULT_SAMPLE_RATES = {
+    'login_attempt': 0.01,
+    'login_success': 0.1,
+    'request_shed': 0.01,
+}
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_sample_rates(spec):
+    """DEFAULT_SAMPLE_RATES updated from an "event=rate,..." string"""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (spec or '').split(','):
+        if item.strip():
+            event, rate = item.split('=')
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class EventSampler(logging.Filter):
+    """Keeps every Nth INFO-or-lower record of each sampled event type"""
+
+    def __init__(self, rates):
+        super().__init__()
+        # event -> keep one record in `every`
+        self.every = {event: max(1, round(1 / rate)) for event, rate in rates.items() if rate > 0}
+        self.muted = {event for event, rate in rates.items() if rate <= 0}
+        self._counters = {}
+        self.skipped = Counter()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        if event in self.muted:
+            self.skipped[event] += 1
+            return False
+        every = self.every.get(event)
+        if every is None or every == 1:
+            return True
+        counter = self._counters.get(event) or self._counters.setdefault(event, itertools.count())
+        if next(counter) % every:
+            self.skipped[event] += 1
+            return False
+        record.sample_rate = 1 / every
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never waits on a full queue and leaves formatting to the listener"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock prepare() formats the message here, on the request thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Root logger -> sampler -> bounded queue -> writer thread -> `handler`"""
+
+    def __init__(self, handler, sample_rates=None, queue_size=LOG_QUEUE_SIZE):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.sampler = EventSampler(DEFAULT_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        self.queue_handler.addFilter(self.sampler)
+        self.listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.listener is None:
+                self.listener = QueueListener(self.queue_handler.queue, self.handler, respect_handler_level=True)
+                self.listener.start()
+
+    def stop(self):
+        """Write out everything queued and stop the writer thread"""
+        with self._lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def after_fork(self):
+        """New queue and writer thread; call in a worker process right after fork"""
+        self._lock = threading.Lock()
+        self.queue_handler.queue = queue.Queue(self.queue_size)
+        self.listener = None
+        self.start()
+
+    def metrics(self):
+        return {
+            'queue_depth': self.queue_handler.queue.qsize(),
+            'queue_size': self.queue_size,
+            'dropped': self.queue_handler.dropped,
+            'sample_rates': {event: 1 / every for event, every in self.sampler.every.items()},
+            'sampled_out': dict(self.sampler.skipped),
+        }
+
+
+def configure(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None, sample_rates=None):
+    """Route the root logger through a LogPipeline writing to `stream` (stderr); returns the started pipeline"""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.getenv('LOG_SAMPLE_RATES'))
+    pipeline = LogPipeline(handler, sample_rates)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(pipeline.queue_handler)
+    root.setLevel(level)
+    pipeline.start()
+    # Write out what's still queued when the process exits
+    atexit.register(pipeline.stop)
+    return pipeline
@@ -0,0 +1,342 @@
+"""
+SehatMind - Notifications
+Risk-transition alerts are written to a durable outbox table in the same
+transaction as the student update, and a separate dispatcher delivers them:
+batched per recipient, deduplicated within a window, rate limited and retried
+with exponential backoff.
+
+Run the dispatcher as its own process:
+
+    python notifications.py            # loop forever
+    python notifications.py --once     # deliver one batch and exit
+
+Providers are chosen with NOTIFY_PROVIDER (file, smtp, sendgrid). The default
+'file' provider appends JSON lines to NOTIFY_FILE so alerts can be checked
+offline.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from email.message import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+# Repeated alerts for the same student within this window are dropped
+DEDUPE_WINDOW_MINUTES = int(os.getenv('NOTIFY_DEDUPE_MINUTES', 1440))
+# Sent when a student has no teacher or staff owner to notify
+FALLBACK_RECIPIENT = os.getenv('NOTIFY_FALLBACK_RECIPIENT')
+
+BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', 200))
+POLL_INTERVAL_SECONDS = float(os.getenv('NOTIFY_POLL_SECONDS', 5))
+RATE_LIMIT_PER_MINUTE = int(os.getenv('NOTIFY_RATE_PER_MINUTE', 60))
+MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 6))
+BASE_BACKOFF_SECONDS = float(os.getenv('NOTIFY_BACKOFF_SECONDS', 30))
+
+
+def init_notifications(cur):
+    """Create the outbox table and its indexes"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            event_type VARCHAR(40) NOT NULL,
+            dedupe_key VARCHAR(200) NOT NULL,
+            recipient VARCHAR(120) NOT NULL,
+            student_id INTEGER,
+            payload JSONB NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            last_error TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON notification_outbox (next_attempt_at) WHERE status = 'pending'
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_dedupe ON notification_outbox (dedupe_key, created_at)")
+
+
+def enqueue_risk_transitions(cur, transitions):
+    """Queue a 'risk_high' alert for each (student id, old level, new level, risk percentage)
+    that crosses into high risk. Runs inside the caller's transaction."""
+    crossings = [(student_id, old_level, new_level, float(risk_percentage))
+                 for student_id, old_level, new_level, risk_percentage in transitions
+                 if new_level == 'high' and old_level != 'high']
+    if not crossings:
+        return 0
+
+    # Alert the assigned teacher, else the owning staff member, else the fallback address
+    ids, old_levels, new_levels, percentages = (list(column) for column in zip(*crossings))
+    cur.execute("""
+        INSERT INTO notification_outbox (event_type, dedupe_key, recipient, student_id, payload)
+        SELECT 'risk_high', 'risk_high:' || s.id, COALESCE(t.email, o.email, %(fallback)s), s.id,
+               json_build_object('student_id', s.student_id, 'name', s.name, 'course', s.course,
+                                 'previous_level', v.old_level, 'risk_level', v.new_level,
+                                 'risk_percentage', v.risk_percentage)
+        FROM unnest(%(ids)s::integer[], %(old_levels)s::varchar[], %(new_levels)s::varchar[], %(percentages)s::float[])
+             AS v(id, old_level, new_level, risk_percentage)
+        JOIN students s ON s.id = v.id
+        LEFT JOIN users t ON t.id = s.teacher_id
+        LEFT JOIN users o ON o.id = s.owner_user_id AND o.role IN ('teacher', 'admin')
+        WHERE COALESCE(t.email, o.email, %(fallback)s) IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM notification_outbox n
+              WHERE n.dedupe_key = 'risk_high:' || s.id
+                AND n.created_at > CURRENT_TIMESTAMP - make_interval(mins => %(window)s)
+          )
+    """, {'ids': ids, 'old_levels': old_levels, 'new_levels': new_levels, 'percentages': percentages,
+          'fallback': FALLBACK_RECIPIENT, 'window': DEDUPE_WINDOW_MINUTES})
+    return cur.rowcount
+
+
+# Providers
+class NotificationProvider:
+    """Delivers one batched message to one recipient; raise on failure so it is retried"""
+    name = 'base'
+
+    def send(self, recipient, subject, body):
+        raise NotImplementedError
+
+
+class FileProvider(NotificationProvider):
+    """Appends messages as JSON lines to a local file, for development and tests"""
+    name = 'file'
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('NOTIFY_FILE', 'notifications.log')
+        self._lock = threading.Lock()
+
+    def send(self, recipient, subject, body):
+        line = json.dumps({'sent_at': datetime.now().isoformat(), 'to': recipient,
+                           'subject': subject, 'body': body})
+        with self._lock, open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+
+
+class SMTPProvider(NotificationProvider):
+    """Plain SMTP using the Flask-Mail settings (MAIL_SERVER, MAIL_PORT, ...).
+
+    Point it at a local stub such as `python -m aiosmtpd -n -l localhost:1025`
+    to test offline.
+    """
+    name = 'smtp'
+
+    def __init__(self):
+        self.server = os.getenv('MAIL_SERVER', 'localhost')
+        self.port = int(os.getenv('MAIL_PORT', 1025))
+        self.username = os.getenv('MAIL_USERNAME')
+        self.password = os.getenv('MAIL_PASSWORD')
+        self.use_tls = os.getenv('MAIL_USE_TLS', 'False').lower() == 'true'
+        self.sender = os.getenv('MAIL_DEFAULT_SENDER', 'alerts@sehatmind.local')
+
+    def send(self, recipient, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.set_content(body)
+
+        with smtplib.SMTP(self.server, self.port, timeout=10) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class SendGridProvider(NotificationProvider):
+    """SendGrid web API (needs SENDGRID_API_KEY)"""
+    name = 'sendgrid'
+
+    def __init__(self):
+        from sendgrid import SendGridAPIClient
+
+        self.client = SendGridAPIClient(os.environ['SENDGRID_API_KEY'])
+        self.sender = os.getenv('MAIL_DEFAULT_SENDER', 'alerts@sehatmind.local')
+
+    def send(self, recipient, subject, body):
+        from sendgrid.helpers.mail import Mail
+
+        response = self.client.send(Mail(from_email=self.sender, to_emails=recipient,
+                                         subject=subject, plain_text_content=body))
+        if response.status_code >= 300:
+            raise RuntimeError(f"SendGrid returned {response.status_code}")
+
+
+PROVIDERS = {
+    FileProvider.name: FileProvider,
+    SMTPProvider.name: SMTPProvider,
+    SendGridProvider.name: SendGridProvider,
+}
+
+
+def register_provider(provider_class):
+    """Make a custom provider selectable through NOTIFY_PROVIDER"""
+    PROVIDERS[provider_class.name] = provider_class
+
+
+def get_provider(name=None):
+    return PROVIDERS[name or os.getenv('NOTIFY_PROVIDER', 'file')]()
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` sends with bursts up to the same size"""
+
+    def __init__(self, per_minute):
+        self.capacity = max(1, per_minute)
+        self.tokens = float(self.capacity)
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def format_batch(items):
+    """Build one message summarizing every alert queued for a recipient"""
+    if len(items) == 1:
+        subject = f"SehatMind alert: {items[0]['name']} is now high risk"
+    else:
+        subject = f"SehatMind alert: {len(items)} students are now high risk"
+
+    lines = ["The following students crossed into high dropout risk:", ""]
+    for item in items:
+        lines.append(f"- {item['name']} ({item['student_id']}, {item.get('course') or 'no course'}): "
+                     f"{item['risk_percentage']:.0f}% risk, previously {item.get('previous_level') or 'unscored'}")
+    lines += ["", "Open SehatMind to review their profiles and intervention plans."]
+    return subject, "\n".join(lines)
+
+
+class NotificationDispatcher:
+    """Claims pending outbox rows, sends one message per recipient and records the outcome"""
+
+    def __init__(self, get_connection, provider=None, batch_size=BATCH_SIZE,
+                 rate_limit_per_minute=RATE_LIMIT_PER_MINUTE, max_attempts=MAX_ATTEMPTS,
+                 base_backoff=BASE_BACKOFF_SECONDS):
+        self.get_connection = get_connection
+        self.provider = provider or get_provider()
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(rate_limit_per_minute)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self._stop = threading.Event()
+
+    def _backoff_seconds(self, attempts):
+        # Exponential backoff with full jitter, capped at one hour
+        return min(3600, self.base_backoff * (2 ** (attempts - 1))) * random.uniform(0.5, 1.0)
+
+    def run_once(self):
+        """Deliver one batch; returns counts of sent, failed and deferred rows"""
+        conn = self.get_connection()
+        if not conn:
+            logger.error("Notification dispatcher could not connect to database")
+            return None
+
+        stats = {'sent': 0, 'failed': 0, 'deferred': 0}
+        try:
+            cur = conn.cursor()
+            # SKIP LOCKED lets several dispatchers run side by side without double sends
+            cur.execute("""
+                SELECT id, recipient, payload, attempts
+                FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (self.batch_size,))
+            rows = cur.fetchall()
+
+            batches = OrderedDict()
+            for row_id, recipient, payload, attempts in rows:
+                batches.setdefault(recipient, []).append((row_id, payload, attempts))
+
+            for recipient, entries in batches.items():
+                row_ids = [entry[0] for entry in entries]
+
+                if not self.rate_limiter.try_acquire():
+                    cur.execute("""
+                        UPDATE notification_outbox
+                        SET next_attempt_at = CURRENT_TIMESTAMP + interval '1 minute'
+                        WHERE id = ANY(%s)
+                    """, (row_ids,))
+                    stats['deferred'] += len(row_ids)
+                    continue
+
+                subject, body = format_batch([entry[1] for entry in entries])
+                try:
+                    self.provider.send(recipient, subject, body)
+                    cur.execute("""
+                        UPDATE notification_outbox
+                        SET status = 'sent', sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                        WHERE id = ANY(%s)
+                    """, (row_ids,))
+                    stats['sent'] += len(row_ids)
+                except Exception as e:
+                    attempts = max(entry[2] for entry in entries) + 1
+                    status = 'failed' if attempts >= self.max_attempts else 'pending'
+                    cur.execute("""
+                        UPDATE notification_outbox
+                        SET attempts = attempts + 1, status = %s, last_error = %s,
+                            next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                        WHERE id = ANY(%s)
+                    """, (status, str(e)[:500], self._backoff_seconds(attempts), row_ids))
+                    stats['failed'] += len(row_ids)
+                    logger.warning("Notification to %s failed (attempt %s): %s", recipient, attempts, e)
+
+            conn.commit()
+            cur.close()
+            return stats
+        except Exception as e:
+            conn.rollback()
+            logger.error("Notification dispatch error: %s", e)
+            return None
+        finally:
+            conn.close()
+
+    def run_forever(self, poll_interval=POLL_INTERVAL_SECONDS):
+        while not self._stop.is_set():
+            stats = self.run_once()
+            # Keep draining without sleeping while full batches are being claimed
+            if not stats or sum(stats.values()) < self.batch_size:
+                self._stop.wait(poll_interval)
+
+    def start(self, poll_interval=POLL_INTERVAL_SECONDS):
+        """Run the dispatcher on a daemon thread (for single-process deployments)"""
+        thread = threading.Thread(target=self.run_forever, args=(poll_interval,),
+                                  name='notification-dispatcher', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SehatMind notification dispatcher')
+    parser.add_argument('--once', action='store_true', help='deliver one batch and exit')
+    parser.add_argument('--provider', help='provider name (defaults to NOTIFY_PROVIDER or file)')
+    args = parser.parse_args()
+
+    from app import get_db_connection
+    dispatcher = NotificationDispatcher(get_db_connection, get_provider(args.provider))
+    if args.once:
+        print(dispatcher.run_once())
+    else:
+        logger.info("Notification dispatcher started with provider %s", dispatcher.provider.name)
+        dispatcher.run_forever()
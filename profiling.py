@@ -0,0 +1,323 @@
+"""
+SehatMind - On-demand profiling
+Two opt-in profilers for finding where a slow route spends its time.
+
+RequestProfiler runs cProfile around one request. An admin sends the
+`X-Profile: 1` header (or `?profile=1`), and the profile is saved to
+PROFILE_DIR as a pstats file that can be downloaded, rendered as text, or
+opened in snakeviz. Only one request per process is profiled at a time, and
+the newest PROFILE_KEEP files are kept.
+
+SamplingProfiler is a background thread that wakes every interval, reads the
+stack of each thread serving a request (sys._current_frames()) and counts
+identical stacks. It runs for a fixed window and reports the counts as folded
+stacks ("route;file:function;... count"), the input format of flamegraph.pl
+and speedscope. Requests aren't slowed by it; it costs one thread waking up
+every few milliseconds. Under gunicorn every worker samples its own threads:
+the window and each worker's counts are files in PROFILE_DIR, so a window
+started through any worker runs in all of them and the read merges them.
+
+When neither profiler is in use the cost is a header check per request.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 50))
+SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5))
+MAX_SAMPLE_SECONDS = 600
+# How often a worker looks for a sampling window started or stopped by another worker
+WINDOW_CHECK_SECONDS = 1
+# Deeper stacks are cut off at the root end
+MAX_STACK_DEPTH = 100
+
+_PROFILE_ID = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class RequestProfiler:
+    """cProfile runs for single requests, saved as pstats files"""
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._busy = threading.Lock()
+
+    def start(self, label):
+        """Start profiling the calling thread; returns (profile_id, profiler), or None if one is already running"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_]', '_', label)}-{uuid.uuid4().hex[:6]}"
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profile_id, profiler
+
+    def stop(self, run):
+        """Stop a run from start() and save it"""
+        profile_id, profiler = run
+        try:
+            profiler.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        finally:
+            self._busy.release()
+        self._prune()
+
+    def path(self, profile_id):
+        """Path of a saved profile, or None"""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    def list(self):
+        """Saved profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.prof'):
+                stat = os.stat(os.path.join(self.directory, name))
+                profiles.append({'id': name[:-len('.prof')], 'size': stat.st_size, 'created_at': stat.st_mtime})
+        return sorted(profiles, key=lambda profile: profile['created_at'], reverse=True)
+
+    def render(self, profile_id, sort='cumulative', limit=60):
+        """pstats text report of a saved profile, or None"""
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def _prune(self):
+        for profile in self.list()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, f"{profile['id']}.prof"))
+            except OSError:
+                pass
+
+
+class SamplingProfiler:
+    """Aggregates the stacks of request threads over a time window, across every worker process.
+
+    The window lives in a file under `directory`, so a start or stop sent to
+    one gunicorn worker reaches the others: each worker checks the file at
+    most every WINDOW_CHECK_SECONDS, on its next request, and a worker's
+    sampling thread re-reads it while running. Each worker saves its counts
+    to its own file in the directory, and folded() and status() merge them.
+    """
+
+    def __init__(self, interval_ms=SAMPLE_INTERVAL_MS, directory=PROFILE_DIR):
+        self.interval_ms = interval_ms
+        self.directory = directory
+        self.running = False
+        self.window_id = None
+        self.started_at = None
+        self.ends_at = None
+        self.samples = 0
+        self._stacks = Counter()
+        # Thread ident -> label (route) of the threads currently serving a request
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._checked_at = 0.0
+
+    @property
+    def _window_path(self):
+        return os.path.join(self.directory, 'sampling-window.json')
+
+    def _samples_path(self, window_id, pid):
+        return os.path.join(self.directory, f"sampling-{window_id}-{pid}.json")
+
+    def _write_json(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(data, f)
+        os.replace(temporary, path)
+
+    def _read_window(self):
+        try:
+            with open(self._window_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def enter(self, label):
+        """Mark the calling thread as serving a request; returns its ident for leave()"""
+        ident = threading.get_ident()
+        self._threads[ident] = label
+        return ident
+
+    def leave(self, ident):
+        self._threads.pop(ident, None)
+
+    def start(self, seconds, interval_ms=None):
+        """Start a new window in every worker, discarding the last one; False if a window is already running"""
+        with self._lock:
+            window = self._read_window()
+            if self.running or (window and window['ends_at'] > time.time()):
+                return False
+            started_at = time.time()
+            window = {
+                'id': f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+                'started_at': started_at,
+                'ends_at': started_at + min(seconds, MAX_SAMPLE_SECONDS),
+                'interval_ms': interval_ms or self.interval_ms,
+            }
+            self._remove_samples()
+            self._write_json(self._window_path, window)
+            self._join(window)
+        logger.info("Sampling profiler started for %ss every %sms", seconds, self.interval_ms)
+        return True
+
+    def sync(self):
+        """Join a window another worker started; cheap enough to call on every request"""
+        now = time.monotonic()
+        if self.running or now - self._checked_at < WINDOW_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        window = self._read_window()
+        if window is None or window['id'] == self.window_id or window['ends_at'] <= time.time():
+            return
+        with self._lock:
+            if not self.running and window['id'] != self.window_id:
+                self._join(window)
+
+    def _join(self, window):
+        # Called with self._lock held
+        self.window_id = window['id']
+        self.started_at = window['started_at']
+        self.ends_at = window['ends_at']
+        self.interval_ms = window['interval_ms']
+        self._stacks = Counter()
+        self.samples = 0
+        self._stop.clear()
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """End the window in every worker; the samples so far are kept"""
+        window = self._read_window()
+        if window and window['ends_at'] > time.time():
+            window['ends_at'] = time.time()
+            self._write_json(self._window_path, window)
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        interval = self.interval_ms / 1000
+        saved_at = time.monotonic()
+        try:
+            while not self._stop.is_set() and time.time() < self.ends_at:
+                frames = sys._current_frames()
+                stacks = [self._fold(label, frames[ident]) for ident, label in list(self._threads.items())
+                          if ident in frames]
+                del frames
+                with self._lock:
+                    self._stacks.update(stacks)
+                    self.samples += 1
+                if time.monotonic() - saved_at >= WINDOW_CHECK_SECONDS:
+                    saved_at = time.monotonic()
+                    self._save()
+                    # Another worker may have stopped the window early
+                    window = self._read_window()
+                    if window is None or window['id'] != self.window_id:
+                        break
+                    self.ends_at = window['ends_at']
+                self._stop.wait(interval)
+        finally:
+            self.running = False
+            self.ends_at = min(self.ends_at, time.time())
+            self._save()
+            logger.info("Sampling profiler stopped after %s samples", self.samples)
+
+    def _save(self):
+        """Write this worker's counts for the window next to the other workers'"""
+        with self._lock:
+            data = {'samples': self.samples, 'stacks': dict(self._stacks)}
+        try:
+            self._write_json(self._samples_path(self.window_id, os.getpid()), data)
+        except OSError as e:
+            logger.warning("Could not save sampled stacks: %s", e)
+
+    def _remove_samples(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith('sampling-') and name != os.path.basename(self._window_path):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _merged(self):
+        """(window, samples, stacks Counter) of the current or last window over every worker"""
+        window = self._read_window()
+        samples, stacks = 0, Counter()
+        if window is None:
+            return None, samples, stacks
+        prefix, pid = f"sampling-{window['id']}-", os.getpid()
+        for name in os.listdir(self.directory):
+            if not (name.startswith(prefix) and name.endswith('.json')):
+                continue
+            if name == os.path.basename(self._samples_path(window['id'], pid)) and self.window_id == window['id']:
+                # This worker's own counts are newer in memory than on disk
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                continue
+            samples += saved['samples']
+            stacks.update(saved['stacks'])
+        if self.window_id == window['id']:
+            with self._lock:
+                samples += self.samples
+                stacks.update(self._stacks)
+        return window, samples, stacks
+
+    @staticmethod
+    def _fold(label, frame):
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        names.append(label)
+        return ';'.join(reversed(names))
+
+    def folded(self):
+        """Folded stacks of the current or last window over every worker, most frequent first"""
+        _, _, stacks = self._merged()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def status(self):
+        window, samples, stacks = self._merged()
+        return {
+            'running': bool(window) and window['ends_at'] > time.time(),
+            'started_at': window and window['started_at'],
+            'ends_at': window and window['ends_at'],
+            'interval_ms': window['interval_ms'] if window else self.interval_ms,
+            'samples': samples,
+            'stacks': len(stacks),
+            'active_requests': len(self._threads),
+        }
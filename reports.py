@@ -0,0 +1,239 @@
+"""
+SehatMind - Risk reports
+Per-teacher and per-course PNG/PDF risk reports rendered with matplotlib's
+non-interactive backend in a process pool, off the request thread. Rendered
+files are cached on disk under a hash of the report data and parameters, so
+repeated requests are served straight from the cache.
+
+Render every teacher's report ahead of time (e.g. from a nightly cron job):
+
+    python reports.py --all-teachers --format pdf     # --tenant <id> for one institution
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_cache'))
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# How long a request waits for a render before answering 202 and letting the client retry
+REPORT_WAIT_SECONDS = float(os.getenv('REPORT_WAIT_SECONDS', 20))
+REPORT_FORMATS = {'png': 'image/png', 'pdf': 'application/pdf'}
+# Bump when the report layout changes so old cached files are not reused
+REPORT_LAYOUT_VERSION = 1
+
+RISK_COLORS = {'high': '#e74c3c', 'medium': '#f39c12', 'low': '#2ecc71', 'safe': '#3498db', 'unknown': '#95a5a6'}
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = {}
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def get_pool():
+    """Process pool for rendering; spawned workers never inherit DB connections or threads"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+        return _pool
+
+
+def load_report_rows(cur, scope_sql, scope_params):
+    """Fetch the columns a report needs for students matching `scope_sql` (alias `s`)"""
+    cur.execute(f"""
+        SELECT s.student_id, s.name, s.course, s.risk_level, s.risk_percentage,
+               s.cgpa, s.attendance_percentage,
+               CASE WHEN s.assignments_total > 0
+                    THEN s.assignments_submitted * 100.0 / s.assignments_total END
+        FROM students s
+        WHERE {scope_sql}
+        ORDER BY s.id
+    """, list(scope_params))
+    return [[float(value) if isinstance(value, Decimal) else value for value in row]
+            for row in cur.fetchall()]
+
+
+def cache_key(rows, params):
+    """Hash of the report data and parameters; any change to either renders a new file"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([REPORT_LAYOUT_VERSION, params], sort_keys=True, default=str).encode())
+    digest.update(json.dumps(rows, default=str).encode())
+    return digest.hexdigest()[:32]
+
+
+def cache_path(key, fmt):
+    return os.path.join(REPORT_CACHE_DIR, f"{key}.{fmt}")
+
+
+def render_report(path, title, rows, fmt):
+    """Draw the report and write it atomically to `path` (runs inside a pool worker)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    levels = ['high', 'medium', 'low', 'safe', 'unknown']
+    counts = {level: 0 for level in levels}
+    for row in rows:
+        counts[row[3] if row[3] in counts else 'unknown'] += 1
+
+    figure, axes = plt.subplots(2, 2, figsize=(11.7, 8.3))
+    figure.suptitle(f"{title} - {len(rows)} students", fontsize=14)
+
+    # Risk level distribution
+    ax = axes[0][0]
+    ax.bar(levels, [counts[level] for level in levels], color=[RISK_COLORS[level] for level in levels])
+    ax.set_title('Students by risk level')
+
+    # Risk percentage histogram
+    ax = axes[0][1]
+    ax.hist([row[4] for row in rows if row[4] is not None], bins=range(0, 105, 5), color='#34495e')
+    ax.set_title('Risk percentage')
+    ax.set_xlabel('%')
+
+    # CGPA vs attendance, colored by risk
+    ax = axes[1][0]
+    plotted = [row for row in rows if row[5] is not None and row[6] is not None]
+    ax.scatter([row[6] for row in plotted], [row[5] for row in plotted], s=12,
+               c=[RISK_COLORS.get(row[3], RISK_COLORS['unknown']) for row in plotted])
+    ax.set_title('CGPA vs attendance')
+    ax.set_xlabel('Attendance %')
+    ax.set_ylabel('CGPA')
+
+    # Highest-risk students
+    ax = axes[1][1]
+    ax.axis('off')
+    top = sorted((row for row in rows if row[4] is not None), key=lambda row: row[4], reverse=True)[:10]
+    if top:
+        table = ax.table(cellText=[[row[0], (row[1] or '')[:24], f"{row[4]:.0f}%"] for row in top],
+                         colLabels=['ID', 'Name', 'Risk'], loc='upper center')
+        table.auto_set_font_size(False)
+        table.set_fontsize(8)
+    ax.set_title('Highest risk students')
+
+    figure.tight_layout(rect=(0, 0, 1, 0.95))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    figure.savefig(temp_path, format=fmt, dpi=110)
+    plt.close(figure)
+    os.replace(temp_path, path)
+    return path
+
+
+def get_or_render(title, rows, params, fmt):
+    """Return (path, future). `path` is set when the report is already cached; otherwise
+    a render is submitted (or joined, if one is already running for the same key)."""
+    key = cache_key(rows, dict(params, format=fmt))
+    path = cache_path(key, fmt)
+    if os.path.exists(path):
+        return path, None
+
+    pool = get_pool()
+    with _pool_lock:
+        # One lock hold, so concurrent requests for the same report can't both submit a render
+        future = _in_flight.get(key)
+        submitted = future is None
+        if submitted:
+            future = pool.submit(render_report, path, title, rows, fmt)
+            _in_flight[key] = future
+    if submitted:
+        # Outside the lock: the callback runs right here if the render already finished
+        future.add_done_callback(lambda done: _forget_render(key, done))
+    return None, future
+
+
+def _forget_render(key, future):
+    with _pool_lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def wait_for_render(future, timeout=REPORT_WAIT_SECONDS):
+    """Wait up to `timeout` seconds for a render; returns the path, or None if still running"""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        return None
+
+
+def prune_cache(max_age_days=7):
+    """Delete cached reports that haven't been touched for `max_age_days`"""
+    if not os.path.isdir(REPORT_CACHE_DIR):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for name in os.listdir(REPORT_CACHE_DIR):
+        path = os.path.join(REPORT_CACHE_DIR, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def render_all_teachers(conn, fmt='pdf', tenant_id=None):
+    """Render every teacher's report (of one institution when `tenant_id` is given) in parallel;
+    already cached reports are skipped"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT tenant_id, id, username FROM users
+        WHERE role = 'teacher' AND (%s::int IS NULL OR tenant_id = %s)
+        ORDER BY tenant_id, id
+    """, (tenant_id, tenant_id))
+    teachers = cur.fetchall()
+
+    futures = {}
+    cached = 0
+    for teacher_tenant_id, teacher_id, username in teachers:
+        # Same scope as the teacher report route, so renders land under the key it looks up
+        rows = load_report_rows(cur, "s.tenant_id = %s AND s.owner_user_id = %s", [teacher_tenant_id, teacher_id])
+        path, future = get_or_render(f"Risk report: teacher #{teacher_id}", rows,
+                                     {'kind': 'teacher', 'id': teacher_id}, fmt)
+        if future is None:
+            cached += 1
+        else:
+            futures[future] = username
+    cur.close()
+
+    rendered = failed = 0
+    for future in as_completed(futures):
+        try:
+            future.result()
+            rendered += 1
+        except Exception as e:
+            failed += 1
+            logger.error("Rendering report for %s failed: %s", futures[future], e)
+    return {'teachers': len(teachers), 'rendered': rendered, 'cached': cached, 'failed': failed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SehatMind report renderer')
+    parser.add_argument('--all-teachers', action='store_true', help="render every teacher's report")
+    parser.add_argument('--tenant', type=int, help="only render this institution's teacher reports")
+    parser.add_argument('--format', choices=sorted(REPORT_FORMATS), default='pdf')
+    parser.add_argument('--prune-days', type=int, default=7, help='delete cached reports older than this')
+    args = parser.parse_args()
+
+    from app import get_db_connection
+    if args.all_teachers:
+        conn = get_db_connection()
+        if not conn:
+            raise SystemExit("Failed to connect to database")
+        started = time.time()
+        print(render_all_teachers(conn, args.format, args.tenant), f"in {time.time() - started:.1f}s")
+        conn.close()
+    print(f"Pruned {prune_cache(args.prune_days)} old reports")
@@ -0,0 +1,304 @@
+"""
+SehatMind - Risk history
+Append-only, monthly partitioned snapshots of student risk scores with
+trend queries, downsampling and retention.
+
+Run as a script to perform maintenance (create upcoming partitions,
+downsample old raw snapshots into daily rollups and apply retention):
+
+    python risk_history.py --raw-days 90 --retention-days 730
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, date, timedelta
+
+import psycopg2.errors
+from psycopg2.extras import execute_values
+
+import archive
+
+logger = logging.getLogger(__name__)
+
+# Compact encodings used in the snapshot table
+RISK_LEVEL_CODES = {'unknown': -1, 'safe': 0, 'low': 1, 'medium': 2, 'high': 3}
+RISK_LEVEL_NAMES = {code: name for name, code in RISK_LEVEL_CODES.items()}
+SOURCE_CODES = {'single': 's', 'bulk': 'b', 'nightly': 'n', 'startup': 't'}
+
+TREND_BUCKETS = ('hour', 'day', 'week', 'month')
+
+# Raw snapshots older than this are rolled up into daily rows
+RAW_RETENTION_DAYS = int(os.getenv('RISK_HISTORY_RAW_DAYS', 90))
+# Daily rollups older than this are deleted
+RETENTION_DAYS = int(os.getenv('RISK_HISTORY_RETENTION_DAYS', 730))
+
+# Months for which this process has already made sure a partition exists. A month is added before the
+# creating transaction commits, so record_snapshots() drops it again if the partition turns out to be missing
+_ensured_months = set()
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + (value.month // 12), value.month % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f"student_risk_history_y{month.year}m{month.month:02d}"
+
+
+def init_risk_history(cur):
+    """Create the partitioned snapshot table, the daily rollup table and their indexes"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS student_risk_history (
+            student_id INTEGER NOT NULL,
+            recorded_at TIMESTAMP NOT NULL,
+            risk_percentage REAL NOT NULL,
+            risk_level SMALLINT NOT NULL,
+            source CHAR(1) NOT NULL
+        ) PARTITION BY RANGE (recorded_at)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_risk_history_student
+        ON student_risk_history (student_id, recorded_at)
+    """)
+    # Rows arrive in time order, so a BRIN index covers window scans at almost no cost
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_risk_history_recorded_brin
+        ON student_risk_history USING BRIN (recorded_at)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS student_risk_history_daily (
+            student_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            avg_risk REAL NOT NULL,
+            min_risk REAL NOT NULL,
+            max_risk REAL NOT NULL,
+            last_level SMALLINT NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (student_id, day)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_risk_history_daily_day ON student_risk_history_daily (day)")
+    ensure_partitions(cur, datetime.now(), months_ahead=2)
+
+
+def ensure_partitions(cur, start, months_ahead=0):
+    """Create monthly partitions from the month of `start` up to `months_ahead` months later"""
+    month = _month_start(start)
+    for _ in range(months_ahead + 1):
+        if month not in _ensured_months:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {_partition_name(month)}
+                PARTITION OF student_risk_history
+                FOR VALUES FROM (%s) TO (%s)
+            """, (month, _next_month(month)))
+            _ensured_months.add(month)
+        month = _next_month(month)
+
+
+def record_snapshots(cur, snapshots, source):
+    """Append (student id, risk percentage, risk level) snapshots in one round trip per page"""
+    if not snapshots:
+        return 0
+
+    recorded_at = datetime.now()
+    source_code = SOURCE_CODES[source]
+    rows = [
+        (student_id, recorded_at, risk_percentage, RISK_LEVEL_CODES.get(risk_level, -1), source_code)
+        for student_id, risk_percentage, risk_level in snapshots
+    ]
+    ensure_partitions(cur, recorded_at)
+    cur.execute("SAVEPOINT record_snapshots")
+    try:
+        _insert_snapshots(cur, rows)
+    except psycopg2.errors.CheckViolation:
+        # The partition was created in a transaction that rolled back; create it again
+        cur.execute("ROLLBACK TO SAVEPOINT record_snapshots")
+        _ensured_months.discard(_month_start(recorded_at))
+        ensure_partitions(cur, recorded_at)
+        _insert_snapshots(cur, rows)
+    cur.execute("RELEASE SAVEPOINT record_snapshots")
+    return len(snapshots)
+
+
+def _insert_snapshots(cur, rows):
+    execute_values(cur, """
+        INSERT INTO student_risk_history (student_id, recorded_at, risk_percentage, risk_level, source)
+        VALUES %s
+    """, rows, page_size=1000)
+
+
+def query_trend(cur, start, end, bucket='day', scope_sql='TRUE', scope_params=(), group_by=None,
+                include_archived=False):
+    """Aggregate raw snapshots and daily rollups into time buckets.
+
+    `scope_sql` filters the joined students table (alias `s`), which also covers
+    archived students when `include_archived` is set. `group_by` may be None,
+    'teacher' or 'course'.
+    """
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket}")
+
+    group_columns = {
+        None: ("NULL", ""),
+        'teacher': ("s.owner_user_id", ", s.owner_user_id"),
+        'course': ("s.course", ", s.course"),
+    }
+    if group_by not in group_columns:
+        raise ValueError(f"Unsupported group_by: {group_by}")
+    group_select, group_clause = group_columns[group_by]
+
+    students_sql = "students"
+    if include_archived:
+        # Archived students keep their id and history, so their snapshots join the same way
+        student_columns = "id, tenant_id, owner_user_id, email, course"
+        students_sql = (f"(SELECT {student_columns} FROM students "
+                        f"UNION ALL SELECT {student_columns} FROM {archive.ARCHIVE_TABLE})")
+
+    # Raw rows count as one sample each; rollups carry their own sample count
+    cur.execute(f"""
+        SELECT date_trunc(%s, h.recorded_at) AS bucket,
+               {group_select} AS group_key,
+               sum(h.risk * h.samples) / sum(h.samples) AS avg_risk,
+               min(h.min_risk) AS min_risk,
+               max(h.max_risk) AS max_risk,
+               sum(h.samples) AS samples,
+               count(DISTINCT h.student_id) AS students
+        FROM (
+            SELECT student_id, recorded_at, risk_percentage AS risk,
+                   risk_percentage AS min_risk, risk_percentage AS max_risk, 1 AS samples
+            FROM student_risk_history
+            WHERE recorded_at >= %s AND recorded_at < %s
+            UNION ALL
+            SELECT student_id, day::timestamp, avg_risk, min_risk, max_risk, samples
+            FROM student_risk_history_daily
+            WHERE day >= %s::date AND day < %s::date
+        ) h
+        JOIN {students_sql} s ON s.id = h.student_id
+        WHERE {scope_sql}
+        GROUP BY 1{group_clause}
+        ORDER BY 1{group_clause}
+    """, [bucket, start, end, start, end] + list(scope_params))
+
+    return [{
+        'bucket': row[0].isoformat(),
+        'group': row[1],
+        'avg_risk': round(float(row[2]), 2),
+        'min_risk': float(row[3]),
+        'max_risk': float(row[4]),
+        'samples': int(row[5]),
+        'students': int(row[6])
+    } for row in cur.fetchall()]
+
+
+def query_student_history(cur, student_id, start, end):
+    """Return the individual snapshots for one student, raw rows and daily rollups combined"""
+    cur.execute("""
+        SELECT recorded_at, risk_percentage, risk_level, source
+        FROM student_risk_history
+        WHERE student_id = %s AND recorded_at >= %s AND recorded_at < %s
+        UNION ALL
+        SELECT day::timestamp, avg_risk, last_level, 'd'
+        FROM student_risk_history_daily
+        WHERE student_id = %s AND day >= %s::date AND day < %s::date
+        ORDER BY 1
+    """, (student_id, start, end, student_id, start, end))
+
+    return [{
+        'recorded_at': row[0].isoformat(),
+        'risk_percentage': float(row[1]),
+        'risk_level': RISK_LEVEL_NAMES.get(row[2], 'unknown'),
+        'source': row[3]
+    } for row in cur.fetchall()]
+
+
+def list_partitions(cur):
+    """Return (partition name, month start) for every monthly partition, oldest first"""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'student_risk_history'
+        ORDER BY c.relname
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        try:
+            year, month = name.rsplit('_y', 1)[1].split('m')
+            partitions.append((name, date(int(year), int(month), 1)))
+        except (IndexError, ValueError):
+            continue
+    return partitions
+
+
+def downsample(cur, raw_days=RAW_RETENTION_DAYS):
+    """Roll whole monthly partitions older than `raw_days` into daily rows, then drop them"""
+    cutoff = date.today() - timedelta(days=raw_days)
+    rolled_up = []
+
+    for name, month in list_partitions(cur):
+        if _next_month(month) > cutoff:
+            continue
+
+        cur.execute(f"""
+            INSERT INTO student_risk_history_daily
+                (student_id, day, avg_risk, min_risk, max_risk, last_level, samples)
+            SELECT student_id, recorded_at::date,
+                   avg(risk_percentage), min(risk_percentage), max(risk_percentage),
+                   (array_agg(risk_level ORDER BY recorded_at DESC))[1], count(*)
+            FROM {name}
+            GROUP BY student_id, recorded_at::date
+            ON CONFLICT (student_id, day) DO UPDATE SET
+                avg_risk = (student_risk_history_daily.avg_risk * student_risk_history_daily.samples
+                            + EXCLUDED.avg_risk * EXCLUDED.samples)
+                           / (student_risk_history_daily.samples + EXCLUDED.samples),
+                min_risk = least(student_risk_history_daily.min_risk, EXCLUDED.min_risk),
+                max_risk = greatest(student_risk_history_daily.max_risk, EXCLUDED.max_risk),
+                last_level = EXCLUDED.last_level,
+                samples = student_risk_history_daily.samples + EXCLUDED.samples
+        """)
+        cur.execute(f"ALTER TABLE student_risk_history DETACH PARTITION {name}")
+        cur.execute(f"DROP TABLE {name}")
+        _ensured_months.discard(month)
+        rolled_up.append(name)
+
+    return rolled_up
+
+
+def apply_retention(cur, retention_days=RETENTION_DAYS):
+    """Delete daily rollups older than the retention window"""
+    cur.execute("DELETE FROM student_risk_history_daily WHERE day < %s",
+                (date.today() - timedelta(days=retention_days),))
+    return cur.rowcount
+
+
+def run_maintenance(conn, raw_days=RAW_RETENTION_DAYS, retention_days=RETENTION_DAYS):
+    """Create upcoming partitions, downsample old raw snapshots and apply retention"""
+    cur = conn.cursor()
+    ensure_partitions(cur, datetime.now(), months_ahead=2)
+    rolled_up = downsample(cur, raw_days)
+    deleted = apply_retention(cur, retention_days)
+    conn.commit()
+    cur.close()
+    logger.info("Risk history maintenance: rolled up %s partitions, deleted %s daily rows", len(rolled_up), deleted)
+    return {'rolled_up_partitions': rolled_up, 'deleted_daily_rows': deleted}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Risk history maintenance')
+    parser.add_argument('--raw-days', type=int, default=RAW_RETENTION_DAYS)
+    parser.add_argument('--retention-days', type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    from app import get_db_connection
+    # Rollups and retention deletes can take a while on large partitions
+    conn = get_db_connection(statement_timeout_ms=0)
+    if not conn:
+        raise SystemExit("Failed to connect to database")
+    print(run_maintenance(conn, args.raw_days, args.retention_days))
+    conn.close()
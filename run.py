@@ -2,19 +2,18 @@
 """
 SehatMind - AI-based Dropout Prediction and Counseling System
 Startup script for the application
+
+    python run.py                 # Flask development server
+    python run.py --production    # gunicorn with the settings in gunicorn.conf.py
 """
 
+import argparse
 import os
 import sys
-from app import app, db
 
-def create_tables():
-    """Create database tables if they don't exist"""
-    with app.app_context():
-        db.create_all()
-        print("✅ Database tables created successfully")
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
 
-def check_dependencies():
+def check_dependencies(production=False):
     """Check if all required dependencies are installed"""
     try:
         import flask
@@ -22,8 +21,10 @@ def check_dependencies():
         import numpy
         import sklearn
         import matplotlib
-        import seaborn
-        import plotly
+        import psycopg2
+        import joblib
+        if production:
+            import gunicorn
         print("✅ All dependencies are installed")
         return True
     except ImportError as e:
@@ -33,29 +34,41 @@ def check_dependencies():
 
 def main():
     """Main startup function"""
+    parser = argparse.ArgumentParser(description='Start SehatMind')
+    parser.add_argument('--production', action='store_true',
+                        default=os.getenv('SERVER_MODE', '').lower() == 'production',
+                        help='serve with gunicorn (preloaded app, multiple workers) instead of the dev server')
+    args = parser.parse_args()
+
     print("🚀 Starting SehatMind - AI Dropout Prediction System")
     print("=" * 60)
-    
+
     # Check dependencies
-    if not check_dependencies():
+    if not check_dependencies(args.production):
         sys.exit(1)
-    
-    # Create database tables
-    create_tables()
-    
+
     # Get configuration
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'True').lower() == 'true'
-    
+
     print(f"🌐 Server starting on http://{host}:{port}")
     print("📊 Dashboard available at the root URL")
     print("🔧 API endpoints available at /api/*")
     print("=" * 60)
-    
+
+    if args.production:
+        # gunicorn loads the app and runs the startup tasks once in its master process
+        os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG])
+
+    # Importing the app creates and migrates the database tables
+    from app import app, run_startup_tasks, start_notification_dispatcher
+    run_startup_tasks()
+    start_notification_dispatcher()
+
     # Start the application
     try:
-        app.run(host=host, port=port, debug=debug)
+        app.run(host=host, port=port, debug=debug, threaded=True)
     except KeyboardInterrupt:
         print("\n👋 Shutting down SehatMind...")
     except Exception as e:
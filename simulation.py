@@ -0,0 +1,238 @@
+"""
+SehatMind - What-if simulation
+Evaluates grids of hypothetical changes ("+10% attendance", "+2 assignments")
+for one student or a whole cohort in a single vectorized pass, using both the
+rule-based risk percentage and the trained DropoutPredictor model.
+"""
+
+import math
+import os
+
+import numpy as np
+
+MAX_SCENARIOS = int(os.getenv('SIMULATION_MAX_SCENARIOS', 20000))
+# Upper bound on students x scenarios evaluated by one cohort simulation
+MAX_COHORT_CELLS = int(os.getenv('SIMULATION_MAX_COHORT_CELLS', 2000000))
+# Rows handed to the model at once, keeps peak memory flat for large cohorts
+CHUNK_ROWS = 200000
+
+# Valid range of each feature after a change is applied
+FEATURE_LIMITS = {
+    'attendance_percentage': (0.0, 100.0),
+    'cgpa': (0.0, 10.0),
+    'assignments_submitted': (0.0, None),
+    'assignments_total': (0.0, None),
+    'exam_attempts': (0.0, None),
+    'family_income': (0.0, None),
+    'mental_health_score': (0.0, 10.0),
+}
+
+
+def calculate_risk_percentage_vectorized(cgpa, attendance_percentage, assignments_submitted, assignments_total):
+    """NumPy version of app.calculate_risk_percentage; same boundaries, same results, any array shape"""
+    cgpa = np.asarray(cgpa, dtype=np.float64)
+    attendance_percentage = np.asarray(attendance_percentage, dtype=np.float64)
+    assignments_submitted = np.asarray(assignments_submitted, dtype=np.float64)
+    assignments_total = np.asarray(assignments_total, dtype=np.float64)
+
+    # Calculate assignment completion percentage
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assignment_percentage = np.where(assignments_total > 0,
+                                         (assignments_submitted / assignments_total) * 100, 0.0)
+
+    high = (cgpa < 3.0) & (attendance_percentage <= 30) & (assignment_percentage <= 30)
+    medium = ((3.0 <= cgpa) & (cgpa < 5.0) & (30 < attendance_percentage) & (attendance_percentage <= 50)
+              & (30 < assignment_percentage) & (assignment_percentage <= 50))
+    low = ((5.0 <= cgpa) & (cgpa < 8.0) & (50 < attendance_percentage) & (attendance_percentage <= 80)
+           & (50 < assignment_percentage) & (assignment_percentage <= 80))
+    safe = ((8.0 <= cgpa) & (cgpa <= 10.0) & (80 <= attendance_percentage) & (attendance_percentage <= 100)
+            & (80 <= assignment_percentage) & (assignment_percentage <= 100))
+    perfect = (cgpa == 10.0) & (attendance_percentage == 100) & (assignment_percentage == 100)
+
+    # Proximity-based risk for students outside the exact boundaries
+    cgpa_score = np.minimum(100, (cgpa / 10.0) * 100)
+    average_score = (cgpa_score + attendance_percentage + assignment_percentage) / 3
+    proximity = 100 - average_score
+    proximity = np.where(proximity < 20, 15, np.where(proximity > 85, 85, proximity))
+    proximity = np.clip(proximity, 5, 85)
+
+    return np.select([high, medium, low, safe & perfect, safe],
+                     [85.0, 65.0, 35.0, 5.0, 15.0], default=proximity)
+
+
+def risk_levels_from_percentages(percentages):
+    """Vectorized app.get_risk_level_from_percentage"""
+    return np.select([percentages >= 60, percentages >= 40, percentages >= 20],
+                     ['high', 'medium', 'low'], default='safe')
+
+
+def _range_bounds(spec):
+    """(start, step, length) of a {"start", "stop", "step"} range, checked but not expanded"""
+    try:
+        start, stop, step = float(spec['start']), float(spec['stop']), float(spec.get('step', 1))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("a range needs numeric start and stop, and optionally step")
+    if not all(math.isfinite(value) for value in (start, stop, step)):
+        raise ValueError("start, stop and step must be finite")
+    if step <= 0:
+        raise ValueError("step must be positive")
+    if stop < start:
+        raise ValueError("stop must not be less than start")
+    steps = (stop - start) / step
+    if not math.isfinite(steps):
+        raise ValueError("range has too many values")
+    # The small tolerance keeps stop itself when (stop - start) / step lands just under a whole number
+    return start, step, math.floor(steps + 1e-9) + 1
+
+
+def _axis_length(spec):
+    """Number of values `spec` expands to, worked out without allocating them"""
+    if isinstance(spec, dict):
+        return _range_bounds(spec)[2]
+    if isinstance(spec, (list, tuple)) and spec:
+        return len(spec)
+    raise ValueError("each change must be a non-empty list or a {start, stop, step} range")
+
+
+def _axis_values(spec):
+    """Expand a list of values or a {"start", "stop", "step"} range into an array"""
+    if isinstance(spec, dict):
+        start, step, length = _range_bounds(spec)
+        return start + step * np.arange(length)
+    try:
+        return np.asarray([float(value) for value in spec])
+    except (TypeError, ValueError):
+        raise ValueError("change values must be numbers")
+
+
+def build_scenario_grid(changes, max_scenarios=MAX_SCENARIOS):
+    """Turn {"feature": values} into (fields, axes, deltas) where deltas is (scenarios x fields)"""
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("changes must map feature names to values")
+
+    for field in changes:
+        if field not in FEATURE_LIMITS:
+            raise ValueError(f"Unsupported feature: {field}")
+
+    # Checked before any axis is built, so a huge range or list is refused without allocating it
+    scenario_count = math.prod(_axis_length(spec) for spec in changes.values())
+    if scenario_count > max_scenarios:
+        raise ValueError(f"Too many scenarios ({scenario_count}), the limit is {max_scenarios}")
+
+    fields = list(changes)
+    axes = [_axis_values(spec) for spec in changes.values()]
+
+    mesh = np.meshgrid(*axes, indexing='ij')
+    deltas = np.stack([grid.ravel() for grid in mesh], axis=1)
+    return fields, axes, deltas
+
+
+def apply_scenarios(base, fields, deltas, feature_columns, mode='delta'):
+    """Broadcast (students x features) against (scenarios x fields) into (students x scenarios x features)"""
+    base = np.asarray(base, dtype=np.float64)
+    X = np.repeat(base[:, np.newaxis, :], len(deltas), axis=1)
+
+    for position, field in enumerate(fields):
+        column = feature_columns.index(field)
+        if mode == 'absolute':
+            X[:, :, column] = deltas[np.newaxis, :, position]
+        else:
+            X[:, :, column] += deltas[np.newaxis, :, position]
+
+    # Keep every feature inside its valid range
+    for field, (low, high) in FEATURE_LIMITS.items():
+        column = feature_columns.index(field)
+        np.clip(X[:, :, column], low, high, out=X[:, :, column])
+    submitted = feature_columns.index('assignments_submitted')
+    total = feature_columns.index('assignments_total')
+    np.minimum(X[:, :, submitted], X[:, :, total], out=X[:, :, submitted])
+    return X
+
+
+def score_matrix(X, predictor, feature_columns):
+    """Rule-based and model risk percentages for a (rows x features) matrix"""
+    rule_risk = calculate_risk_percentage_vectorized(
+        X[:, feature_columns.index('cgpa')],
+        X[:, feature_columns.index('attendance_percentage')],
+        X[:, feature_columns.index('assignments_submitted')],
+        X[:, feature_columns.index('assignments_total')],
+    )
+    model_risk = np.empty(len(X))
+    for start in range(0, len(X), CHUNK_ROWS):
+        model_risk[start:start + CHUNK_ROWS] = predictor.predict_matrix(X[start:start + CHUNK_ROWS]) * 100
+    return rule_risk, model_risk
+
+
+def simulate_student(base_row, changes, predictor, mode='delta'):
+    """Evaluate every scenario in the grid for one student's feature row"""
+    feature_columns = predictor.FEATURE_COLUMNS
+    fields, axes, deltas = build_scenario_grid(changes)
+
+    base = np.asarray([base_row], dtype=np.float64)
+    X = apply_scenarios(base, fields, deltas, feature_columns, mode)[0]
+    rule_risk, model_risk = score_matrix(X, predictor, feature_columns)
+    baseline_rule, baseline_model = score_matrix(base, predictor, feature_columns)
+
+    best = int(np.argmin(rule_risk + model_risk))
+    return {
+        'fields': fields,
+        'axes': {field: axis.tolist() for field, axis in zip(fields, axes)},
+        'shape': [len(axis) for axis in axes],
+        'scenario_count': len(deltas),
+        'baseline': {
+            'rule_risk': round(float(baseline_rule[0]), 2),
+            'model_risk': round(float(baseline_model[0]), 2),
+        },
+        'rule_risk': np.round(rule_risk, 2).tolist(),
+        'model_risk': np.round(model_risk, 2).tolist(),
+        'best_scenario': {
+            'changes': dict(zip(fields, deltas[best].tolist())),
+            'rule_risk': round(float(rule_risk[best]), 2),
+            'model_risk': round(float(model_risk[best]), 2),
+        },
+    }
+
+
+def simulate_cohort(base_rows, changes, predictor, mode='delta'):
+    """Evaluate the grid for every student and summarize each scenario across the cohort"""
+    feature_columns = predictor.FEATURE_COLUMNS
+    fields, axes, deltas = build_scenario_grid(changes)
+
+    base = np.asarray(base_rows, dtype=np.float64)
+    if len(base) * len(deltas) > MAX_COHORT_CELLS:
+        raise ValueError(f"Cohort of {len(base)} students x {len(deltas)} scenarios exceeds {MAX_COHORT_CELLS} evaluations")
+
+    rule_sum = np.zeros(len(deltas))
+    model_sum = np.zeros(len(deltas))
+    high_count = np.zeros(len(deltas), dtype=np.int64)
+
+    # Process students in chunks so the broadcast tensor stays bounded
+    students_per_chunk = max(1, CHUNK_ROWS // len(deltas))
+    for start in range(0, len(base), students_per_chunk):
+        chunk = base[start:start + students_per_chunk]
+        X = apply_scenarios(chunk, fields, deltas, feature_columns, mode)
+        rule_risk, model_risk = score_matrix(X.reshape(-1, len(feature_columns)), predictor, feature_columns)
+        rule_risk = rule_risk.reshape(len(chunk), len(deltas))
+        model_risk = model_risk.reshape(len(chunk), len(deltas))
+        rule_sum += rule_risk.sum(axis=0)
+        model_sum += model_risk.sum(axis=0)
+        high_count += (rule_risk >= 60).sum(axis=0)
+
+    baseline_rule, baseline_model = score_matrix(base, predictor, feature_columns)
+    students = len(base)
+    return {
+        'fields': fields,
+        'axes': {field: axis.tolist() for field, axis in zip(fields, axes)},
+        'shape': [len(axis) for axis in axes],
+        'scenario_count': len(deltas),
+        'students': students,
+        'baseline': {
+            'mean_rule_risk': round(float(baseline_rule.mean()), 2),
+            'mean_model_risk': round(float(baseline_model.mean()), 2),
+            'high_risk_students': int((baseline_rule >= 60).sum()),
+        },
+        'mean_rule_risk': np.round(rule_sum / students, 2).tolist(),
+        'mean_model_risk': np.round(model_sum / students, 2).tolist(),
+        'high_risk_students': high_count.tolist(),
+    }
+
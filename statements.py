@@ -0,0 +1,117 @@
+"""
+SehatMind - Prepared statements
+Hot parameterized queries are registered once under a name and run as
+server-side prepared statements: each pooled connection PREPAREs a statement
+the first time it runs it and afterwards only sends EXECUTE with the
+parameters, so Postgres skips parsing and (once it settles on a generic plan)
+planning. Connections remember what they prepared by backend pid, so a
+reconnected connection prepares again.
+
+    OWNER_CHECK = statements.register('owner_check', "SELECT owner_user_id FROM students WHERE id = %s")
+    OWNER_CHECK.execute(cur, (student_id,))
+    row = cur.fetchone()
+
+Set DB_PREPARED_STATEMENTS=false to run the same SQL unprepared.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+
+import psycopg2.errors
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+
+_registry = {}
+# psycopg2 connection -> (backend pid, names prepared on it)
+_prepared = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+class Statement:
+    """A named, parameterized query (psycopg2 %s placeholders)"""
+
+    def __init__(self, name, sql):
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+            raise ValueError(f"Invalid statement name: {name}")
+        self.name = name
+        self.sql = sql
+        self.param_count = sql.count('%s')
+        # PREPARE takes $1..$n placeholders
+        counter = iter(range(1, self.param_count + 1))
+        self.prepare_sql = f"PREPARE {name} AS " + re.sub(r'%s', lambda _: f"${next(counter)}", sql)
+        placeholders = ', '.join(['%s'] * self.param_count)
+        self.execute_sql = f"EXECUTE {name} ({placeholders})" if self.param_count else f"EXECUTE {name}"
+        self.calls = 0
+        self.prepares = 0
+        self.seconds = 0.0
+
+    def _ensure_prepared(self, cur):
+        conn = cur.connection
+        pid = conn.info.backend_pid
+        with _lock:
+            entry = _prepared.get(conn)
+            if entry is None or entry[0] != pid:
+                # New or reconnected session: nothing is prepared on it yet
+                entry = (pid, set())
+                _prepared[conn] = entry
+            if self.name in entry[1]:
+                return
+        cur.execute(self.prepare_sql)
+        with _lock:
+            entry[1].add(self.name)
+        self.prepares += 1
+
+    def execute(self, cur, params=()):
+        """Run the statement on `cur`; results are read with the usual fetch methods"""
+        started = time.perf_counter()
+        try:
+            if not ENABLED:
+                cur.execute(self.sql, params)
+                return
+            self._ensure_prepared(cur)
+            try:
+                cur.execute(self.execute_sql, params)
+            except psycopg2.errors.InvalidSqlStatementName:
+                # Dropped behind our back (e.g. DISCARD ALL); prepare again on the next call
+                forget(cur.connection)
+                raise
+        finally:
+            self.calls += 1
+            self.seconds += time.perf_counter() - started
+
+
+def register(name, sql):
+    """Name a hot query; registering the same name twice must use the same SQL"""
+    statement = _registry.get(name)
+    if statement is not None:
+        if statement.sql != sql:
+            raise ValueError(f"Statement {name} is already registered with different SQL")
+        return statement
+    statement = _registry[name] = Statement(name, sql)
+    return statement
+
+
+def forget(conn):
+    """Treat every statement as unprepared on `conn`"""
+    with _lock:
+        _prepared.pop(conn, None)
+
+
+def registry():
+    return dict(_registry)
+
+
+def stats():
+    """Calls, prepares and mean execution time (client side, ms) per statement"""
+    return {
+        'enabled': ENABLED,
+        'statements': {name: {'calls': s.calls, 'prepares': s.prepares,
+                              'mean_ms': round(s.seconds / s.calls * 1000, 4) if s.calls else 0}
+                       for name, s in sorted(_registry.items())},
+    }
@@ -0,0 +1,571 @@
+"""
+SehatMind - Storage backends
+The user, student and dashboard-statistics operations behind one interface,
+with a PostgreSQL implementation (the pooled `db.Database` the app runs on)
+and an embedded SQLite implementation for satellite campuses and CI machines
+that have no Postgres server.
+
+Both pass the same contract suite (tests/test_storage_contract.py) and run
+the same benchmark (benchmarks/storage_benchmark.py), so their numbers are
+comparable. The app serves registration, login, users, the dashboard and
+student list, detail, create, update, delete and import through the backend
+named by STORAGE_BACKEND (postgres by default). Writes take an optional
+`hook(cur, result)` run inside the write's transaction, which the app uses
+for the Postgres-only risk history and alert outbox. Search, analytics, risk
+history, alerts and duplicate detection still need Postgres; with
+STORAGE_BACKEND=sqlite (data in SQLITE_PATH) the core routes run without it.
+
+The SQLite backend is tuned for a single node: WAL journaling so readers
+never block the writer, synchronous=NORMAL (durable at checkpoints, which is
+safe with WAL), a 64 MB page cache and memory-mapped reads. It keeps one
+connection per thread, and every write is a BEGIN IMMEDIATE transaction, so
+concurrent writers queue on the busy timeout instead of failing with
+"database is locked" halfway through.
+"""
+
+import abc
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import psycopg2
+
+import db
+import dedup
+import statements
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'sehatmind.sqlite3')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+# Rows per round trip when listing students
+LIST_CHUNK_ROWS = 2000
+
+USER_FIELDS = ['id', 'username', 'email', 'password', 'role', 'name', 'auth_version', 'tenant_id', 'created_at']
+# Student columns callers may set; id, tenant_id and the timestamps are managed by the backend
+STUDENT_FIELDS = ['student_id', 'name', 'email', 'phone', 'course', 'semester', 'attendance_percentage', 'cgpa',
+                  'assignments_submitted', 'assignments_total', 'exam_attempts', 'family_income', 'study_hours',
+                  'mental_health_score', 'dropout_risk_score', 'risk_percentage', 'risk_level', 'model_risk_percentage',
+                  'counselor_notes', 'intervention_plan', 'owner_user_id', 'teacher_id', 'teacher_name']
+STUDENT_COLUMNS = ['id', 'tenant_id'] + STUDENT_FIELDS + ['created_at', 'last_updated']
+USER_UPDATE_FIELDS = ('username', 'email', 'role', 'name')
+RISK_LEVELS = ('high', 'medium', 'low')
+
+
+class DuplicateError(ValueError):
+    """A username, email or per-institution student ID is already taken"""
+
+
+class StorageBackend(abc.ABC):
+    """Users, students and dashboard statistics of one institution (tenant) at a time.
+
+    Rows are returned as dicts keyed by USER_FIELDS / STUDENT_COLUMNS, with
+    timestamps as datetimes. Methods that look a row up by id return None
+    (or False for writes) when it doesn't exist in the tenant. Student writes
+    call `hook(cur, result)` with the backend's own cursor (a sqlite3
+    connection for SQLite) before committing, so a hook's writes commit or
+    roll back with them.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def create_user(self, tenant_id, username, email, password, role='teacher', name=None):
+        """Insert a user; returns its id or raises DuplicateError"""
+
+    @abc.abstractmethod
+    def get_user(self, user_id):
+        """User by id, in any tenant"""
+
+    @abc.abstractmethod
+    def find_user(self, username):
+        """User by username, in any tenant (usernames are global logins)"""
+
+    @abc.abstractmethod
+    def list_users(self, tenant_id, role=None):
+        """Users of a tenant ordered by username, optionally only one role"""
+
+    @abc.abstractmethod
+    def update_user(self, tenant_id, user_id, fields):
+        """Change USER_UPDATE_FIELDS and bump auth_version so existing sessions re-check the user"""
+
+    @abc.abstractmethod
+    def delete_user(self, tenant_id, user_id):
+        """Delete a user; False if it doesn't exist in the tenant"""
+
+    def add_student(self, tenant_id, student, hook=None):
+        """Insert a student from a dict of STUDENT_FIELDS; returns its id or raises DuplicateError"""
+        return self.add_students(tenant_id, [student], hook=hook)[0]
+
+    @abc.abstractmethod
+    def add_students(self, tenant_id, students, skip_existing=False, hook=None):
+        """Insert many students in one transaction; returns their ids in order.
+
+        With `skip_existing`, rows whose student_id is already taken in the
+        tenant (or by an earlier row) are left out and get None instead of
+        raising DuplicateError.
+        """
+
+    @abc.abstractmethod
+    def get_student(self, tenant_id, student_id, owner_user_id=None, email=None):
+        """Student by id, optionally only if owned by `owner_user_id` or registered under `email`"""
+
+    @abc.abstractmethod
+    def iter_students(self, tenant_id, owner_user_id=None, email=None):
+        """All students of a tenant (or of one owner or email) ordered by id, read in chunks"""
+
+    @abc.abstractmethod
+    def update_student(self, tenant_id, student_id, fields, hook=None):
+        """Change some STUDENT_FIELDS and touch last_updated"""
+
+    @abc.abstractmethod
+    def delete_student(self, tenant_id, student_id, hook=None):
+        """Delete a student; False if it doesn't exist in the tenant"""
+
+    @abc.abstractmethod
+    def dashboard_counts(self, tenant_id, owner_user_id=None):
+        """{'total', 'high', 'medium', 'low'} student counts of a tenant (or of one owner)"""
+
+    def close(self):
+        pass
+
+
+def _student_values(student):
+    return [student.get(field) for field in STUDENT_FIELDS]
+
+
+def _checked_update_fields(fields, allowed):
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return list(fields)
+
+
+def _run_hook(hook, cur, result):
+    if hook is not None:
+        hook(cur, result)
+    return result
+
+
+class PostgresBackend(StorageBackend):
+    """Backend on the app's pooled PostgreSQL connections (see db.py); reads go through run_read().
+
+    `use_replica()` says whether the current request may read from a replica
+    (the app's use_read_replica()). Only the list and count reads ask it;
+    lookups by id or username always read the primary.
+    """
+
+    name = 'postgres'
+
+    STUDENT_GET = statements.register('storage_student_get',
+        f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE tenant_id = %s AND id = %s")
+    STUDENT_GET_OWNED = statements.register('storage_student_get_owned',
+        f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE tenant_id = %s AND id = %s AND owner_user_id = %s")
+    STUDENT_GET_BY_EMAIL = statements.register('storage_student_get_by_email',
+        f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE tenant_id = %s AND id = %s AND email = %s")
+    STUDENT_DELETE = statements.register('storage_student_delete',
+        "DELETE FROM students WHERE tenant_id = %s AND id = %s")
+    STUDENT_BLOCKING_KEYS = statements.register('storage_student_blocking_keys',
+        "UPDATE students SET email_key = %s, name_key = %s WHERE tenant_id = %s AND id = %s")
+    USER_GET = statements.register('storage_user_get',
+        f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE id = %s")
+    USER_BY_USERNAME = statements.register('storage_user_by_username',
+        f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE username = %s")
+    DASHBOARD_COUNTS = statements.register('storage_dashboard_counts', """
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE risk_level = 'high'),
+               COUNT(*) FILTER (WHERE risk_level = 'medium'),
+               COUNT(*) FILTER (WHERE risk_level = 'low')
+        FROM students WHERE tenant_id = %s
+    """)
+    DASHBOARD_COUNTS_OWNED = statements.register('storage_dashboard_counts_owned', """
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE risk_level = 'high'),
+               COUNT(*) FILTER (WHERE risk_level = 'medium'),
+               COUNT(*) FILTER (WHERE risk_level = 'low')
+        FROM students WHERE tenant_id = %s AND owner_user_id = %s
+    """)
+
+    def __init__(self, database, use_replica=None):
+        self.database = database
+        self.use_replica = use_replica or (lambda: False)
+
+    def _read(self, read, replica_ok=False):
+        return self.database.run_read(read, replica_ok and self.use_replica())
+
+    def _write(self, write):
+        conn = self.database.connect(False)
+        try:
+            cur = conn.cursor()
+            result = write(cur)
+            conn.commit()
+            return result
+        except psycopg2.IntegrityError as e:
+            conn.rollback()
+            if e.pgcode == '23505':
+                raise DuplicateError(str(e).strip().splitlines()[0]) from e
+            raise
+        finally:
+            conn.close()
+
+    def create_user(self, tenant_id, username, email, password, role='teacher', name=None):
+        def insert(cur):
+            cur.execute("""
+                INSERT INTO users (username, email, password, role, name, tenant_id)
+                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
+            """, (username, email, password, role, name or username, tenant_id))
+            return cur.fetchone()[0]
+        return self._write(insert)
+
+    def get_user(self, user_id):
+        def read(conn):
+            cur = conn.cursor()
+            self.USER_GET.execute(cur, (user_id,))
+            return cur.fetchone()
+        row = self._read(read)
+        return dict(zip(USER_FIELDS, row)) if row else None
+
+    def find_user(self, username):
+        def read(conn):
+            cur = conn.cursor()
+            self.USER_BY_USERNAME.execute(cur, (username,))
+            return cur.fetchone()
+        row = self._read(read)
+        return dict(zip(USER_FIELDS, row)) if row else None
+
+    def list_users(self, tenant_id, role=None):
+        def read(conn):
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT {', '.join(USER_FIELDS)} FROM users
+                WHERE tenant_id = %s AND (%s::text IS NULL OR role = %s)
+                ORDER BY username
+            """, (tenant_id, role, role))
+            return cur.fetchall()
+        return [dict(zip(USER_FIELDS, row)) for row in self._read(read, replica_ok=True)]
+
+    def update_user(self, tenant_id, user_id, fields):
+        columns = _checked_update_fields(fields, USER_UPDATE_FIELDS)
+        assignments = ''.join(f"{column} = %s, " for column in columns)
+
+        def update(cur):
+            cur.execute(f"UPDATE users SET {assignments}auth_version = auth_version + 1 WHERE tenant_id = %s AND id = %s",
+                        [fields[column] for column in columns] + [tenant_id, user_id])
+            return cur.rowcount > 0
+        return self._write(update)
+
+    def delete_user(self, tenant_id, user_id):
+        def delete(cur):
+            cur.execute("DELETE FROM users WHERE tenant_id = %s AND id = %s", (tenant_id, user_id))
+            return cur.rowcount > 0
+        return self._write(delete)
+
+    def add_students(self, tenant_id, students, skip_existing=False, hook=None):
+        conflict = " ON CONFLICT (tenant_id, student_id) DO NOTHING" if skip_existing else ""
+
+        def insert(cur):
+            # Duplicate detection keys (see dedup.py) travel with every row
+            rows = [[tenant_id] + _student_values(student)
+                    + list(dedup.blocking_keys(student.get('name'), student.get('email'), student.get('course')))
+                    for student in students]
+            placeholders = ', '.join(['%s'] * (len(STUDENT_FIELDS) + 3))
+            ids = []
+            # One multi-row INSERT per chunk instead of a round trip per student
+            for start in range(0, len(rows), LIST_CHUNK_ROWS):
+                chunk = rows[start:start + LIST_CHUNK_ROWS]
+                values = ', '.join(cur.mogrify(f"({placeholders})", row).decode() for row in chunk)
+                cur.execute(f"INSERT INTO students (tenant_id, {', '.join(STUDENT_FIELDS)}, email_key, name_key) "
+                            f"VALUES {values}{conflict} RETURNING id, student_id")
+                if skip_existing:
+                    # Skipped rows return nothing; the first row of each inserted student_id got the id
+                    inserted = dict((external_id, student_id) for student_id, external_id in cur.fetchall())
+                    ids += [inserted.pop(row[1], None) for row in chunk]
+                else:
+                    ids += [row[0] for row in cur.fetchall()]
+            return _run_hook(hook, cur, ids)
+        return self._write(insert)
+
+    def get_student(self, tenant_id, student_id, owner_user_id=None, email=None):
+        def read(conn):
+            cur = conn.cursor()
+            if owner_user_id is not None:
+                self.STUDENT_GET_OWNED.execute(cur, (tenant_id, student_id, owner_user_id))
+            elif email is not None:
+                self.STUDENT_GET_BY_EMAIL.execute(cur, (tenant_id, student_id, email))
+            else:
+                self.STUDENT_GET.execute(cur, (tenant_id, student_id))
+            return cur.fetchone()
+        row = self._read(read)
+        return dict(zip(STUDENT_COLUMNS, row)) if row else None
+
+    def iter_students(self, tenant_id, owner_user_id=None, email=None):
+        conn = self.database.connect(self.use_replica())
+        try:
+            for chunk in db.iter_chunks(conn, f"""
+                SELECT {', '.join(STUDENT_COLUMNS)} FROM students
+                WHERE tenant_id = %s AND (%s::int IS NULL OR owner_user_id = %s) AND (%s::text IS NULL OR email = %s)
+                ORDER BY id
+            """, (tenant_id, owner_user_id, owner_user_id, email, email), LIST_CHUNK_ROWS):
+                for row in chunk:
+                    yield dict(zip(STUDENT_COLUMNS, row))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def student_update_sql(columns):
+        """UPDATE of `columns` for one student; it varies with the columns, so it isn't a prepared statement"""
+        assignments = ''.join(f"{column} = %s, " for column in columns)
+        return (f"UPDATE students SET {assignments}last_updated = CURRENT_TIMESTAMP WHERE tenant_id = %s AND id = %s "
+                "RETURNING name, email, course")
+
+    def update_student(self, tenant_id, student_id, fields, hook=None):
+        columns = _checked_update_fields(fields, STUDENT_FIELDS)
+
+        def update(cur):
+            cur.execute(self.student_update_sql(columns), [fields[column] for column in columns] + [tenant_id, student_id])
+            row = cur.fetchone()
+            if row and {'name', 'email', 'course'} & set(columns):
+                self.STUDENT_BLOCKING_KEYS.execute(cur, list(dedup.blocking_keys(*row)) + [tenant_id, student_id])
+            return _run_hook(hook, cur, row is not None)
+        return self._write(update)
+
+    def delete_student(self, tenant_id, student_id, hook=None):
+        def delete(cur):
+            self.STUDENT_DELETE.execute(cur, (tenant_id, student_id))
+            return _run_hook(hook, cur, cur.rowcount > 0)
+        return self._write(delete)
+
+    def dashboard_counts(self, tenant_id, owner_user_id=None):
+        def read(conn):
+            cur = conn.cursor()
+            if owner_user_id is None:
+                self.DASHBOARD_COUNTS.execute(cur, (tenant_id,))
+            else:
+                self.DASHBOARD_COUNTS_OWNED.execute(cur, (tenant_id, owner_user_id))
+            return cur.fetchone()
+        return dict(zip(('total',) + RISK_LEVELS, self._read(read, replica_ok=True)))
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT DEFAULT 'teacher',
+        name TEXT,
+        auth_version INTEGER NOT NULL DEFAULT 1,
+        tenant_id INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_tenant ON users (tenant_id, role);
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY,
+        tenant_id INTEGER NOT NULL DEFAULT 1,
+        student_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        phone TEXT,
+        course TEXT,
+        semester INTEGER,
+        attendance_percentage REAL,
+        cgpa REAL,
+        assignments_submitted INTEGER,
+        assignments_total INTEGER,
+        exam_attempts INTEGER,
+        family_income REAL,
+        study_hours REAL,
+        mental_health_score REAL,
+        dropout_risk_score REAL,
+        risk_percentage REAL,
+        risk_level TEXT,
+        model_risk_percentage REAL,
+        counselor_notes TEXT,
+        intervention_plan TEXT,
+        owner_user_id INTEGER REFERENCES users(id),
+        teacher_id INTEGER REFERENCES users(id),
+        teacher_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (tenant_id, student_id)
+    );
+    -- Covering index for the dashboard counts, and the per-owner scope of teachers
+    CREATE INDEX IF NOT EXISTS idx_students_tenant_risk ON students (tenant_id, risk_level);
+    CREATE INDEX IF NOT EXISTS idx_students_tenant_owner ON students (tenant_id, owner_user_id, risk_level);
+"""
+
+
+def _parse_timestamps(row, columns):
+    for column in columns:
+        if isinstance(row.get(column), str):
+            row[column] = datetime.fromisoformat(row[column])
+    return row
+
+
+class SQLiteBackend(StorageBackend):
+    """Embedded single-file backend in WAL mode with one connection per thread"""
+
+    name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        conn = self._connection()
+        # Persistent for the database file, so only needs setting once
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+            # Only ever used by this thread; check_same_thread=False lets close() run from any thread
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in ("synchronous = NORMAL", "foreign_keys = ON", "cache_size = -65536",
+                           "mmap_size = 268435456", "temp_store = MEMORY"):
+                conn.execute(f"PRAGMA {pragma}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self, write):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = write(conn)
+            conn.execute("COMMIT")
+            return result
+        except sqlite3.IntegrityError as e:
+            conn.execute("ROLLBACK")
+            if 'UNIQUE' in str(e):
+                raise DuplicateError(str(e)) from e
+            raise
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _user(self, row):
+        return _parse_timestamps(dict(row), ('created_at',)) if row else None
+
+    def _student(self, row):
+        return _parse_timestamps(dict(row), ('created_at', 'last_updated')) if row else None
+
+    def create_user(self, tenant_id, username, email, password, role='teacher', name=None):
+        return self._write(lambda conn: conn.execute("""
+            INSERT INTO users (username, email, password, role, name, tenant_id) VALUES (?, ?, ?, ?, ?, ?)
+        """, (username, email, password, role, name or username, tenant_id)).lastrowid)
+
+    def get_user(self, user_id):
+        return self._user(self._connection().execute(
+            f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE id = ?", (user_id,)).fetchone())
+
+    def find_user(self, username):
+        return self._user(self._connection().execute(
+            f"SELECT {', '.join(USER_FIELDS)} FROM users WHERE username = ?", (username,)).fetchone())
+
+    def list_users(self, tenant_id, role=None):
+        rows = self._connection().execute(f"""
+            SELECT {', '.join(USER_FIELDS)} FROM users
+            WHERE tenant_id = ? AND (? IS NULL OR role = ?)
+            ORDER BY username
+        """, (tenant_id, role, role)).fetchall()
+        return [self._user(row) for row in rows]
+
+    def update_user(self, tenant_id, user_id, fields):
+        columns = _checked_update_fields(fields, USER_UPDATE_FIELDS)
+        assignments = ''.join(f"{column} = ?, " for column in columns)
+        return self._write(lambda conn: conn.execute(
+            f"UPDATE users SET {assignments}auth_version = auth_version + 1 WHERE tenant_id = ? AND id = ?",
+            [fields[column] for column in columns] + [tenant_id, user_id]).rowcount > 0)
+
+    def delete_user(self, tenant_id, user_id):
+        return self._write(lambda conn: conn.execute(
+            "DELETE FROM users WHERE tenant_id = ? AND id = ?", (tenant_id, user_id)).rowcount > 0)
+
+    def add_students(self, tenant_id, students, skip_existing=False, hook=None):
+        sql = (f"INSERT INTO students (tenant_id, {', '.join(STUDENT_FIELDS)}) "
+               f"VALUES ({', '.join(['?'] * (len(STUDENT_FIELDS) + 1))})")
+        if skip_existing:
+            sql += " ON CONFLICT (tenant_id, student_id) DO NOTHING"
+
+        def insert(conn):
+            # executemany can't return ids, and inside one transaction a prepared insert per row is just as fast
+            ids = []
+            for student in students:
+                cur = conn.execute(sql, [tenant_id] + _student_values(student))
+                ids.append(cur.lastrowid if cur.rowcount else None)
+            return _run_hook(hook, conn, ids)
+        return self._write(insert)
+
+    def get_student(self, tenant_id, student_id, owner_user_id=None, email=None):
+        sql = f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE tenant_id = ? AND id = ?"
+        params = [tenant_id, student_id]
+        if owner_user_id is not None:
+            sql += " AND owner_user_id = ?"
+            params.append(owner_user_id)
+        elif email is not None:
+            sql += " AND email = ?"
+            params.append(email)
+        return self._student(self._connection().execute(sql, params).fetchone())
+
+    def iter_students(self, tenant_id, owner_user_id=None, email=None):
+        cur = self._connection().execute(f"""
+            SELECT {', '.join(STUDENT_COLUMNS)} FROM students
+            WHERE tenant_id = ? AND (? IS NULL OR owner_user_id = ?) AND (? IS NULL OR email = ?)
+            ORDER BY id
+        """, (tenant_id, owner_user_id, owner_user_id, email, email))
+        try:
+            while True:
+                rows = cur.fetchmany(LIST_CHUNK_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._student(row)
+        finally:
+            cur.close()
+
+    def update_student(self, tenant_id, student_id, fields, hook=None):
+        columns = _checked_update_fields(fields, STUDENT_FIELDS)
+        assignments = ''.join(f"{column} = ?, " for column in columns)
+        return self._write(lambda conn: _run_hook(hook, conn, conn.execute(
+            f"UPDATE students SET {assignments}last_updated = CURRENT_TIMESTAMP WHERE tenant_id = ? AND id = ?",
+            [fields[column] for column in columns] + [tenant_id, student_id]).rowcount > 0))
+
+    def delete_student(self, tenant_id, student_id, hook=None):
+        return self._write(lambda conn: _run_hook(hook, conn, conn.execute(
+            "DELETE FROM students WHERE tenant_id = ? AND id = ?", (tenant_id, student_id)).rowcount > 0))
+
+    def dashboard_counts(self, tenant_id, owner_user_id=None):
+        row = self._connection().execute("""
+            SELECT COUNT(*),
+                   COALESCE(SUM(risk_level = 'high'), 0),
+                   COALESCE(SUM(risk_level = 'medium'), 0),
+                   COALESCE(SUM(risk_level = 'low'), 0)
+            FROM students WHERE tenant_id = ? AND (? IS NULL OR owner_user_id = ?)
+        """, (tenant_id, owner_user_id, owner_user_id)).fetchone()
+        return dict(zip(('total',) + RISK_LEVELS, tuple(row)))
+
+    def close(self):
+        """Close every thread's connection; the last one checkpoints the WAL into the main file"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        self._local = threading.local()
+
+
+def create_backend(kind, database=None, path=SQLITE_PATH, use_replica=None):
+    """Backend by name: 'postgres' needs the app's db.Database, 'sqlite' a file path"""
+    if kind == 'postgres':
+        return PostgresBackend(database, use_replica)
+    if kind == 'sqlite':
+        return SQLiteBackend(path)
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,144 @@
+"""
+SehatMind - Tenancy
+Each institution is a tenant. Users and students carry a tenant_id, and the
+students table is list-partitioned by it, so an institution's queries only
+touch its own partition and one college's bulk writes don't bloat another's
+indexes.
+"""
+
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT_ID = 1
+DEFAULT_TENANT_NAME = os.getenv('DEFAULT_TENANT_NAME', 'Default Institution')
+
+
+def partition_name(tenant_id):
+    return f"students_t{int(tenant_id)}"
+
+
+def ensure_tenant_partition(cur, tenant_id):
+    """Create the students partition for a tenant if it doesn't exist yet"""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(tenant_id)} PARTITION OF students FOR VALUES IN (%s)",
+                (int(tenant_id),))
+
+
+def _students_is_partitioned(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'students'::regclass")
+    return cur.fetchone()[0] == 'p'
+
+
+def _partition_students(cur):
+    """Rebuild the plain students table as a table partitioned by tenant_id, keeping every row and id"""
+    cur.execute("ALTER TABLE students RENAME TO students_unpartitioned")
+    cur.execute("""
+        CREATE TABLE students (LIKE students_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED)
+        PARTITION BY LIST (tenant_id)
+    """)
+    # Unique keys on a partitioned table have to include the partition key
+    cur.execute("ALTER TABLE students ADD PRIMARY KEY (tenant_id, id)")
+    cur.execute("ALTER TABLE students ADD CONSTRAINT students_tenant_student_id_key UNIQUE (tenant_id, student_id)")
+    cur.execute("ALTER TABLE students ADD FOREIGN KEY (tenant_id) REFERENCES tenants(id)")
+    # LIKE doesn't carry foreign keys over (owner_user_id, teacher_id -> users)
+    cur.execute("SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = 'students_unpartitioned'::regclass AND contype = 'f'")
+    for (definition,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE students ADD {definition}")
+
+    # Keep the id sequence alive when the old table is dropped
+    cur.execute("SELECT pg_get_serial_sequence('students_unpartitioned', 'id')")
+    sequence = cur.fetchone()[0]
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY students.id")
+
+    cur.execute("SELECT id FROM tenants")
+    for (tenant_id,) in cur.fetchall():
+        ensure_tenant_partition(cur, tenant_id)
+
+    # Copy everything except generated columns, which are recomputed
+    cur.execute("""
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+        FROM pg_attribute
+        WHERE attrelid = 'students_unpartitioned'::regclass AND attnum > 0
+          AND NOT attisdropped AND attgenerated = ''
+    """)
+    columns = cur.fetchone()[0]
+    cur.execute(f"INSERT INTO students ({columns}) SELECT {columns} FROM students_unpartitioned")
+    copied = cur.rowcount
+    cur.execute("DROP TABLE students_unpartitioned")
+    logger.info("Partitioned students table by tenant (%s rows)", copied)
+
+
+def init_tenancy(cur):
+    """Create the tenants table, add tenant_id to users and students and partition students"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tenants (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(120) UNIQUE NOT NULL,
+            slug VARCHAR(60) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        INSERT INTO tenants (id, name, slug) VALUES (%s, %s, 'default')
+        ON CONFLICT (id) DO NOTHING
+    """, (DEFAULT_TENANT_ID, DEFAULT_TENANT_NAME))
+    cur.execute("SELECT setval(pg_get_serial_sequence('tenants', 'id'), (SELECT max(id) FROM tenants))")
+
+    cur.execute(f"""
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL
+        DEFAULT {DEFAULT_TENANT_ID} REFERENCES tenants(id)
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_tenant ON users (tenant_id, role)")
+
+    if not _students_is_partitioned(cur):
+        cur.execute(f"ALTER TABLE students ADD COLUMN IF NOT EXISTS tenant_id INTEGER NOT NULL DEFAULT {DEFAULT_TENANT_ID}")
+        _partition_students(cur)
+    # Lookups by id alone (joins from history and alerts) still need an index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_students_id ON students (id)")
+
+
+def create_tenant(cur, name, slug):
+    """Add an institution and its students partition; returns the new tenant id"""
+    if not re.fullmatch(r'[a-z0-9-]{2,60}', slug or ''):
+        raise ValueError("slug must be 2-60 lowercase letters, digits or dashes")
+    cur.execute("INSERT INTO tenants (name, slug) VALUES (%s, %s) RETURNING id", (name, slug))
+    tenant_id = cur.fetchone()[0]
+    ensure_tenant_partition(cur, tenant_id)
+    return tenant_id
+
+
+def drop_tenant(cur, tenant_id):
+    """Remove an institution with its students partition, users, risk history and alerts"""
+    if int(tenant_id) == DEFAULT_TENANT_ID:
+        raise ValueError("the default institution cannot be removed")
+    for table in ('student_risk_history', 'notification_outbox'):
+        cur.execute(f"""
+            DELETE FROM {table} WHERE student_id IN (
+                SELECT id FROM students WHERE tenant_id = %s UNION ALL SELECT id FROM students_archive WHERE tenant_id = %s
+            )
+        """, (int(tenant_id), int(tenant_id)))
+    cur.execute("DELETE FROM students_archive WHERE tenant_id = %s", (int(tenant_id),))
+    cur.execute(f"DROP TABLE IF EXISTS {partition_name(tenant_id)}")
+    cur.execute("DELETE FROM users WHERE tenant_id = %s", (int(tenant_id),))
+    cur.execute("DELETE FROM tenants WHERE id = %s", (int(tenant_id),))
+
+
+def list_tenants(cur):
+    cur.execute("""
+        SELECT t.id, t.name, t.slug, t.created_at,
+               (SELECT count(*) FROM users u WHERE u.tenant_id = t.id),
+               (SELECT count(*) FROM students s WHERE s.tenant_id = t.id)
+        FROM tenants t
+        ORDER BY t.id
+    """)
+    return [{
+        'id': row[0],
+        'name': row[1],
+        'slug': row[2],
+        'created_at': row[3].isoformat() if row[3] else None,
+        'users': row[4],
+        'students': row[5],
+    } for row in cur.fetchall()]
@@ -112,6 +112,22 @@ def test_get_students(token):
         print(f"❌ Get students error: {e}")
         return False
 
+def test_search_students(token):
+    """Test student search"""
+    try:
+        headers = {"Content-Type": "application/json"}
+        response = requests.get(f"{BASE_URL}/api/students/search", params={"q": "Test Student"}, headers=headers)
+        if response.status_code == 200:
+            result = response.json()
+            print(f"✅ Search returned {len(result.get('results', []))} students")
+            return True
+        else:
+            print(f"❌ Searching students failed: {response.text}")
+            return False
+    except Exception as e:
+        print(f"❌ Search students error: {e}")
+        return False
+
 def test_dashboard_stats(token):
     """Test dashboard statistics"""
     try:
@@ -173,6 +189,7 @@ def main():
     # Test student management
     test_add_student(True)
     test_get_students(True)
+    test_search_students(True)
     
     # Test dashboard
     test_dashboard_stats(True)
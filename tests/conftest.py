@@ -0,0 +1,69 @@
+import os
+import sys
+import uuid
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import storage
+import tenancy
+
+# The database from app.DB_CONFIG; importing app itself would run its migrations and model training
+POSTGRES_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', 5432)),
+    'database': 'sehatmind',
+    'user': 'postgres',
+    'password': 'Akash9872'
+}
+
+
+@pytest.fixture(scope='session')
+def postgres_database():
+    """Pooled connections to the app's database, or skip when there is none"""
+    try:
+        database = db.Database(POSTGRES_CONFIG)
+        conn = database.connect()
+    except psycopg2.Error as e:
+        pytest.skip(f"PostgreSQL not available: {e}")
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('students') IS NOT NULL AND to_regclass('tenants') IS NOT NULL")
+    migrated = cur.fetchone()[0]
+    conn.close()
+    if not migrated:
+        pytest.skip("PostgreSQL schema missing, start the app once to create it")
+    yield database
+    database.reset()
+
+
+@pytest.fixture
+def scratch_tenants(postgres_database):
+    """Two throwaway institutions, removed with everything in them afterwards"""
+    conn = postgres_database.connect()
+    cur = conn.cursor()
+    tenant_ids = []
+    for _ in range(2):
+        slug = f"test-{uuid.uuid4().hex[:12]}"
+        tenant_ids.append(tenancy.create_tenant(cur, slug, slug))
+    conn.commit()
+    yield tenant_ids
+    for tenant_id in tenant_ids:
+        tenancy.drop_tenant(cur, tenant_id)
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request, tmp_path):
+    """(backend, tenant_a, tenant_b) for every storage backend"""
+    if request.param == 'sqlite':
+        backend = storage.create_backend('sqlite', path=str(tmp_path / 'storage.sqlite3'))
+        yield backend, 1, 2
+    else:
+        tenant_a, tenant_b = request.getfixturevalue('scratch_tenants')
+        backend = storage.create_backend('postgres', database=request.getfixturevalue('postgres_database'))
+        yield backend, tenant_a, tenant_b
+    backend.close()
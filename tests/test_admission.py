@@ -0,0 +1,166 @@
+"""
+Admission control: shedding, FIFO handoff between threads and slot accounting.
+
+    python -m pytest tests/test_admission.py
+"""
+
+import threading
+import time
+
+import pytest
+
+import admission
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def queue_up(route_class, results, label):
+    """Start a thread that acquires, records `label` once admitted and releases"""
+    def work():
+        try:
+            route_class.acquire()
+        except admission.Overloaded as e:
+            results.append(e.reason)
+            return
+        results.append(label)
+        route_class.release()
+
+    queued = len(route_class._waiters)
+    thread = threading.Thread(target=work)
+    thread.start()
+    wait_until(lambda: len(route_class._waiters) == queued + 1)
+    return thread
+
+
+def test_admits_up_to_the_limit_and_releases():
+    route_class = admission.RouteClass('test', 2, 0, 0)
+    assert route_class.acquire() == 0.0
+    route_class.acquire()
+    assert route_class.active == 2
+    with pytest.raises(admission.Overloaded) as shed:
+        route_class.acquire()
+    assert shed.value.reason == 'queue full'
+
+    route_class.release()
+    route_class.release()
+    assert route_class.active == 0
+    assert (route_class.admitted, route_class.shed_queue_full) == (2, 1)
+
+
+def test_sheds_when_the_queue_is_full():
+    route_class = admission.RouteClass('test', 1, 1, 5000)
+    route_class.acquire()
+    results = []
+    waiting = queue_up(route_class, results, 'queued')
+
+    with pytest.raises(admission.Overloaded) as shed:
+        route_class.acquire()
+    assert shed.value.reason == 'queue full'
+    assert shed.value.retry_after == 5
+
+    route_class.release()
+    waiting.join()
+    assert results == ['queued']
+    assert route_class.active == 0
+    assert route_class.metrics()['queued'] == 0
+
+
+def test_sheds_after_the_queue_deadline():
+    route_class = admission.RouteClass('test', 1, 4, 50)
+    route_class.acquire()
+
+    started = time.perf_counter()
+    with pytest.raises(admission.Overloaded) as shed:
+        route_class.acquire()
+    assert shed.value.reason == 'queue timeout'
+    assert time.perf_counter() - started >= 0.05
+    assert not route_class._waiters
+
+    route_class.release()
+    assert route_class.active == 0
+    assert route_class.shed_timeout == 1
+
+
+def test_slots_are_handed_to_waiters_in_arrival_order():
+    route_class = admission.RouteClass('test', 1, 5, 5000)
+    route_class.acquire()
+    results = []
+    # Each waiter releases when done, handing the slot on to the next one
+    threads = [queue_up(route_class, results, index) for index in range(4)]
+
+    route_class.release()
+    for thread in threads:
+        thread.join()
+    assert results == [0, 1, 2, 3]
+    assert route_class.active == 0
+    assert route_class.admitted == 5
+    assert route_class.metrics()['max_queued'] == 4
+
+
+def test_release_hands_the_slot_over_instead_of_freeing_it():
+    route_class = admission.RouteClass('test', 1, 1, 5000)
+    route_class.acquire()
+    admitted = threading.Event()
+    done = threading.Event()
+
+    def work():
+        route_class.acquire()
+        admitted.set()
+        done.wait()
+        route_class.release()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    wait_until(lambda: len(route_class._waiters) == 1)
+
+    route_class.release()
+    # The slot went to the waiter, so a newcomer finds the class full rather than a free slot
+    assert route_class.active == 1
+    assert admitted.wait(5)
+    route_class.queue_size = 0
+    with pytest.raises(admission.Overloaded):
+        route_class.acquire()
+
+    done.set()
+    thread.join()
+    assert route_class.active == 0
+
+
+def test_slots_balance_under_handoff_and_timeout_races():
+    # Waits short enough that timeouts race with release() handing slots over
+    route_class = admission.RouteClass('test', 2, 8, 2)
+    outcomes = []
+    lock = threading.Lock()
+
+    def work():
+        for _ in range(200):
+            try:
+                route_class.acquire()
+            except admission.Overloaded as e:
+                outcome = e.reason
+            else:
+                time.sleep(0.0005)
+                route_class.release()
+                outcome = 'admitted'
+            with lock:
+                outcomes.append(outcome)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metrics = route_class.metrics()
+    assert metrics['active'] == 0
+    assert metrics['queued'] == 0
+    assert metrics['max_active'] <= 2
+    assert outcomes.count('admitted') == metrics['admitted']
+    assert outcomes.count('queue timeout') == metrics['shed_timeout']
+    assert outcomes.count('queue full') == metrics['shed_queue_full']
+    assert len(outcomes) == 1600
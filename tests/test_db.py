@@ -0,0 +1,231 @@
+"""
+Fail-fast and retry behaviour of db.py: the circuit breaker, transient error
+classification and Database.run_read(). No database is needed.
+
+    python -m pytest tests/test_db.py
+"""
+
+import time
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import pytest
+
+import db
+
+
+def error(cls, pgcode):
+    """psycopg2 error carrying a SQLSTATE, as if raised by the server"""
+    return type(cls.__name__, (cls,), {'pgcode': pgcode})('boom')
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class FakeConnection:
+    closed = 0
+
+
+class FakePool:
+    """Stands in for a ConnectionPool, counting connections handed out, returned and cleared"""
+
+    def __init__(self):
+        self.handed_out = 0
+        self.returned = 0
+        self.cleared = 0
+
+    def get(self):
+        self.handed_out += 1
+        return db.PooledConnection(self, FakeConnection())
+
+    def put(self, conn, reset_timeout=False):
+        self.returned += 1
+
+    def clear(self):
+        self.cleared += 1
+
+
+@pytest.fixture
+def database(monkeypatch):
+    monkeypatch.setattr(db, 'DB_RETRY_BASE_MS', 0)
+    database = db.Database({'host': 'unused'})
+    database.primary = FakePool()
+    return database
+
+
+# is_transient
+
+@pytest.mark.parametrize('cls, pgcode', [
+    (psycopg2.errors.SerializationFailure, '40001'),
+    (psycopg2.errors.DeadlockDetected, '40P01'),
+    (psycopg2.errors.AdminShutdown, '57P01'),
+    (psycopg2.errors.CannotConnectNow, '57P03'),
+    (psycopg2.OperationalError, '08006'),
+    (psycopg2.OperationalError, None),
+    (psycopg2.InterfaceError, None),
+])
+def test_transient_errors(cls, pgcode):
+    assert db.is_transient(error(cls, pgcode))
+
+
+@pytest.mark.parametrize('cls, pgcode', [
+    (psycopg2.errors.UniqueViolation, '23505'),
+    (psycopg2.errors.UndefinedTable, '42P01'),
+    (psycopg2.errors.SyntaxError, '42601'),
+    (psycopg2.extensions.QueryCanceledError, '57014'),
+    (psycopg2.ProgrammingError, None),
+])
+def test_permanent_errors(cls, pgcode):
+    assert not db.is_transient(error(cls, pgcode))
+
+
+def test_unavailable_database_is_not_retried():
+    # The breaker handles unreachable servers; retrying would only add load
+    assert not db.is_transient(db.DatabaseUnavailable('down'))
+
+
+# CircuitBreaker
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = db.CircuitBreaker('test', probe=lambda: None, threshold=3, probe_interval=60, enabled=True)
+    for _ in range(2):
+        breaker.record_failure(psycopg2.OperationalError('refused'))
+    breaker.check()
+    assert not breaker.is_open
+
+    breaker.record_failure(psycopg2.OperationalError('refused'))
+    assert breaker.is_open
+    with pytest.raises(db.DatabaseUnavailable) as rejected:
+        breaker.check()
+    assert rejected.value.retry_after == 60
+    stats = breaker.stats()
+    assert (stats['state'], stats['trips'], stats['rejected'], stats['last_error']) == ('open', 1, 1, 'refused')
+
+
+def test_success_resets_the_failure_count():
+    breaker = db.CircuitBreaker('test', probe=lambda: None, threshold=3, probe_interval=60, enabled=True)
+    breaker.record_failure(psycopg2.OperationalError('refused'))
+    breaker.record_failure(psycopg2.OperationalError('refused'))
+    breaker.record_success()
+    breaker.record_failure(psycopg2.OperationalError('refused'))
+    assert not breaker.is_open
+    assert breaker.failures == 1
+
+
+def test_disabled_breaker_never_opens():
+    breaker = db.CircuitBreaker('test', probe=lambda: None, threshold=1, probe_interval=60, enabled=False)
+    for _ in range(5):
+        breaker.record_failure(psycopg2.OperationalError('refused'))
+    breaker.check()
+    assert breaker.failures == 5
+
+
+def test_probe_closes_the_breaker_once_the_server_answers():
+    attempts = []
+
+    def probe():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise psycopg2.OperationalError('still down')
+
+    breaker = db.CircuitBreaker('test', probe, threshold=1, probe_interval=0.01, enabled=True)
+    breaker.record_failure(psycopg2.OperationalError('refused'))
+    assert breaker.is_open
+    wait_until(lambda: not breaker.is_open)
+
+    assert len(attempts) == 3
+    assert breaker.failures == 0
+    breaker.check()
+
+
+def test_pool_fails_fast_once_its_breaker_is_open():
+    # Nothing listens on port 1, so every connect is refused
+    pool = db.ConnectionPool('test', {'host': '127.0.0.1', 'port': 1, 'dbname': 'x', 'user': 'x', 'connect_timeout': 2})
+    pool.breaker.threshold = 2
+    pool.breaker.probe_interval = 60
+    for _ in range(2):
+        with pytest.raises(db.DatabaseUnavailable):
+            pool.get()
+    assert pool.breaker.is_open
+
+    with pytest.raises(db.DatabaseUnavailable, match='circuit open'):
+        pool.get()
+    assert pool.breaker.rejected == 1
+
+
+# Database.run_read
+
+def test_read_is_retried_after_a_transient_error(database):
+    attempts = []
+
+    def read(conn):
+        attempts.append(conn)
+        if len(attempts) == 1:
+            raise error(psycopg2.errors.SerializationFailure, '40001')
+        return 'rows'
+
+    assert database.run_read(read) == 'rows'
+    assert len(attempts) == 2
+    assert database.retries == 1
+    assert database.primary.returned == 2
+
+
+def test_retries_are_bounded(database):
+    attempts = []
+
+    def read(conn):
+        attempts.append(conn)
+        raise error(psycopg2.errors.DeadlockDetected, '40P01')
+
+    with pytest.raises(psycopg2.errors.DeadlockDetected):
+        database.run_read(read, retries=3)
+    assert len(attempts) == 4
+    assert database.retries == 3
+    assert database.primary.returned == 4
+
+
+def test_permanent_errors_are_not_retried(database):
+    attempts = []
+
+    def read(conn):
+        attempts.append(conn)
+        raise error(psycopg2.errors.UndefinedTable, '42P01')
+
+    with pytest.raises(psycopg2.errors.UndefinedTable):
+        database.run_read(read)
+    assert len(attempts) == 1
+    assert database.retries == 0
+    assert database.primary.returned == 1
+
+
+def test_dead_connection_clears_its_pool(database):
+    attempts = []
+
+    def read(conn):
+        attempts.append(conn)
+        if len(attempts) == 1:
+            # What psycopg2 reports when the server went away mid-query
+            conn._conn.closed = 2
+            raise error(psycopg2.OperationalError, None)
+        return 'rows'
+
+    assert database.run_read(read) == 'rows'
+    assert database.primary.cleared == 1
+
+
+def test_live_connection_keeps_its_pool(database):
+    attempts = []
+
+    def read(conn):
+        attempts.append(conn)
+        if len(attempts) == 1:
+            raise error(psycopg2.errors.SerializationFailure, '40001')
+        return 'rows'
+
+    database.run_read(read)
+    assert database.primary.cleared == 0
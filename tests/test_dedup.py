@@ -0,0 +1,152 @@
+"""
+Duplicate detection: the blocking keys of dedup.py, and the indexed lookup
+and merge against a throwaway institution (skipped without PostgreSQL).
+
+    python -m pytest tests/test_dedup.py
+"""
+
+import uuid
+
+import pytest
+
+import dedup
+import storage
+
+
+@pytest.mark.parametrize('word, code', [
+    ('Robert', 'R163'),
+    ('Rupert', 'R163'),
+    ('Ashcraft', 'A261'),
+    ('Tymczak', 'T522'),
+    ('Pfister', 'P236'),
+    ('Honeyman', 'H555'),
+    ('Lee', 'L000'),
+    ('Ångström', 'A523'),
+    ('', ''),
+    ('42', ''),
+])
+def test_soundex(word, code):
+    assert dedup.soundex(word) == code
+
+
+@pytest.mark.parametrize('email, key', [
+    (' Asha.Verma@College.EDU ', 'asha.verma@college.edu'),
+    ('asha+cs2024@college.edu', 'asha@college.edu'),
+    ('Asha.Verma+x@gmail.com', 'ashaverma@gmail.com'),
+    ('a.verma@googlemail.com', 'averma@gmail.com'),
+    ('+tag@college.edu', None),
+    ('not-an-email', None),
+    ('', None),
+    (None, None),
+])
+def test_normalize_email(email, key):
+    assert dedup.normalize_email(email) == key
+
+
+def test_name_key_ignores_spelling_word_order_and_course_case():
+    key = dedup.name_key('Asha Verma', 'Computer Science')
+    assert key == 'A200 V650|computer science'
+    assert dedup.name_key('Aasha  Varma', ' computer  SCIENCE ') == key
+    assert dedup.name_key('Verma, Asha', 'Computer Science') == key
+    assert dedup.name_key('Asha Verma', 'Mechanical') != key
+
+
+def test_name_key_needs_a_name():
+    assert dedup.name_key('', 'Computer Science') is None
+    assert dedup.name_key(None, None) is None
+    assert dedup.name_key('--', 'Computer Science') is None
+
+
+# Against the database
+
+def student(name, email, course='Computer Science', **fields):
+    return dict({'student_id': f"D{uuid.uuid4().hex[:10]}", 'name': name, 'email': email, 'course': course,
+                 'attendance_percentage': 70.0, 'cgpa': 6.5, 'assignments_submitted': 7, 'assignments_total': 10}, **fields)
+
+
+@pytest.fixture
+def tenant(postgres_database, scratch_tenants):
+    """(backend, cursor, tenant_id, other_tenant_id) with the cursor's transaction rolled back afterwards"""
+    backend = storage.PostgresBackend(postgres_database)
+    conn = postgres_database.connect()
+    yield backend, conn.cursor(), scratch_tenants[0], scratch_tenants[1]
+    conn.rollback()
+    conn.close()
+
+
+def test_find_duplicates_matches_existing_students_and_earlier_rows(tenant):
+    backend, cur, tenant_id, other_tenant_id = tenant
+    asha, ravi = backend.add_students(tenant_id, [student('Asha Verma', 'asha.verma@gmail.com'),
+                                                  student('Ravi Kumar', 'ravi@college.edu', 'Mechanical')])
+    backend.add_student(other_tenant_id, student('Meera Nair', 'meera@college.edu'))
+
+    results = dedup.find_duplicates(cur, tenant_id, [
+        {'name': 'Aasha Varma', 'email': 'AshaVerma+new@gmail.com', 'course': 'computer science'},
+        {'name': 'Ravi Kumar', 'email': 'r.kumar@college.edu', 'course': 'Civil'},
+        {'name': 'Meera Nair', 'email': 'meera@college.edu', 'course': 'Computer Science'},
+        {'name': 'Mira Nayar', 'email': 'mira@college.edu', 'course': 'Computer Science'},
+    ])
+
+    assert [(match['id'], match['match']) for match in results[0]] == [(asha, ['email', 'name'])]
+    # Same name, different course, different email
+    assert results[1] == []
+    # Meera only exists in the other institution
+    assert results[2] == []
+    assert results[3] == [{'row': 2, 'match': ['name']}]
+    assert ravi not in [match.get('id') for matches in results for match in matches]
+
+
+def test_find_duplicates_skips_excluded_students(tenant):
+    backend, cur, tenant_id, _ = tenant
+    asha = backend.add_student(tenant_id, student('Asha Verma', 'asha@college.edu'))
+
+    candidate = {'name': 'Asha Verma', 'email': 'asha@college.edu', 'course': 'Computer Science'}
+    assert dedup.find_duplicates(cur, tenant_id, [candidate])[0][0]['id'] == asha
+    assert dedup.find_duplicates(cur, tenant_id, [candidate], exclude_ids=[asha]) == [[]]
+
+
+def test_merge_removes_the_duplicate_and_its_login(tenant):
+    backend, cur, tenant_id, _ = tenant
+    teacher = backend.create_user(tenant_id, f"t-{uuid.uuid4().hex[:10]}", f"{uuid.uuid4().hex[:10]}@example.com",
+                                  'secret')
+    login = backend.create_user(tenant_id, f"s-{uuid.uuid4().hex[:10]}", f"{uuid.uuid4().hex[:10]}@example.com",
+                                'secret', role='student')
+    keep = backend.add_student(tenant_id, student('Asha Verma', 'asha@college.edu', phone=None, owner_user_id=teacher,
+                                                  counselor_notes='Weekly check-ins'))
+    duplicate = backend.add_student(tenant_id, student('Aasha Varma', 'asha@college.edu', phone='9876543210',
+                                                       owner_user_id=login, counselor_notes='Needs tutoring'))
+
+    changes, removed_login = dedup.merge_students(cur, tenant_id, keep, duplicate)
+
+    assert removed_login == login
+    assert [change[1] for change in changes] == [teacher, login]
+    cur.execute("SELECT id FROM students WHERE tenant_id = %s AND id IN %s", (tenant_id, (keep, duplicate)))
+    assert cur.fetchall() == [(keep,)]
+    cur.execute("SELECT phone, counselor_notes, owner_user_id FROM students WHERE id = %s", (keep,))
+    assert cur.fetchone() == ('9876543210', 'Weekly check-ins\nNeeds tutoring', teacher)
+    cur.execute("SELECT 1 FROM users WHERE id = %s", (login,))
+    assert cur.fetchone() is None
+    cur.execute("SELECT 1 FROM users WHERE id = %s", (teacher,))
+    assert cur.fetchone()
+
+
+def test_merge_keeps_a_login_that_still_owns_the_kept_student(tenant):
+    backend, cur, tenant_id, _ = tenant
+    login = backend.create_user(tenant_id, f"s-{uuid.uuid4().hex[:10]}", f"{uuid.uuid4().hex[:10]}@example.com",
+                                'secret', role='student')
+    keep = backend.add_student(tenant_id, student('Asha Verma', 'asha@college.edu', owner_user_id=login))
+    duplicate = backend.add_student(tenant_id, student('Asha Verma', 'asha@college.edu', owner_user_id=login))
+
+    _, removed_login = dedup.merge_students(cur, tenant_id, keep, duplicate)
+    assert removed_login is None
+    cur.execute("SELECT 1 FROM users WHERE id = %s", (login,))
+    assert cur.fetchone()
+
+
+def test_merge_needs_both_students_in_scope(tenant):
+    backend, cur, tenant_id, other_tenant_id = tenant
+    keep = backend.add_student(tenant_id, student('Asha Verma', 'asha@college.edu'))
+    elsewhere = backend.add_student(other_tenant_id, student('Asha Verma', 'asha@college.edu'))
+
+    assert dedup.merge_students(cur, tenant_id, keep, elsewhere) is None
+    assert dedup.merge_students(cur, tenant_id, keep, keep + 10**9) is None
@@ -0,0 +1,74 @@
+"""
+Feature store reads shared between processes: two FeatureStore instances on
+one directory stand in for two gunicorn workers. No database is needed.
+
+    python -m pytest tests/test_feature_store.py
+"""
+
+import numpy as np
+import pytest
+
+import feature_store
+
+COLUMNS = ['attendance_percentage', 'cgpa']
+
+
+def write(store, upsert=None, remove=None):
+    """What refresh() does to the files, without a database"""
+    with store._lock, feature_store._FileLock(store._path('store.lock'), store.directory):
+        store._sync()
+        if upsert:
+            ids = sorted(upsert)
+            store._upsert(ids, np.array([upsert[student_id] for student_id in ids], dtype=np.float32))
+        if remove:
+            store._remove(remove)
+        store._write_meta()
+
+
+@pytest.fixture
+def stores(tmp_path):
+    writer = feature_store.FeatureStore(str(tmp_path), COLUMNS)
+    reader = feature_store.FeatureStore(str(tmp_path), COLUMNS)
+    write(writer, upsert={1: [10, 1], 2: [20, 2], 3: [30, 3]})
+    return writer, reader
+
+
+def test_reads_see_rows_another_process_swap_removed(stores):
+    writer, reader = stores
+    ids, X = reader.rows_for([1, 2, 3])
+    assert ids.tolist() == [1, 2, 3]
+
+    # Student 3 moves into student 1's row
+    write(writer, remove=[1])
+    ids, X = reader.rows_for([1, 3])
+    assert ids.tolist() == [3]
+    assert X.tolist() == [[30, 3]]
+
+    ids, X = reader.matrix()
+    assert sorted(zip(ids.tolist(), X[:, 0].tolist())) == [(2, 20), (3, 30)]
+
+
+def test_reads_see_rows_another_process_added(stores):
+    writer, reader = stores
+    reader.rows_for([1])
+    write(writer, upsert={4: [40, 4], 2: [25, 2.5]})
+
+    ids, X = reader.rows_for([4, 2, 9])
+    assert ids.tolist() == [4, 2]
+    assert X.tolist() == [[40, 4], [25, 2.5]]
+    assert len(reader.matrix()[0]) == 4
+
+
+def test_reads_are_copies(stores):
+    writer, reader = stores
+    _, X = reader.rows_for([1])
+    _, everything = reader.matrix()
+    write(writer, upsert={1: [11, 1.1]}, remove=[2])
+    assert X.tolist() == [[10, 1]]
+    assert everything[:, 0].tolist() == [10, 20, 30]
+
+
+def test_tombstoned_students_are_left_out(stores):
+    _, reader = stores
+    reader.mark_deleted([2])
+    assert reader.rows_for([1, 2, 3])[0].tolist() == [1, 3]
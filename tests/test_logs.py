@@ -0,0 +1,150 @@
+"""
+Logging pipeline of logs.py: event sampling, drop-on-full queueing and the
+JSON lines the writer thread produces. No database is needed.
+
+    python -m pytest tests/test_logs.py
+"""
+
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+import logs
+
+
+def record(event=None, level=logging.INFO, msg='hello %s', args=('world',)):
+    extra = {'event': event} if event else {}
+    return logging.makeLogRecord(dict(extra, name='test', levelno=level, levelname=logging.getLevelName(level),
+                                      msg=msg, args=args))
+
+
+def kept(sampler, records):
+    return [r for r in records if sampler.filter(r)]
+
+
+# EventSampler
+
+def test_keeps_one_in_n_records_of_a_sampled_event():
+    sampler = logs.EventSampler({'login_attempt': 0.1})
+    records = [record('login_attempt') for _ in range(100)]
+
+    kept_records = kept(sampler, records)
+    assert kept_records == records[::10]
+    assert all(r.sample_rate == 0.1 for r in kept_records)
+    assert sampler.skipped['login_attempt'] == 90
+
+
+def test_events_are_counted_separately():
+    sampler = logs.EventSampler({'login_attempt': 0.5, 'login_success': 0.25})
+    attempts = [record('login_attempt') for _ in range(8)]
+    successes = [record('login_success') for _ in range(8)]
+    # Interleaved, each event still keeps its own 1-in-N
+    for attempt, success in zip(attempts, successes):
+        sampler.filter(attempt)
+        sampler.filter(success)
+    assert sampler.skipped == {'login_attempt': 4, 'login_success': 6}
+
+
+def test_unsampled_events_and_plain_records_pass():
+    sampler = logs.EventSampler({'login_attempt': 0.1, 'export': 1.0})
+    records = [record('student_added') for _ in range(5)] + [record('export') for _ in range(5)] + [record()]
+    assert kept(sampler, records) == records
+    assert not any(hasattr(r, 'sample_rate') for r in records)
+    assert not sampler.skipped
+
+
+@pytest.mark.parametrize('level', [logging.WARNING, logging.ERROR, logging.CRITICAL])
+def test_warnings_and_errors_are_never_sampled(level):
+    sampler = logs.EventSampler({'login_attempt': 0.01, 'login_failed': 0})
+    records = [record('login_attempt', level) for _ in range(20)] + [record('login_failed', level) for _ in range(5)]
+    assert kept(sampler, records) == records
+    assert not sampler.skipped
+
+
+def test_debug_records_are_sampled_like_info():
+    sampler = logs.EventSampler({'login_attempt': 0.5})
+    assert len(kept(sampler, [record('login_attempt', logging.DEBUG) for _ in range(10)])) == 5
+
+
+def test_rate_zero_mutes_an_event():
+    sampler = logs.EventSampler({'heartbeat': 0, 'login_attempt': 0.5})
+    assert kept(sampler, [record('heartbeat') for _ in range(7)]) == []
+    assert sampler.skipped['heartbeat'] == 7
+    assert 'heartbeat' not in sampler.every
+    # Muting one event leaves the others alone
+    assert len(kept(sampler, [record('login_attempt') for _ in range(4)])) == 2
+
+
+def test_parse_sample_rates():
+    rates = logs.parse_sample_rates(' login_attempt=0.5 , heartbeat=0,')
+    assert rates == dict(logs.DEFAULT_SAMPLE_RATES, login_attempt=0.5, heartbeat=0.0)
+    assert logs.parse_sample_rates(None) == logs.DEFAULT_SAMPLE_RATES
+    with pytest.raises(ValueError):
+        logs.parse_sample_rates('login_attempt')
+
+
+# NonBlockingQueueHandler
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    handler = logs.NonBlockingQueueHandler(queue.Queue(1))
+    first, second, third = record(), record(), record()
+    handler.handle(first)
+    handler.handle(second)
+    handler.handle(third)
+
+    assert handler.dropped == 2
+    assert handler.queue.get_nowait() is first
+    handler.handle(second)
+    assert handler.dropped == 2
+    assert handler.queue.get_nowait() is second
+
+
+def test_records_are_queued_unformatted():
+    handler = logs.NonBlockingQueueHandler(queue.Queue())
+    queued = record(msg='%s', args=({'mutable': True},))
+    handler.handle(queued)
+    # Formatting is left to the writer thread, so msg and args are untouched
+    assert handler.queue.get_nowait() is queued
+    assert queued.args == ({'mutable': True},)
+
+
+# LogPipeline
+
+def test_pipeline_writes_json_lines_and_reports_metrics():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logs.JsonFormatter())
+    pipeline = logs.LogPipeline(handler, {'login_attempt': 0.5}, queue_size=100)
+    pipeline.start()
+    for _ in range(4):
+        pipeline.queue_handler.handle(record('login_attempt', msg='login by %s', args=('asha',)))
+    pipeline.queue_handler.handle(record('login_failed', logging.WARNING))
+    pipeline.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line['event'] for line in lines] == ['login_attempt', 'login_attempt', 'login_failed']
+    assert lines[0]['msg'] == 'login by asha'
+    assert lines[0]['sample_rate'] == 0.5
+    assert lines[2]['level'] == 'WARNING' and 'sample_rate' not in lines[2]
+    metrics = pipeline.metrics()
+    assert metrics['dropped'] == 0
+    assert metrics['queue_depth'] == 0
+    assert metrics['sample_rates'] == {'login_attempt': 0.5}
+    assert metrics['sampled_out'] == {'login_attempt': 2}
+
+
+def test_pipeline_drops_while_the_writer_is_behind():
+    stream = io.StringIO()
+    pipeline = logs.LogPipeline(logging.StreamHandler(stream), {}, queue_size=3)
+    # Not started yet, so nothing drains the queue
+    for index in range(5):
+        pipeline.queue_handler.handle(record(msg='line %s', args=(index,)))
+    assert pipeline.metrics()['dropped'] == 2
+    assert pipeline.metrics()['queue_depth'] == 3
+
+    pipeline.start()
+    pipeline.stop()
+    assert stream.getvalue().splitlines() == ['line 0', 'line 1', 'line 2']
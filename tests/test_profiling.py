@@ -0,0 +1,100 @@
+"""
+Sampling profiler windows shared between worker processes through PROFILE_DIR.
+
+    python -m pytest tests/test_profiling.py
+"""
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import profiling
+
+
+def busy_worker(directory, label, ready, done):
+    """A second "worker" that serves requests in `label` until `done` is set"""
+    profiler = profiling.SamplingProfiler(directory=directory)
+    ready.set()
+    while not done.is_set():
+        # What the app does on every request
+        profiler.sync()
+        ident = profiler.enter(label) if profiler.running else None
+        deadline = time.monotonic() + 0.02
+        while time.monotonic() < deadline:
+            pass
+        if ident is not None:
+            profiler.leave(ident)
+    profiler.stop()
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fast_window_checks(monkeypatch):
+    monkeypatch.setattr(profiling, 'WINDOW_CHECK_SECONDS', 0.05)
+
+
+def test_window_started_in_one_worker_samples_the_others(tmp_path, fast_window_checks):
+    context = multiprocessing.get_context('fork')
+    ready, done = context.Event(), context.Event()
+    other = context.Process(target=busy_worker, args=(str(tmp_path), 'other_route', ready, done))
+    other.start()
+    try:
+        assert ready.wait(10)
+        profiler = profiling.SamplingProfiler(interval_ms=2, directory=str(tmp_path))
+        stop_serving = threading.Event()
+
+        def serve():
+            ident = profiler.enter('local_route')
+            stop_serving.wait()
+            profiler.leave(ident)
+
+        server = threading.Thread(target=serve)
+        server.start()
+        assert profiler.start(30, 2)
+        assert not profiler.start(30, 2)
+        wait_until(lambda: 'other_route' in profiler.folded())
+        stop_serving.set()
+        server.join()
+
+        profiler.stop()
+        folded = profiler.folded()
+        assert 'local_route;' in folded and 'other_route;' in folded
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in folded.splitlines())
+        status = profiler.status()
+        assert not status['running']
+        assert status['samples'] > 0
+    finally:
+        done.set()
+        other.join(10)
+    # The other worker saw the stop and wrote out its final counts
+    assert 'other_route;' in profiling.SamplingProfiler(directory=str(tmp_path)).folded()
+
+
+def test_a_new_window_discards_the_last_one(tmp_path, fast_window_checks):
+    profiler = profiling.SamplingProfiler(interval_ms=1, directory=str(tmp_path))
+    ident = profiler.enter('first_route')
+    assert profiler.start(30)
+    wait_until(lambda: 'first_route' in profiler.folded())
+    profiler.stop()
+    profiler.leave(ident)
+
+    assert profiler.start(30)
+    profiler.stop()
+    assert 'first_route' not in profiler.folded()
+    assert profiling.SamplingProfiler(directory=str(tmp_path)).status()['running'] is False
+
+
+def test_no_window_yet(tmp_path):
+    profiler = profiling.SamplingProfiler(directory=str(tmp_path / 'missing'))
+    profiler.sync()
+    assert profiler.folded() == ''
+    assert profiler.status()['running'] is False
+    assert profiler.status()['samples'] == 0
@@ -0,0 +1,281 @@
+"""
+Query-plan regression suite: seeds a throwaway institution with
+PLAN_TEST_STUDENTS students (default 50000), then runs every registered hot
+query (statements.registry()) and the student list scans under
+EXPLAIN (ANALYZE, BUFFERS). Each query must only seq scan where that is
+declared, must stay within its budget of rows read and time, and must have
+the plan recorded in query_plans.json. The storage backend's student UPDATE,
+which varies with the fields sent, is checked with the update route's fields.
+Prepared statements are checked with both the custom and the generic plan,
+since a warmed-up connection may use either. Writes run in a transaction that
+is rolled back.
+
+When a schema or query change alters a plan on purpose, refresh the
+snapshot and review its diff along with the change:
+
+    UPDATE_PLAN_SNAPSHOTS=1 python -m pytest tests/test_query_plans.py
+"""
+
+import json
+import os
+import random
+import re
+import uuid
+
+import pytest
+from psycopg2.extras import execute_values
+
+import dedup
+import statements
+import storage
+import tenancy
+
+STUDENTS = int(os.getenv('PLAN_TEST_STUDENTS', 50000))
+TEACHERS = 50
+# Multiplies the time budgets, for slow machines
+TIME_FACTOR = float(os.getenv('PLAN_TEST_TIME_FACTOR', 1))
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plans.json')
+UPDATE_SNAPSHOTS = os.getenv('UPDATE_PLAN_SNAPSHOTS') == '1'
+
+SCAN_NODES = ('Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+
+class Seeded:
+    """Ids and values of the seeded institution that the cases are parameterized with"""
+
+    def __init__(self, tenant_id, teacher_ids, student_ids, emails):
+        self.tenant_id = tenant_id
+        self.teacher_ids = teacher_ids
+        self.student_ids = student_ids
+        self.emails = emails
+        self.per_teacher = STUDENTS // TEACHERS
+
+    @property
+    def student_id(self):
+        return self.student_ids[len(self.student_ids) // 2]
+
+    @property
+    def owner_id(self):
+        return self.teacher_ids[0]
+
+
+# name -> (params(seeded), rows read budget(seeded), time budget in ms, tables a seq scan is expected on)
+POINT = (lambda s: 10, 20)
+CASES = {
+    'storage_student_get': (lambda s: (s.tenant_id, s.student_id),) + POINT + ((),),
+    'storage_student_get_owned': (lambda s: (s.tenant_id, s.student_id, s.owner_id),) + POINT + ((),),
+    'storage_student_get_by_email': (lambda s: (s.tenant_id, s.student_id, s.emails[s.student_id]),) + POINT + ((),),
+    'storage_student_delete': (lambda s: (s.tenant_id, s.student_id),) + POINT + ((),),
+    'storage_student_blocking_keys': (lambda s: dedup.blocking_keys('Asha Verma', s.emails[s.student_id], 'Computer Science')
+                                      + (s.tenant_id, s.student_id),) + POINT + ((),),
+    'storage_user_get': (lambda s: (s.owner_id,),) + POINT + ((),),
+    'storage_user_by_username': (lambda s: (f"plan-teacher-{s.tenant_id}-0",),) + POINT + ((),),
+    'storage_dashboard_counts': (lambda s: (s.tenant_id,), lambda s: STUDENTS, 500, ('students',)),
+    'storage_dashboard_counts_owned': (lambda s: (s.tenant_id, s.owner_id), lambda s: 2 * s.per_teacher, 50, ()),
+    'student_rescore': (lambda s: (0.42, 'medium', 40.5, s.tenant_id, s.student_id),) + POINT + ((),),
+    'student_recalculate': (lambda s: (42.0, 'medium', s.tenant_id, s.student_id),) + POINT + ((),),
+    # Counts every student of the institution per teacher; reading the whole partition once is the plan
+    'teacher_stats': (lambda s: (s.tenant_id,), lambda s: STUDENTS + 2 * TEACHERS, 1000, ('students',)),
+}
+# The fields the update route sends
+def student_update_fields(s):
+    return {'name': 'Asha Verma', 'email': s.emails[s.student_id], 'phone': '9876543210', 'course': 'Computer Science',
+            'semester': 3, 'attendance_percentage': 72.5, 'cgpa': 6.8, 'assignments_submitted': 8,
+            'assignments_total': 10, 'dropout_risk_score': 0.42, 'risk_percentage': 42.0, 'risk_level': 'medium',
+            'model_risk_percentage': 40.5, 'teacher_id': s.owner_id, 'teacher_name': 'teacher'}
+
+
+# The backend's student update varies with the fields sent, so it isn't prepared; same layout as CASES
+UPDATE_CASE = (lambda s: list(student_update_fields(s).values()) + [s.tenant_id, s.student_id],) + POINT + ((),)
+# Unprepared queries (app.STUDENT_LIST_*), same layout
+SCAN_CASES = {
+    'STUDENT_LIST_ALL': (lambda s: (s.tenant_id,), lambda s: STUDENTS, 1000, ('students',)),
+    'STUDENT_LIST_OWNED': (lambda s: (s.tenant_id, s.owner_id), lambda s: 2 * s.per_teacher, 100, ()),
+    'STUDENT_LIST_BY_EMAIL': (lambda s: (s.tenant_id, s.emails[s.student_id]),) + POINT + ((),),
+}
+
+
+@pytest.fixture(scope='module')
+def app_module(postgres_database):
+    """The app, imported for the statements it registers (its startup migrations are idempotent)"""
+    import app
+    return app
+
+
+@pytest.fixture(scope='module')
+def seeded(postgres_database, app_module):
+    conn = postgres_database.connect()
+    cur = conn.cursor()
+    slug = f"plans-{uuid.uuid4().hex[:10]}"
+    tenant_id = tenancy.create_tenant(cur, slug, slug)
+    try:
+        execute_values(cur, """
+            INSERT INTO users (username, email, password, role, name, tenant_id) VALUES %s RETURNING id
+        """, [(f"plan-teacher-{tenant_id}-{i}", f"plan-teacher-{tenant_id}-{i}@example.com", 'secret', 'teacher',
+               f"Teacher {i}", tenant_id) for i in range(TEACHERS)], fetch=True)
+        cur.execute("SELECT id FROM users WHERE tenant_id = %s ORDER BY id", (tenant_id,))
+        teacher_ids = [row[0] for row in cur.fetchall()]
+        # Students added by staff get a login of their own, so users grows with students
+        execute_values(cur, """
+            INSERT INTO users (username, email, password, role, name, tenant_id) VALUES %s
+        """, [(f"P{tenant_id}-{i:08d}", f"plan{tenant_id}-{i}@example.com", 'secret', 'student', f"Student {i}",
+               tenant_id) for i in range(STUDENTS)], page_size=5000)
+
+        rng = random.Random(7)
+        courses = ['Computer Science', 'Mechanical', 'Commerce', 'Biology', 'Civil', 'Economics']
+        rows = []
+        for i in range(STUDENTS):
+            name, email, course = f"Student {i}", f"plan{i}@example.com", rng.choice(courses)
+            rows.append((tenant_id, f"P{i:08d}", name, email, course, rng.randint(1, 8),
+                         rng.uniform(20, 100), rng.uniform(2, 10), rng.randint(0, 10), 10, rng.randint(1, 3),
+                         rng.uniform(1e5, 1e6), rng.uniform(1, 10), rng.choice(['high', 'medium', 'low']),
+                         rng.uniform(0, 100), teacher_ids[i % TEACHERS]) + dedup.blocking_keys(name, email, course))
+        students = execute_values(cur, """
+            INSERT INTO students (tenant_id, student_id, name, email, course, semester, attendance_percentage, cgpa,
+                                  assignments_submitted, assignments_total, exam_attempts, family_income,
+                                  mental_health_score, risk_level, risk_percentage, owner_user_id, email_key, name_key)
+            VALUES %s RETURNING id, email
+        """, rows, page_size=5000, fetch=True)
+        conn.commit()
+        # Sample every row so the statistics, and with them the plans, are the same on every run
+        cur.execute(f"SET default_statistics_target = {min(10000, max(100, STUDENTS // 300 + 1))}")
+        cur.execute(f"ANALYZE {tenancy.partition_name(tenant_id)}")
+        cur.execute("ANALYZE users")
+        conn.commit()
+
+        yield Seeded(tenant_id, teacher_ids, sorted(student_id for student_id, _ in students), dict(students))
+    finally:
+        conn.rollback()
+        tenancy.drop_tenant(cur, tenant_id)
+        conn.commit()
+        conn.close()
+
+
+def summarize(plan, tenant_id, depth=0):
+    """Plan tree as indented lines of node type, index and relation, without tenant-specific names"""
+    line = plan['Node Type']
+    if plan.get('Index Name'):
+        line += f" using {plan['Index Name']}"
+    if plan.get('Relation Name'):
+        line += f" on {plan['Relation Name']}"
+    line = line.replace(tenancy.partition_name(tenant_id), 'students_t<tenant>')
+    lines = ['  ' * depth + line]
+    for child in plan.get('Plans', []):
+        lines += summarize(child, tenant_id, depth + 1)
+    return lines
+
+
+def scans(plan):
+    if plan['Node Type'] in SCAN_NODES:
+        yield plan
+    for child in plan.get('Plans', []):
+        yield from scans(child)
+
+
+def explain(cur, sql, params):
+    # Whether a scan goes parallel depends on the server's worker settings, not on the query
+    cur.execute("SET LOCAL max_parallel_workers_per_gather = 0")
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+    return cur.fetchone()[0][0]
+
+
+def check_plan(result, seeded, name, rows_budget, ms_budget, seq_scan_tables):
+    plan = result['Plan']
+    problems = []
+    rows_read = 0
+    for scan in scans(plan):
+        table = re.sub(r'_t\d+$', '', scan['Relation Name'])
+        if scan['Node Type'] == 'Seq Scan' and table not in seq_scan_tables:
+            problems.append(f"sequential scan on {scan['Relation Name']}")
+        rows_read += (scan['Actual Rows'] + scan.get('Rows Removed by Filter', 0)
+                      + scan.get('Rows Removed by Index Recheck', 0)) * scan['Actual Loops']
+    budget = rows_budget(seeded)
+    if rows_read > budget:
+        problems.append(f"read {rows_read} rows, budget {budget}")
+    if result['Execution Time'] > ms_budget * TIME_FACTOR:
+        problems.append(f"took {result['Execution Time']:.1f} ms, budget {ms_budget * TIME_FACTOR:.0f} ms")
+    assert not problems, f"{name}: {'; '.join(problems)}\n" + '\n'.join(summarize(plan, seeded.tenant_id))
+    return summarize(plan, seeded.tenant_id)
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    """Plan summaries recorded in query_plans.json; rewritten at the end in update mode"""
+    if os.path.exists(SNAPSHOT_PATH):
+        with open(SNAPSHOT_PATH) as f:
+            recorded = json.load(f)
+    else:
+        recorded = {}
+    current = {}
+    yield recorded, current
+    if UPDATE_SNAPSHOTS:
+        with open(SNAPSHOT_PATH, 'w') as f:
+            json.dump(dict(sorted(current.items())), f, indent=2)
+            f.write('\n')
+
+
+def match_snapshot(snapshots, key, summary):
+    recorded, current = snapshots
+    current[key] = summary
+    if UPDATE_SNAPSHOTS:
+        return
+    assert key in recorded, f"No recorded plan for {key}; run with UPDATE_PLAN_SNAPSHOTS=1 and review query_plans.json"
+    assert summary == recorded[key], (f"Plan for {key} changed; if intended, run with UPDATE_PLAN_SNAPSHOTS=1\n"
+                                      f"recorded:\n" + '\n'.join(recorded[key]) + "\nnow:\n" + '\n'.join(summary))
+
+
+def test_every_registered_statement_has_a_plan_case(app_module):
+    assert set(statements.registry()) == set(CASES)
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+@pytest.mark.parametrize('plan_mode', ['custom', 'generic'])
+def test_statement_plan(name, plan_mode, postgres_database, seeded, snapshots):
+    statement = statements.registry()[name]
+    params, rows_budget, ms_budget, seq_scan_tables = CASES[name]
+    # Prepared under its own name, so the plan mode below decides the plan
+    test_name = f"plan_test_{name}"
+    conn = postgres_database.connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SET plan_cache_mode = force_{plan_mode}_plan")
+        cur.execute(statement.prepare_sql.replace(f"PREPARE {name} ", f"PREPARE {test_name} ", 1))
+        result = explain(cur, statement.execute_sql.replace(f"EXECUTE {name}", f"EXECUTE {test_name}", 1),
+                         params(seeded))
+        summary = check_plan(result, seeded, name, rows_budget, ms_budget, seq_scan_tables)
+    finally:
+        # Prepared statements outlive the rollback
+        conn.rollback()
+        cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (test_name,))
+        if cur.fetchone():
+            cur.execute(f"DEALLOCATE {test_name}")
+        conn.commit()
+        conn.close()
+    match_snapshot(snapshots, f"{name} ({plan_mode})", summary)
+
+
+def test_student_update_plan(postgres_database, seeded, snapshots):
+    params, rows_budget, ms_budget, seq_scan_tables = UPDATE_CASE
+    sql = storage.PostgresBackend.student_update_sql(list(student_update_fields(seeded)))
+    conn = postgres_database.connect()
+    try:
+        result = explain(conn.cursor(), sql, params(seeded))
+        summary = check_plan(result, seeded, 'storage_student_update', rows_budget, ms_budget, seq_scan_tables)
+    finally:
+        conn.rollback()
+        conn.close()
+    match_snapshot(snapshots, 'storage_student_update', summary)
+
+
+@pytest.mark.parametrize('name', sorted(SCAN_CASES))
+def test_student_list_plan(name, app_module, postgres_database, seeded, snapshots):
+    params, rows_budget, ms_budget, seq_scan_tables = SCAN_CASES[name]
+    conn = postgres_database.connect()
+    try:
+        cur = conn.cursor()
+        result = explain(cur, getattr(app_module, name), params(seeded))
+        summary = check_plan(result, seeded, name, rows_budget, ms_budget, seq_scan_tables)
+    finally:
+        conn.rollback()
+        conn.close()
+    match_snapshot(snapshots, name, summary)
@@ -0,0 +1,63 @@
+"""
+Scenario grids of simulation.py: range expansion and the MAX_SCENARIOS limit,
+which has to hold before any axis is allocated. No database is needed.
+
+    python -m pytest tests/test_simulation.py
+"""
+
+import numpy as np
+import pytest
+
+import simulation
+
+
+@pytest.mark.parametrize('spec, values', [
+    ({'start': 0, 'stop': 1, 'step': 0.25}, [0, 0.25, 0.5, 0.75, 1]),
+    ({'start': 0, 'stop': 0.3, 'step': 0.1}, [0, 0.1, 0.2, 0.3]),
+    ({'start': 0, 'stop': 1, 'step': 0.3}, [0, 0.3, 0.6, 0.9]),
+    ({'start': -10, 'stop': 10, 'step': 10}, [-10, 0, 10]),
+    ({'start': 2, 'stop': 2}, [2]),
+    ([5, -5, 0], [5, -5, 0]),
+])
+def test_axis_values(spec, values):
+    assert np.allclose(simulation._axis_values(spec), values)
+    assert simulation._axis_length(spec) == len(values)
+
+
+def test_grid_is_every_combination():
+    fields, axes, deltas = simulation.build_scenario_grid({'cgpa': [0, 1],
+                                                           'attendance_percentage': {'start': 0, 'stop': 20, 'step': 10}})
+    assert fields == ['cgpa', 'attendance_percentage']
+    assert [len(axis) for axis in axes] == [2, 3]
+    assert deltas.tolist() == [[0, 0], [0, 10], [0, 20], [1, 0], [1, 10], [1, 20]]
+
+
+@pytest.mark.parametrize('changes', [
+    {'attendance_percentage': {'start': 0, 'stop': 1e12, 'step': 1e-3}},
+    {'cgpa': {'start': 0, 'stop': 10, 'step': 0.001}, 'attendance_percentage': {'start': 0, 'stop': 100}},
+    {'cgpa': list(range(200)), 'attendance_percentage': list(range(200))},
+])
+def test_oversized_grids_are_refused_before_allocating(changes, monkeypatch):
+    def no_allocation(*args, **kwargs):
+        raise AssertionError("axis built before the scenario limit was checked")
+
+    monkeypatch.setattr(simulation.np, 'arange', no_allocation)
+    monkeypatch.setattr(simulation.np, 'asarray', no_allocation)
+    with pytest.raises(ValueError, match='Too many scenarios'):
+        simulation.build_scenario_grid(changes)
+
+
+@pytest.mark.parametrize('changes, message', [
+    ({'cgpa': {'start': 1, 'stop': 0}}, 'stop must not be less than start'),
+    ({'cgpa': {'start': 0, 'stop': 1, 'step': 0}}, 'step must be positive'),
+    ({'cgpa': {'start': 0, 'stop': 'inf'}}, 'finite'),
+    ({'cgpa': {'start': -1e308, 'stop': 1e308, 'step': 1e-300}}, 'too many values'),
+    ({'cgpa': {'stop': 1}}, 'numeric start and stop'),
+    ({'cgpa': ['high']}, 'must be numbers'),
+    ({'cgpa': []}, 'non-empty list'),
+    ({'height': [1]}, 'Unsupported feature'),
+    ({}, 'changes must map'),
+])
+def test_invalid_changes(changes, message):
+    with pytest.raises(ValueError, match=message):
+        simulation.build_scenario_grid(changes)
@@ -0,0 +1,282 @@
+"""
+Contract suite for storage.py: every backend must behave identically here.
+
+    python -m pytest tests/test_storage_contract.py
+"""
+
+import threading
+import uuid
+from datetime import datetime
+
+import pytest
+
+import storage
+
+
+def unique(prefix):
+    # Usernames and emails are global in Postgres, and the app's own users share the table
+    return f"{prefix}-{uuid.uuid4().hex[:10]}"
+
+
+def make_user(backend, tenant_id, role='teacher'):
+    username = unique(role)
+    return backend.create_user(tenant_id, username, f"{username}@example.com", 'secret', role=role)
+
+
+def make_student(owner_user_id=None, **fields):
+    student = {
+        'student_id': unique('S'),
+        'name': 'Asha Verma',
+        'email': f"{unique('student')}@example.com",
+        'phone': '9876543210',
+        'course': 'Computer Science',
+        'semester': 3,
+        'attendance_percentage': 72.5,
+        'cgpa': 6.8,
+        'assignments_submitted': 8,
+        'assignments_total': 10,
+        'exam_attempts': 1,
+        'family_income': 250000.0,
+        'study_hours': 3.5,
+        'mental_health_score': 6.0,
+        'dropout_risk_score': 0.42,
+        'risk_percentage': 42.0,
+        'risk_level': 'medium',
+        'model_risk_percentage': 40.5,
+        'counselor_notes': 'Weekly check-ins',
+        'intervention_plan': 'Peer tutoring',
+        'owner_user_id': owner_user_id,
+        'teacher_id': None,
+        'teacher_name': None,
+    }
+    student.update(fields)
+    return student
+
+
+def test_user_round_trip(backend):
+    backend, tenant_id, _ = backend
+    username = unique('teacher')
+    user_id = backend.create_user(tenant_id, username, f"{username}@example.com", 'secret')
+
+    user = backend.get_user(user_id)
+    assert user == backend.find_user(username)
+    assert set(user) == set(storage.USER_FIELDS)
+    assert (user['username'], user['password'], user['role'], user['name']) == (username, 'secret', 'teacher', username)
+    assert user['auth_version'] == 1
+    assert user['tenant_id'] == tenant_id
+    assert isinstance(user['created_at'], datetime)
+    assert backend.get_user(-1) is None
+    assert backend.find_user(unique('nobody')) is None
+
+
+def test_duplicate_username_and_email_are_rejected(backend):
+    backend, tenant_id, other_tenant_id = backend
+    username = unique('teacher')
+    backend.create_user(tenant_id, username, f"{username}@example.com", 'secret')
+
+    with pytest.raises(storage.DuplicateError):
+        backend.create_user(other_tenant_id, username, f"{unique('x')}@example.com", 'secret')
+    with pytest.raises(storage.DuplicateError):
+        backend.create_user(tenant_id, unique('teacher'), f"{username}@example.com", 'secret')
+
+
+def test_list_users_filters_by_tenant_and_role(backend):
+    backend, tenant_id, other_tenant_id = backend
+    teachers = [make_user(backend, tenant_id) for _ in range(3)]
+    student_user = make_user(backend, tenant_id, role='student')
+    make_user(backend, other_tenant_id)
+
+    listed = backend.list_users(tenant_id)
+    assert {user['id'] for user in listed} == set(teachers) | {student_user}
+    assert [user['username'] for user in listed] == sorted(user['username'] for user in listed)
+    assert {user['id'] for user in backend.list_users(tenant_id, role='teacher')} == set(teachers)
+
+
+def test_update_user_bumps_auth_version(backend):
+    backend, tenant_id, other_tenant_id = backend
+    user_id = make_user(backend, tenant_id)
+
+    assert backend.update_user(tenant_id, user_id, {'role': 'admin', 'name': 'Head of Department'})
+    user = backend.get_user(user_id)
+    assert (user['role'], user['name'], user['auth_version']) == ('admin', 'Head of Department', 2)
+
+    assert not backend.update_user(other_tenant_id, user_id, {'role': 'student'})
+    assert backend.get_user(user_id)['role'] == 'admin'
+    with pytest.raises(ValueError):
+        backend.update_user(tenant_id, user_id, {'password': 'changed'})
+
+
+def test_delete_user_only_in_its_tenant(backend):
+    backend, tenant_id, other_tenant_id = backend
+    user_id = make_user(backend, tenant_id)
+
+    assert not backend.delete_user(other_tenant_id, user_id)
+    assert backend.delete_user(tenant_id, user_id)
+    assert backend.get_user(user_id) is None
+    assert not backend.delete_user(tenant_id, user_id)
+
+
+def test_student_round_trip(backend):
+    backend, tenant_id, _ = backend
+    owner_id = make_user(backend, tenant_id)
+    student = make_student(owner_id, teacher_id=owner_id, teacher_name='teacher')
+    student_id = backend.add_student(tenant_id, student)
+
+    stored = backend.get_student(tenant_id, student_id)
+    assert set(stored) == set(storage.STUDENT_COLUMNS)
+    assert {field: stored[field] for field in storage.STUDENT_FIELDS} == student
+    assert (stored['id'], stored['tenant_id']) == (student_id, tenant_id)
+    assert isinstance(stored['created_at'], datetime)
+    assert isinstance(stored['last_updated'], datetime)
+
+
+def test_student_ids_are_unique_per_tenant(backend):
+    backend, tenant_id, other_tenant_id = backend
+    student = make_student()
+    backend.add_student(tenant_id, student)
+
+    with pytest.raises(storage.DuplicateError):
+        backend.add_student(tenant_id, dict(student, email=f"{unique('other')}@example.com"))
+    assert backend.add_student(other_tenant_id, student)
+
+
+def test_failed_bulk_insert_adds_nothing(backend):
+    backend, tenant_id, _ = backend
+    students = [make_student() for _ in range(3)]
+    students.append(dict(students[0]))
+
+    with pytest.raises(storage.DuplicateError):
+        backend.add_students(tenant_id, students)
+    assert backend.dashboard_counts(tenant_id)['total'] == 0
+
+
+def test_skip_existing_leaves_taken_student_ids_out(backend):
+    backend, tenant_id, _ = backend
+    taken = make_student()
+    backend.add_student(tenant_id, taken)
+    fresh = make_student()
+
+    ids = backend.add_students(tenant_id, [fresh, dict(taken), dict(fresh)], skip_existing=True)
+    assert ids[0] is not None and ids[1:] == [None, None]
+    assert backend.get_student(tenant_id, ids[0])['student_id'] == fresh['student_id']
+    assert backend.dashboard_counts(tenant_id)['total'] == 2
+
+
+def test_write_hooks_run_in_the_write_transaction(backend):
+    backend, tenant_id, _ = backend
+    seen = []
+    student_id = backend.add_student(tenant_id, make_student(), hook=lambda cur, ids: seen.append(ids))
+    assert seen == [[student_id]]
+
+    def fail(cur, result):
+        raise RuntimeError('hook failed')
+
+    with pytest.raises(RuntimeError):
+        backend.update_student(tenant_id, student_id, {'risk_level': 'high'}, hook=fail)
+    with pytest.raises(RuntimeError):
+        backend.delete_student(tenant_id, student_id, hook=fail)
+    with pytest.raises(RuntimeError):
+        backend.add_student(tenant_id, make_student(), hook=fail)
+    assert backend.get_student(tenant_id, student_id)['risk_level'] == 'medium'
+    assert backend.dashboard_counts(tenant_id)['total'] == 1
+
+    assert backend.delete_student(tenant_id, student_id, hook=lambda cur, deleted: seen.append(deleted))
+    assert seen[-1] is True
+
+
+def test_backends_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        storage.StorageBackend()
+    for backend_class in (storage.PostgresBackend, storage.SQLiteBackend):
+        assert not backend_class.__abstractmethods__
+
+
+def test_get_student_scopes(backend):
+    backend, tenant_id, other_tenant_id = backend
+    owner_id = make_user(backend, tenant_id)
+    other_owner_id = make_user(backend, tenant_id)
+    student = make_student(owner_id)
+    student_id = backend.add_student(tenant_id, student)
+
+    assert backend.get_student(tenant_id, student_id, owner_user_id=owner_id)['id'] == student_id
+    assert backend.get_student(tenant_id, student_id, owner_user_id=other_owner_id) is None
+    assert backend.get_student(tenant_id, student_id, email=student['email'])['id'] == student_id
+    assert backend.get_student(tenant_id, student_id, email='someone@example.com') is None
+    assert backend.get_student(other_tenant_id, student_id) is None
+
+
+def test_iter_students_in_id_order_across_chunks(backend, monkeypatch):
+    backend, tenant_id, other_tenant_id = backend
+    monkeypatch.setattr(storage, 'LIST_CHUNK_ROWS', 4)
+    owner_id = make_user(backend, tenant_id)
+    owned = backend.add_students(tenant_id, [make_student(owner_id) for _ in range(7)])
+    unowned = backend.add_students(tenant_id, [make_student() for _ in range(5)])
+    backend.add_students(other_tenant_id, [make_student() for _ in range(2)])
+
+    assert len(owned) == 7 and len(set(owned)) == 7
+    assert [student['id'] for student in backend.iter_students(tenant_id)] == sorted(owned + unowned)
+    assert [student['id'] for student in backend.iter_students(tenant_id, owner_user_id=owner_id)] == sorted(owned)
+    email = backend.get_student(tenant_id, unowned[2])['email']
+    assert [student['id'] for student in backend.iter_students(tenant_id, email=email)] == [unowned[2]]
+
+
+def test_update_student(backend):
+    backend, tenant_id, other_tenant_id = backend
+    student_id = backend.add_student(tenant_id, make_student())
+    before = backend.get_student(tenant_id, student_id)
+
+    assert backend.update_student(tenant_id, student_id, {'cgpa': 8.1, 'risk_level': 'low', 'counselor_notes': None})
+    after = backend.get_student(tenant_id, student_id)
+    assert (after['cgpa'], after['risk_level'], after['counselor_notes']) == (8.1, 'low', None)
+    assert after['name'] == before['name']
+    assert after['last_updated'] >= before['last_updated']
+
+    assert not backend.update_student(other_tenant_id, student_id, {'cgpa': 1.0})
+    with pytest.raises(ValueError):
+        backend.update_student(tenant_id, student_id, {'tenant_id': other_tenant_id})
+
+
+def test_delete_student_only_in_its_tenant(backend):
+    backend, tenant_id, other_tenant_id = backend
+    student_id = backend.add_student(tenant_id, make_student())
+
+    assert not backend.delete_student(other_tenant_id, student_id)
+    assert backend.delete_student(tenant_id, student_id)
+    assert backend.get_student(tenant_id, student_id) is None
+
+
+def test_dashboard_counts(backend):
+    backend, tenant_id, other_tenant_id = backend
+    assert backend.dashboard_counts(tenant_id) == {'total': 0, 'high': 0, 'medium': 0, 'low': 0}
+
+    owner_id = make_user(backend, tenant_id)
+    levels = ['high', 'high', 'medium', 'low', 'low', 'low']
+    backend.add_students(tenant_id, [make_student(owner_id, risk_level=level) for level in levels])
+    backend.add_students(tenant_id, [make_student(risk_level='high'), make_student(risk_level=None)])
+    backend.add_students(other_tenant_id, [make_student(risk_level='high')])
+
+    assert backend.dashboard_counts(tenant_id) == {'total': 8, 'high': 3, 'medium': 1, 'low': 3}
+    assert backend.dashboard_counts(tenant_id, owner_user_id=owner_id) == {'total': 6, 'high': 2, 'medium': 1, 'low': 3}
+
+
+def test_concurrent_writers_and_readers(backend):
+    backend, tenant_id, _ = backend
+    errors = []
+
+    def writer():
+        try:
+            for _ in range(20):
+                student_id = backend.add_student(tenant_id, make_student())
+                backend.update_student(tenant_id, student_id, {'risk_level': 'high'})
+                backend.dashboard_counts(tenant_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert backend.dashboard_counts(tenant_id) == {'total': 160, 'high': 160, 'medium': 0, 'low': 0}
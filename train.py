@@ -0,0 +1,227 @@
+"""
+SehatMind - Model training pipeline
+Builds the feature matrix from the feature store (or straight from the
+database), fits a grid of candidate models in a process pool, scores each on
+stratified cross-validation folds and measures its inference latency. The
+best model by AUC that fits the latency budget is written as the artifact
+DropoutPredictor loads at startup, together with a metrics JSON file.
+
+    python train.py --latency-budget-ms 50
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+import db
+from compiled_model import VERIFY_TOLERANCE, CompiledForest, probe_rows, trees_path, verify
+
+# Rows used to time inference, latencies are reported per this many rows
+LATENCY_ROWS = 10000
+
+# name -> (estimator, hyperparameters)
+CANDIDATES = {
+    'rf_100': ('random_forest', {'n_estimators': 100}),
+    'rf_200_depth16': ('random_forest', {'n_estimators': 200, 'max_depth': 16}),
+    'rf_50_depth8': ('random_forest', {'n_estimators': 50, 'max_depth': 8}),
+    'rf_100_leaf5': ('random_forest', {'n_estimators': 100, 'min_samples_leaf': 5}),
+    'extra_trees_100': ('extra_trees', {'n_estimators': 100}),
+    'extra_trees_100_depth12': ('extra_trees', {'n_estimators': 100, 'max_depth': 12}),
+    'hist_gb': ('hist_gradient_boosting', {'max_iter': 200}),
+    'hist_gb_depth6': ('hist_gradient_boosting', {'max_iter': 100, 'max_depth': 6}),
+}
+
+
+def build_estimator(kind, params, n_jobs=1):
+    from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+    if kind == 'random_forest':
+        return RandomForestClassifier(random_state=42, n_jobs=n_jobs, **params)
+    if kind == 'extra_trees':
+        return ExtraTreesClassifier(random_state=42, n_jobs=n_jobs, **params)
+    if kind == 'hist_gradient_boosting':
+        return HistGradientBoostingClassifier(random_state=42, **params)
+    raise ValueError(f"Unknown estimator: {kind}")
+
+
+def measure_latency(model, X, rows=LATENCY_ROWS, repeats=3):
+    """Best-of-`repeats` single-threaded predict_proba time in ms for `rows` rows"""
+    sample = np.resize(X, (rows, X.shape[1])) if len(X) else X
+    if hasattr(model, 'n_jobs'):
+        model.set_params(n_jobs=1)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict_proba(sample)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def measure_single_row(predict, X, repeats=200):
+    """Median time in ms to score one row"""
+    row = np.asarray(X[:1])
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        predict(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000
+
+
+def evaluate_candidate(name, kind, params, X, y, folds, n_jobs):
+    """Cross-validate one candidate (runs inside a pool worker)"""
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import StratifiedKFold
+
+    aucs = []
+    fit_seconds = []
+    for train_index, test_index in StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(X, y):
+        model = build_estimator(kind, params, n_jobs)
+        started = time.perf_counter()
+        model.fit(X[train_index], y[train_index])
+        fit_seconds.append(time.perf_counter() - started)
+        aucs.append(roc_auc_score(y[test_index], model.predict_proba(X[test_index])[:, 1]))
+
+    return {
+        'name': name,
+        'estimator': kind,
+        'params': params,
+        'auc_mean': round(float(np.mean(aucs)), 4),
+        'auc_std': round(float(np.std(aucs)), 4),
+        'fit_seconds': round(float(np.mean(fit_seconds)), 3),
+        'latency_ms_per_10k': round(measure_latency(model, X), 2),
+    }
+
+
+def search(X, y, candidates, folds, workers):
+    """Evaluate every candidate, `workers` at a time, splitting the cores between them"""
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(evaluate_candidate, name, kind, params, X, y, folds, n_jobs): name
+                   for name, (kind, params) in candidates.items()}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"  {futures[future]:<26} failed: {e}")
+                continue
+            results.append(result)
+            print(f"  {result['name']:<26} AUC {result['auc_mean']:.4f} ± {result['auc_std']:.4f}  "
+                  f"fit {result['fit_seconds']:7.2f}s  latency {result['latency_ms_per_10k']:8.2f} ms/10k rows")
+    return results
+
+
+def select_best(results, latency_budget_ms=None, auc_tolerance=0.005):
+    """Highest AUC within the latency budget; candidates within `auc_tolerance` of it go to the fastest"""
+    eligible = [r for r in results if latency_budget_ms is None or r['latency_ms_per_10k'] <= latency_budget_ms]
+    if not eligible:
+        return None
+    best_auc = max(r['auc_mean'] for r in eligible)
+    close = [r for r in eligible if r['auc_mean'] >= best_auc - auc_tolerance]
+    return min(close, key=lambda r: r['latency_ms_per_10k'])
+
+
+def write_artifact(path, model, feature_columns, winner, results, rows):
+    """Save the fitted model and its metrics next to each other, atomically"""
+    import joblib
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    trained_at = datetime.now().isoformat(timespec='seconds')
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump({'model': model, 'feature_columns': feature_columns, 'candidate': winner['name'],
+                 'trained_at': trained_at}, temp_path)
+    os.replace(temp_path, path)
+
+    metrics = {'trained_at': trained_at, 'rows': rows, 'feature_columns': feature_columns,
+               'winner': winner, 'candidates': sorted(results, key=lambda r: -r['auc_mean'])}
+    with open(metrics_path(path), 'w') as handle:
+        json.dump(metrics, handle, indent=2)
+
+
+def metrics_path(path):
+    return os.path.splitext(path)[0] + '.metrics.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SehatMind model training pipeline')
+    parser.add_argument('--source', choices=['store', 'db'], default='store',
+                        help='read features from the feature store (default) or query the students table')
+    parser.add_argument('--candidates', nargs='+', choices=sorted(CANDIDATES), help='only try these candidates')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=min(len(CANDIDATES), os.cpu_count() or 1),
+                        help='candidates evaluated in parallel')
+    parser.add_argument('--latency-budget-ms', type=float, help='max predict time per 10k rows')
+    parser.add_argument('--min-auc', type=float, default=0.7, help="don't write a model scoring below this")
+    parser.add_argument('--output', help='artifact path (default: MODEL_ARTIFACT_PATH)')
+    args = parser.parse_args()
+
+    # Imported here so pool workers don't pull in the web app
+    from app import MODEL_ARTIFACT_PATH, DropoutPredictor, get_db_connection, student_features
+
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("Failed to connect to database")
+    cur = conn.cursor()
+    if args.source == 'store':
+        student_features.refresh(cur)
+        _, X = student_features.matrix()
+        X = np.asarray(X)
+    else:
+        columns = ', '.join(DropoutPredictor.FEATURE_COLUMNS)
+        chunks = [np.nan_to_num(np.array(rows, dtype=np.float64), nan=0.0).astype(np.float32)
+                  for rows in db.iter_chunks(conn, f"SELECT {columns} FROM students")]
+        X = np.vstack(chunks) if chunks else np.empty((0, len(DropoutPredictor.FEATURE_COLUMNS)), dtype=np.float32)
+    conn.close()
+
+    y = DropoutPredictor.synthetic_labels(X)
+    positives = int(y.sum())
+    print(f"Training on {len(X)} students ({positives} labelled at risk)")
+    if min(positives, len(y) - positives) < args.folds:
+        raise SystemExit(f"Need at least {args.folds} students of each class for {args.folds}-fold validation")
+
+    candidates = {name: CANDIDATES[name] for name in (args.candidates or CANDIDATES)}
+    results = search(X, y, candidates, args.folds, max(1, min(args.workers, len(candidates))))
+    winner = select_best(results, args.latency_budget_ms)
+    if winner is None:
+        raise SystemExit(f"No candidate fits the {args.latency_budget_ms} ms/10k rows latency budget")
+    if winner['auc_mean'] < args.min_auc:
+        raise SystemExit(f"Best candidate {winner['name']} has AUC {winner['auc_mean']}, below --min-auc {args.min_auc}")
+
+    # Refit the winner on every row using all cores
+    model = build_estimator(winner['estimator'], winner['params'], n_jobs=-1)
+    started = time.perf_counter()
+    model.fit(X, y)
+    winner = dict(winner, full_fit_seconds=round(time.perf_counter() - started, 3))
+    if hasattr(model, 'n_jobs'):
+        model.set_params(n_jobs=1)
+
+    # Export the flattened trees for the low-latency scorer, verified against sklearn
+    compiled = CompiledForest.from_sklearn(model)
+    probe = probe_rows(X)
+    if compiled is not None:
+        difference = verify(model, compiled, probe)
+        if difference > VERIFY_TOLERANCE:
+            raise SystemExit(f"Compiled trees differ from sklearn by {difference}")
+        winner['compiled_max_difference'] = difference
+        winner['compiled_single_row_ms'] = round(measure_single_row(compiled.predict, X), 4)
+    winner['sklearn_single_row_ms'] = round(measure_single_row(model.predict_proba, X), 4)
+
+    output = args.output or MODEL_ARTIFACT_PATH
+    write_artifact(output, model, DropoutPredictor.FEATURE_COLUMNS, winner, results, len(X))
+    if compiled is not None:
+        compiled.save(trees_path(output), probe)
+    elif os.path.exists(trees_path(output)):
+        os.remove(trees_path(output))
+    print(f"Selected {winner['name']}, wrote {output} and {metrics_path(output)}")
+    print(f"Single-row latency: sklearn {winner['sklearn_single_row_ms']} ms, "
+          f"compiled {winner.get('compiled_single_row_ms', 'n/a')} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+SehatMind - Request user context
+Resolves the logged-in user once per request from a small TTL cache of user
+records. Each users row carries an `auth_version` that update/delete bump, and
+the session remembers the version it was issued with, so role changes and
+deleted accounts take effect without a users query on every request.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a cached user record is trusted; bounds staleness across worker processes
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 30))
+USER_CACHE_MAX_ENTRIES = 10000
+
+
+def session_user(record):
+    """The user dict stored in the session and exposed as the request context"""
+    return {
+        'id': record['id'],
+        'username': record['username'],
+        'name': record['name'] or record['username'],
+        'email': record['email'],
+        'role': record['role'],
+        'tenant_id': record['tenant_id'],
+    }
+
+
+class UserCache:
+    """Thread-safe TTL cache of user records keyed by id"""
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, loader):
+        """Return the cached record for `user_id`, calling `loader(user_id)` when missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        record = loader(user_id)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (now, record)
+        return record
+
+    def invalidate(self, user_id=None):
+        """Drop one user's record (after it was updated or deleted), or every record"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)